@@ -600,16 +600,9 @@ class AVS_Clip:
         """ return field parity if field_based, else parity of first field in frame"""
         return avs_get_parity(self, n)
     
-    def get_audio(self, n):
-        src = self.get_frame(n)
-        vi = self.get_video_info()
-        if vi.has_audio():
-            start = vi.audio_samples_from_frames(n)
-            count = vi.audio_samples_from_frames(1)
-            buffer_size = count * vi.sample_type() * vi.audio_channels()
-            buffer = ctypes.create_string_buffer(buffer_size)
-            return avs_get_audio(self, ctypes.addressof(buffer), max(0, start), 
-                                 count) # start and count are in samples
+    def get_audio(self, buf, start, count):
+        # start and count are in samples, buf is an address or a ctypes buffer
+        return avs_get_audio(self, buf, start, count)
     
     def set_cache_hints(self, cachehints, frame_range): 
         return avs_set_cache_hints(self, cachehints, frame_range)
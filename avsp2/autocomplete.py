@@ -0,0 +1,200 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# autocomplete - index of the function names offered by the autocomplete list
+#
+# AutocompleteIndex keeps the names in a trie over their lowercase form, so
+# the names starting with what was typed are found without going through the
+# whole function database.  It's updated with the names that were added,
+# changed or removed since the last time.  FuzzyRank also matches names that
+# contain the typed letters in the same order, e.g. 'mdg' for 'MDegrain2',
+# ranked by how well they match, how recently they were used and whether
+# they're installed.
+#
+# Dependencies:
+#     Python (tested on v2.7)
+
+_NAME = '' # key of the name in a trie node, the other keys are characters
+
+# score of a fuzzy match
+PREFIX_BONUS = 100
+BOUNDARY_BONUS = 10
+ADJACENT_BONUS = 5
+GAP_PENALTY = 1
+RECENT_BONUS = 30 # for the last used name, less for the previous ones
+INSTALLED_BONUS = 15
+
+
+class AutocompleteIndex(object):
+    '''A trie of function names, keyed by their lowercase form'''
+
+    def __init__(self, names=None):
+        self.root = {}
+        self.names = {}
+        if names:
+            self.Update(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, lowername):
+        return lowername in self.names
+
+    def Add(self, lowername, name):
+        node = self.root
+        for char in lowername:
+            node = node.setdefault(char, {})
+        node[_NAME] = name
+        self.names[lowername] = name
+
+    def Remove(self, lowername):
+        if self.names.pop(lowername, None) is None:
+            return
+        path = [self.root]
+        for char in lowername:
+            path.append(path[-1][char])
+        del path[-1][_NAME]
+        # drop the nodes left empty
+        for depth in xrange(len(lowername), 0, -1):
+            if path[depth]:
+                break
+            del path[depth-1][lowername[depth-1]]
+
+    def Update(self, names):
+        '''Make the index hold 'names', a {lowercase name: name} dict
+
+        Only the differences with the current names are applied.
+        '''
+        for lowername in [lowername for lowername in self.names if lowername not in names]:
+            self.Remove(lowername)
+        for lowername, name in names.iteritems():
+            if self.names.get(lowername) != name:
+                self.Add(lowername, name)
+
+    def Names(self):
+        return self.names.values()
+
+    def Complete(self, prefix):
+        '''Return the names starting with 'prefix', sorted'''
+        node = self.root
+        for char in prefix.lower():
+            node = node.get(char)
+            if node is None:
+                return []
+        names = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.iteritems():
+                if char == _NAME:
+                    names.append(child)
+                else:
+                    stack.append(child)
+        names.sort(key=lambda name: name.lower())
+        return names
+
+    def FuzzyMatches(self, query):
+        '''Return the (lowercase name, name) containing the letters of 'query' in order'''
+        query = query.lower()
+        matches = []
+        if not query:
+            return matches
+        stack = [(self.root, 0)]
+        while stack:
+            node, matched = stack.pop()
+            if matched == len(query):
+                # all of the subtree matches
+                nodes = [node]
+                while nodes:
+                    node = nodes.pop()
+                    for char, child in node.iteritems():
+                        if char == _NAME:
+                            matches.append((child.lower(), child))
+                        else:
+                            nodes.append(child)
+                continue
+            for char, child in node.iteritems():
+                if char != _NAME:
+                    stack.append((child, matched + 1 if char == query[matched] else matched))
+        return matches
+
+
+def _IsSubsequence(query, text, pos=0):
+    for char in query:
+        pos = text.find(char, pos) + 1
+        if not pos:
+            return False
+    return True
+
+
+def FuzzyScore(query, lowername, name):
+    '''Score how well 'name' matches the letters of 'query', or None
+
+    The letters are matched from left to right, preferring the start of the
+    words in the name, after an underscore or at a capital.
+    '''
+    starts = [i for i in xrange(len(name)) if i == 0 or name[i-1] == '_' or
+              name[i].isupper() and not name[i-1].isupper()]
+    score = 0
+    pos = 0
+    last = -2
+    for index, char in enumerate(query):
+        found = lowername.find(char, pos)
+        if found == -1:
+            return None
+        for start in starts:
+            if (start >= found and lowername[start] == char and
+                    _IsSubsequence(query[index+1:], lowername, start + 1)):
+                found = start
+                break
+        if found in starts:
+            score += BOUNDARY_BONUS
+        if found == last + 1:
+            score += ADJACENT_BONUS
+        else:
+            score -= GAP_PENALTY * (found - pos)
+        last = found
+        pos = found + 1
+    if lowername.startswith(query):
+        score += PREFIX_BONUS
+    return score - GAP_PENALTY * (len(lowername) - pos) // 4
+
+
+def FuzzyRank(query, indexes, recent=(), installed=()):
+    '''Return the names of the indexes that fuzzy-match 'query', best first
+
+    'recent' is a sequence of lowercase names, the last used one first, and
+    'installed' a set of lowercase names of installed functions.
+    '''
+    query = query.lower()
+    recent_bonus = dict((lowername, RECENT_BONUS * (len(recent) - i) // len(recent))
+                        for i, lowername in enumerate(recent))
+    ranked = {}
+    for index in indexes:
+        for lowername, name in index.FuzzyMatches(query):
+            score = FuzzyScore(query, lowername, name)
+            if score is None:
+                continue
+            score += recent_bonus.get(lowername, 0)
+            if lowername in installed:
+                score += INSTALLED_BONUS
+            ranked[lowername] = max(ranked.get(lowername, (score, name)), (score, name))
+    return [name for lowername, (score, name) in
+            sorted(ranked.iteritems(), key=lambda item: (-item[1][0], item[0]))]
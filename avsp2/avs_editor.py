@@ -45,7 +45,6 @@ import sys
 import cgi                       # What is this module doing here anyways?
 import string
 import textwrap
-import collections
 
 import wx
 from wx import stc
@@ -55,6 +54,10 @@ from icons import ok_icon, smile_icon, question_icon, rectangle_icon
 
 from avsp2.oshelpers import startfile
 from avsp2.filters import AvsFilterDict
+from avsp2.avs_lexer import AvsLexer, LineFingerprints
+from avsp2.avs_parser import ParseScript
+from avsp2.script_tags import ScanScriptTags
+from avsp2.autocomplete import AutocompleteIndex, FuzzyRank
 from avsp2.i18nutils import _
 
 class AvsStyledTextCtrl(stc.StyledTextCtrl):
@@ -114,8 +117,13 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
             self.STC_AVS_DATATYPE: ('datatype', ''),
         }
         self.avsfilterdict = AvsFilterDict(self.app.avsfilterdict)
-        self.avsazdict = collections.defaultdict(list)
+        self.avsazdict = AutocompleteIndex()
         self.styling_refresh_needed = False
+        self.unmodifiedLines = 0 # lines at the end not modified since they were styled
+        self.lineFingerprints = LineFingerprints()
+        self.revision = 0 # counts the changes to the text
+        self.scriptTags = None # (revision, ScriptTags)
+        self.scriptAST = None # (revision, ScriptAST)
         self.SetUserOptions()
         if wx.VERSION > (2, 9):
             self.SetScrollWidth(1)
@@ -192,6 +200,7 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
         # Event handling
         self.Bind(stc.EVT_STC_UPDATEUI, self.OnUpdateUI)
         self.Bind(stc.EVT_STC_CHANGE, self.OnTextChange)
+        self.Bind(stc.EVT_STC_MODIFIED, self.OnModified)
         self.Bind(stc.EVT_STC_CHARADDED, self.OnTextCharAdded)
         self.Bind(stc.EVT_STC_NEEDSHOWN, self.OnNeedShown)
         self.Bind(wx.EVT_KEY_UP, self.OnKeyUp)
@@ -415,7 +424,7 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
             for filename, filtername, filterargs, ftype in filterInfo
             ]
         ))
-        self.avsazdict = self.app.GetAutocompleteDict(self.avsfilterdict.own_dict)
+        self.avsazdict.Update(self.app.GetAutocompleteNames(self.avsfilterdict.own_dict))
         if refresh_highlighting:
             self.Colourise(0, 0)
 
@@ -686,10 +695,14 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
         keywords = []
         wordlower = word.lower()
         avsazdict = self.app.avsazdict_all if all else self.app.avsazdict
-        first_chr = word[0].lower()
-        for keyword in set(avsazdict[first_chr] + self.avsazdict[first_chr]):
-            if keyword.lower().startswith(wordlower):
-                keywords.append(keyword)
+        best = None
+        if self.app.options['autocompletefuzzy']:
+            keywords = FuzzyRank(wordlower, (self.avsazdict, avsazdict),
+                                 self.app.recentautocomplete, self.app.avsinstalledfilters)
+            if keywords:
+                best = keywords[0]
+        else:
+            keywords = list(set(avsazdict.Complete(wordlower) + self.avsazdict.Complete(wordlower)))
         if self.app.options['autocompletevariables']:
             lineCount = self.LineFromPosition(pos)
             line = 0
@@ -731,7 +744,8 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
                     if keyword.lower().startswith(wordlower) and keyword not in keywords:
                         keywords.append(keyword)
                 line += 1
-            keywords.sort(key=lambda s: s.lower())
+        # the list needs to be sorted for Scintilla to find the typed word in it
+        keywords.sort(key=lambda s: s.lower())
         if keywords:
             if auto != 2 or (len(keywords) == 1 and len(keywords[0]) != len(word)):
                 if self.app.options['autocompleteicons']:
@@ -756,7 +770,15 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
                             keywords[i] += '?3'
                 self.autocomplete_case = 'function'
                 self.AutoCompStops(self.AutoCompStops_chars)
-                self.AutoCompShow(len(word), '\n'.join(keywords))
+                if best is None:
+                    self.AutoCompShow(len(word), '\n'.join(keywords))
+                else:
+                    # the word may not be the start of any fuzzy match, select
+                    # the best ranked one instead of hiding the list
+                    self.AutoCompSetAutoHide(0)
+                    self.AutoCompShow(len(word), '\n'.join(keywords))
+                    self.AutoCompSelect(best)
+                    self.AutoCompSetAutoHide(1)
                 if self.CallTipActive():
                     self.CallTipCancelCustom()
             #~ if len(keywords) == 1:
@@ -1139,30 +1161,7 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
         self.calltipOpenpos = None
 
     def GetOpenParenthesesPos(self, pos):
-        boolInside = False
-        nclose = 1
-        stylesToSkip = (self.STC_AVS_STRING, self.STC_AVS_TRIPLE, self.STC_AVS_USERSLIDER)
-        while pos >= 0:
-            c = unichr(self.GetCharAt(pos))
-            if self.GetStyleAt(pos) not in stylesToSkip:
-                if c == ')':
-                    nclose += 1
-                if c == '(':
-                    nclose -= 1
-                if c == '\n':
-                    current = self.GetLine(self.LineFromPosition(pos)).strip()
-                    next = self.GetLine(self.LineFromPosition(pos+1)).strip()
-                    if not current.endswith('\\') and not next.startswith('\\'):
-                        # this is a not a multiline statement
-                        # either an error or we weren't inside a function call to begin with
-                        return None
-            if nclose == 0:
-                if self.GetStyleAt(pos) in self.commentStyle:
-                    return None
-                else:
-                    return pos
-            pos -= 1
-        return None
+        return self.GetScriptAST().OpenParenAt(pos)
 
     def GetFilterMatchedArgs(self, startwordpos, calltip=None):
         if calltip is None:
@@ -1178,8 +1177,8 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
         except IndexError:
             return []
         if firstType == 'clip':
-            preText = self.GetAviSynthLine(startwordpos, preSectionOnly=True)
-            if preText.strip().endswith('.'):
+            call = self.GetScriptAST().CallAt(startwordpos)
+            if call is not None and call.dotted:
                 isClipPrePassed = True
             elif filterScriptArgInfo is not None and filterScriptArgInfo[0][1] == '?':
                 isClipPrePassed = True
@@ -1243,63 +1242,23 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
         return filterArgInfo
 
     def GetFilterScriptArgInfo(self, startwordpos, calltip=None):
-        openpos = self.FindText(startwordpos, self.GetTextLength(), '(')
-        if openpos == -1:
+        call = self.GetScriptAST().CallAt(startwordpos)
+        if call is None or not call.args:
             self.cursorFilterScriptArgIndex = 0
             return None
-        # Grab the text line from the script
-        line = self.LineFromPosition(openpos)
-        posStart = openpos - self.PositionFromLine(line)
-        iArg = 0
-        pos1 = openpos
-        posEnd = None
-        while pos1 < self.GetLength():
-            if unichr(self.GetCharAt(pos1)) == '(':
-                posEnd = self.BraceMatch(pos1)
-                if posEnd == -1:
-                    posEnd = self.GetLineEndPosition(line) #self.GetLength()
-                pos1 += 1
-                break
-            pos1 += 1
-        if posEnd is None:
-            self.cursorFilterScriptArgIndex = 0
-            return None
-        if pos1 == posEnd:
-            self.cursorFilterScriptArgIndex = 0
-            return None #[('','','')]
         currentPos = self.GetCurrentPos()
-        currentIndex = None
-        argsList = []
-        counter = 0
-        pos2 = self.GetNextValidCommaPos(pos1, allowparentheses=False)
-        while pos2 is not None and pos2 <= posEnd:
-            txt = self.GetTextRange(pos1,pos2).strip()
-            argsList.append(txt)
-            if pos2 >= currentPos and currentIndex is None:
-                currentIndex = counter
-            counter += 1
-            pos1 = pos2 + 1
-            pos2 = self.GetNextValidCommaPos(pos1, allowparentheses=False)
-        if currentIndex is None:
-            currentIndex = counter
-        txt = self.GetTextRange(pos1,posEnd).strip()
-        argsList.append(txt)
+        currentIndex = len(call.args) - 1
+        for index, arg in enumerate(call.args[:-1]):
+            if arg.end >= currentPos:
+                currentIndex = index
+                break
         argInfo = []
-        for txt in argsList:
-            try:
-                argname, argvalue = [s.strip() for s in txt.split('=', 1)]
-                argname = argname.strip(string.whitespace+'\\')
-                argvalue = argvalue.strip(string.whitespace+'\\')
+        for arg in call.args:
+            if arg.name:
                 argtype = 'named'
-            except ValueError:
-                argname = u''
-                argvalue = txt
-                argname = argname.strip(string.whitespace+'\\')
-                argvalue = argvalue.strip(string.whitespace+'\\')
-                argtype = self.GetAviSynthVarType(argvalue)
-            #~ argname = argname.strip(string.whitespace+'\\')
-            #~ argvalue = argvalue.strip(string.whitespace+'\\')
-            argInfo.append((argname, argvalue, argtype))
+            else:
+                argtype = self.GetAviSynthVarType(arg.value)
+            argInfo.append((arg.name, arg.value, argtype))
         self.cursorFilterScriptArgIndex = currentIndex
         return argInfo
 
@@ -1468,10 +1427,11 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
             elif name.startswith('is'):
                 return 'bool'
         # If none of the above, it's a variable name
-        if self.AVI is not None:
+        vartype = self.GetScriptAST().VarType(strVar)
+        if vartype is None and self.AVI is not None:
             vartype = self.AVI.GetVarType(strVar)
-            if vartype in ('int', 'float', 'string', 'bool'):
-                return vartype
+        if vartype in ('int', 'float', 'string', 'bool'):
+            return vartype
         return 'var'
 
     def GetNextValidCommaPos(self, pos, checkChar=',', allowparentheses=False):
@@ -1927,6 +1887,7 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
 
     def OnAutocompleteSelection(self, event):
         if self.autocomplete_case == 'function':
+            self.app.AddRecentAutocomplete(event.GetText())
             event.Skip() # processing on EVT_KEY_DOWN, because we need event.GetKeyCode()
         elif self.autocomplete_case == 'parameter name':
             self.BeginUndoAction()
@@ -1982,279 +1943,85 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
         self.UpdateCalltip()
         event.Skip()
 
+    def OnModified(self, event):
+        if event.GetModificationType() & (stc.STC_MOD_INSERTTEXT | stc.STC_MOD_DELETETEXT):
+            self.revision += 1
+            pos = event.GetPosition()
+            line = self.LineFromPosition(pos)
+            lines_added = event.GetLinesAdded()
+            if lines_added > 0:
+                self.lineFingerprints.InsertLines(line + 1, lines_added)
+            elif lines_added < 0:
+                self.lineFingerprints.DeleteLines(line + 1, -lines_added)
+            if event.GetModificationType() & stc.STC_MOD_INSERTTEXT:
+                pos += event.GetLength()
+            self.unmodifiedLines = min(self.unmodifiedLines,
+                self.GetLineCount() - 1 - self.LineFromPosition(pos))
+        event.Skip()
+
+    def Colourise(self, start, end):
+        # the highlighting options or the function names may have changed
+        self.unmodifiedLines = 0
+        stc.StyledTextCtrl.Colourise(self, start, end)
+
+    def GetCodeDigest(self):
+        '''Return a digest of the code of the script, styles included
+
+        Comments and whitespace outside of strings are left out.  Returns None
+        if the line fingerprints are out of step with the text, in which case
+        they're rebuilt.
+        '''
+        if len(self.lineFingerprints) != self.GetLineCount():
+            self.lineFingerprints = LineFingerprints(self.GetLineCount())
+            self.Colourise(0, 0)
+            return None
+        # text deleted at the end leaves it styled but with the last line changed
+        if (self.GetEndStyled() < self.GetLength() or
+                self.unmodifiedLines < self.GetLineCount()):
+            self.OnStyleNeeded(None, forceAll=True)
+        return self.lineFingerprints.Digest()
+
+    def GetScriptTags(self):
+        '''Return the ScriptTags of the text, scanned once per revision'''
+        if self.scriptTags is None or self.scriptTags[0] != self.revision:
+            self.scriptTags = self.revision, ScanScriptTags(self.GetText())
+        return self.scriptTags[1]
+
+    def GetScriptAST(self):
+        '''Return the ScriptAST of the text, parsing only what changed'''
+        if self.scriptAST is None:
+            self.scriptAST = self.revision, ParseScript(self.GetText())
+        elif self.scriptAST[0] != self.revision:
+            self.scriptAST = self.revision, ParseScript(self.GetText(), self.scriptAST[1])
+        return self.scriptAST[1]
+
     def OnStyleNeeded(self, event, forceAll=False):
+        line = self.LineFromPosition(self.GetEndStyled())
         if forceAll:
-            start = -1
-            line = 0
-            isCommentNest = 0
-            end = self.GetLength()
-        else:
-            pos = self.GetEndStyled()
-            line = self.LineFromPosition(pos)
-            start = self.PositionFromLine(line) - 1
-            if self.GetStyleAt(start) == self.STC_AVS_BLOCKCOMMENT:
-                isCommentNest = self.GetLineState(line - 1)
-            else:
-                isCommentNest = 0
-            if self.app.options['wrap']: # workaround
-                end = self.GetLineEndPosition(line + self.LinesOnScreen()) + 1
-            else:
-                end = event.GetPosition()
-        if start < 1:
-            start = 0
-            state = self.STC_AVS_DEFAULT
+            last_line = self.GetLineCount() - 1
+        elif self.app.options['wrap']: # workaround
+            last_line = line + self.LinesOnScreen()
         else:
-            state = self.GetStyleAt(start)
-            if state == self.STC_AVS_STRINGEOL:
-                start += 1
-                state = self.STC_AVS_DEFAULT
-        isLoadPlugin = False
-        flag = None # True -> start, False -> end
-        if line and self.GetFoldLevel(line - 1) & stc.STC_FOLDLEVELHEADERFLAG:
-            prev_flag = True
-        else:
-            prev_flag = None
-        self.endstyled = pos = start
-        fragment = []
-        hexfragment = []
+            last_line = self.LineFromPosition(event.GetPosition())
         # vpy hack, remove when VapourSynth is supported (with a custom Python lexer)
         string_delimiters = ['"', "'"] if self.filename.endswith('.vpy') else '"'
-        self.StartStyling(pos, 31)
-        while pos <= end:
-            ch = unichr(self.GetCharAt(pos))
-            isEOD = (ch == unichr(0))
-            isEOL = (ch == '\n' or ch == '\r' or isEOD)
-            if state == self.STC_AVS_DEFAULT:
-                if ch == '#':
-                    state = self.STC_AVS_COMMENT
-                elif ch == '/' and unichr(self.GetCharAt(pos+1)) == '*':
-                    pos += 1
-                    flag = True
-                    state = self.STC_AVS_BLOCKCOMMENT
-                elif ch in string_delimiters:
-                    self.ColourTo(pos-1, state)
-                    if unichr(self.GetCharAt(pos+1)) in string_delimiters and unichr(self.GetCharAt(pos+2)) in string_delimiters:
-                        pos += 2
-                        if self.app.options['syntaxhighlight_styleinsidetriplequotes']:
-                            self.ColourTo(pos, self.STC_AVS_TRIPLE)
-                        else:
-                            triple_start = pos
-                            state = self.STC_AVS_TRIPLE
-                    else:
-                        state = self.STC_AVS_STRING
-                    if isLoadPlugin:
-                        isLoadPlugin = pos
-                elif ch == '$':
-                    hexfragment = []
-                    state = self.STC_AVS_NUMBERBAD
-                elif ch == '[' and unichr(self.GetCharAt(pos+1)) == '*':
-                    pos += 1
-                    isCommentNest += 1
-                    self.SetLineState(self.LineFromPosition(pos), isCommentNest)
-                    flag = True
-                    state = self.STC_AVS_BLOCKCOMMENT
-                elif ch == '[' and unichr(self.GetCharAt(pos+1)) == '<':
-                    pos += 1
-                    state = self.STC_AVS_USERSLIDER
-                elif ch.isalpha() or ch == '_' or ch in self.app.avssingleletters:
-                    fragment = [ch]
-                    state = self.STC_AVS_IDENTIFIER
-                elif ch.isdigit():
-                    state = self.STC_AVS_NUMBER
-                elif ch in self.app.avsoperators:
-                    self.ColourTo(pos - 1, state)
-                    self.ColourTo(pos, self.STC_AVS_OPERATOR)
-                    if ch == '{':
-                        flag = True
-                    elif ch == '}':
-                        flag = None if flag else False
-                else:
-                    if isEOD:
-                        self.ColourTo(pos - 1, self.STC_AVS_DEFAULT)
-                    else:
-                        self.ColourTo(pos, self.STC_AVS_DEFAULT)
-            elif state == self.STC_AVS_COMMENT:
-                if isEOL:
-                    if isEOD:
-                        self.ColourTo(pos - 1, self.STC_AVS_COMMENT)
-                    else:
-                        self.ColourTo(pos, self.STC_AVS_COMMENT)
-                    state = self.STC_AVS_DEFAULT
-            elif state == self.STC_AVS_BLOCKCOMMENT:
-                if isEOD or pos == end:
-                    self.ColourTo(pos - 1, self.STC_AVS_BLOCKCOMMENT)
-                elif isEOL:
-                    self.SetLineState(self.LineFromPosition(pos), isCommentNest)
-                elif isCommentNest:
-                    if ch == '*' and unichr(self.GetCharAt(pos+1)) == ']':
-                        pos += 1
-                        isCommentNest -= 1
-                        self.SetLineState(self.LineFromPosition(pos), isCommentNest)
-                        flag = None if flag else False
-                        if not isCommentNest:
-                            self.ColourTo(pos, self.STC_AVS_BLOCKCOMMENT)
-                            state = self.STC_AVS_DEFAULT
-                    elif ch == '[' and unichr(self.GetCharAt(pos+1)) == '*':
-                        pos += 1
-                        isCommentNest += 1
-                        self.SetLineState(self.LineFromPosition(pos), isCommentNest)
-                        flag = True
-                elif ch == '*' and unichr(self.GetCharAt(pos+1)) == '/':
-                    pos += 1
-                    self.ColourTo(pos, self.STC_AVS_BLOCKCOMMENT)
-                    flag = None if flag else False
-                    state = self.STC_AVS_DEFAULT
-            elif state == self.STC_AVS_IDENTIFIER:
-                if fragment[0] not in self.app.avssingleletters and (ch.isalnum() or ch == '_'):
-                    fragment.append(ch)
-                else:
-                    pos2 = pos
-                    pos -= 1
-                    word =''.join(fragment).lower()
-                    while unichr(self.GetCharAt(pos2)) in (u' ', u'\t'):
-                        pos2 += 1
-                    ch2 = unichr(self.GetCharAt(pos2))
-                    if word in self.app.avsdatatypes and unichr(self.GetCharAt(pos+1)).isspace():
-                        self.ColourTo(pos, self.STC_AVS_DATATYPE)
-                    elif word in self.app.avskeywords:
-                        self.ColourTo(pos, self.STC_AVS_KEYWORD)
-                    elif word in self.app.avsmiscwords:
-                        self.ColourTo(pos, self.STC_AVS_MISCWORD)
-                        if word == '__end__':
-                            line = self.LineFromPosition(pos)
-                            self.UpdateFolding(line, True, prev_flag)
-                            level = (self.GetFoldLevel(line) & stc.STC_FOLDLEVELNUMBERMASK) + 1
-                            for line in range(line + 1, self.LineFromPosition(end) + 1):
-                                self.SetFoldLevel(line, level)
-                            self.ColourTo(end, self.STC_AVS_ENDCOMMENT)
-                            break
-                    elif ch2 == u'(':
-                        if word in self.avsfilterdict:
-                            #~ self.ColourTo(pos, self.keywordstyles[word])
-                            self.ColourTo(pos, self.avsfilterdict[word][1])
-                            if word == 'loadplugin':
-                                isLoadPlugin = True
-                        else:
-                            self.ColourTo(pos, self.STC_AVS_UNKNOWNFUNCTION)
-                    elif ch2 == u'=' and unichr(self.GetCharAt(pos2 + 1)) != '=':
-                        if self.GetOpenParenthesesPos(pos - len(word)):
-                            self.ColourTo(pos, self.STC_AVS_PARAMETER)
-                        else:
-                            self.ColourTo(pos, self.STC_AVS_ASSIGN)
-                    else:
-                        if self.app.options['syntaxhighlight_preferfunctions'] and \
-                                word in self.avsfilterdict:
-                            #~ self.ColourTo(pos, self.keywordstyles[word])
-                            self.ColourTo(pos, self.avsfilterdict[word][1])
-                        else:
-                            self.ColourTo(pos, self.STC_AVS_DEFAULT)
-                    fragment = []
-                    state = self.STC_AVS_DEFAULT
-            elif state == self.STC_AVS_STRING:
-                if self.app.options['usestringeol']:
-                    if unichr(self.GetCharAt(pos-1)) in string_delimiters and unichr(self.GetCharAt(pos)) in string_delimiters and unichr(self.GetCharAt(pos+1)) in string_delimiters:
-                        state = self.STC_AVS_TRIPLE
-                        pos += 1
-                    elif ch in string_delimiters or isEOL:
-                        if isEOL:
-                            if isEOD:
-                                self.ColourTo(pos - 1, self.STC_AVS_STRINGEOL)
-                            else:
-                                self.ColourTo(pos, self.STC_AVS_STRINGEOL)
-                            isLoadPlugin = False
-                        else:
-                            self.ColourTo(pos, self.STC_AVS_STRING)
-                            if isLoadPlugin:
-                                self.parseDllname(isLoadPlugin, pos)
-                                isLoadPlugin = False
-                        state = self.STC_AVS_DEFAULT
-                else:
-                    if unichr(self.GetCharAt(pos-1)) in string_delimiters and unichr(self.GetCharAt(pos)) in string_delimiters and unichr(self.GetCharAt(pos+1)) in string_delimiters:
-                        state = self.STC_AVS_TRIPLE
-                        pos += 1
-                    elif ch in string_delimiters:
-                        self.ColourTo(pos, self.STC_AVS_STRING)
-                        state = self.STC_AVS_DEFAULT
-                        if isLoadPlugin:
-                            self.parseDllname(isLoadPlugin, pos)
-                            isLoadPlugin = False
-                    elif isEOD:
-                        self.ColourTo(pos - 1, self.STC_AVS_STRING)
-                        state = self.STC_AVS_DEFAULT
-                        isLoadPlugin = False
-            elif state == self.STC_AVS_TRIPLE:
-                # AviSynth interprets """"""" as '"' etc.
-                triple_quote_quirk = False
-                if ch == '"' and pos - triple_start == 1:
-                    last_quote_pos = pos
-                    while unichr(self.GetCharAt(last_quote_pos)) == '"':
-                        last_quote_pos += 1
-                    quote_number = last_quote_pos - pos
-                    if quote_number > 3:
-                        pos += quote_number - 1 - 1
-                        triple_quote_quirk = True
-                if not triple_quote_quirk:
-                    if isEOD or ((pos - triple_start > 2) and ch in string_delimiters and unichr(self.GetCharAt(pos-1)) in string_delimiters and unichr(self.GetCharAt(pos-2)) in string_delimiters):
-                        self.ColourTo(pos, self.STC_AVS_TRIPLE)
-                        state = self.STC_AVS_DEFAULT
-                        if isLoadPlugin:
-                            if not isEOD:
-                                self.parseDllname(isLoadPlugin, pos)
-                            isLoadPlugin = False
-                    elif isEOL:
-                        self.ColourTo(pos, self.STC_AVS_TRIPLE)
-            elif state == self.STC_AVS_NUMBER:
-                if not ch.isdigit():
-                    pos -= 1
-                    self.ColourTo(pos, self.STC_AVS_NUMBER)
-                    state = self.STC_AVS_DEFAULT
-            elif state == self.STC_AVS_NUMBERBAD:
-                if ch.isalnum() or ch == '_':
-                    hexfragment.append(ch)
-                else:
-                    pos -= 1
-                    #~ if len(hexfragment) == 6 and sum([c.isdigit() or c.lower() in ('a', 'b', 'c', 'd', 'e', 'f') for c in hexfragment]) == 6:
-                        #~ self.ColourTo(pos, self.STC_AVS_NUMBER)
-                    #~ else:
-                        #~ self.ColourTo(pos, self.STC_AVS_NUMBERBAD)
-                    try:
-                        int(''.join(hexfragment), 16)
-                        self.ColourTo(pos, self.STC_AVS_NUMBER)
-                    except:
-                        self.ColourTo(pos, self.STC_AVS_NUMBERBAD)
-                    hexfragment = []
-                    state = self.STC_AVS_DEFAULT
-            elif state == self.STC_AVS_USERSLIDER:
-                if isEOL or (ch == ']' and unichr(self.GetCharAt(pos-1)) == '>'):
-                    if isEOL:
-                        self.ColourTo(pos, self.STC_AVS_NUMBERBAD)
-                    else:
-                        self.ColourTo(pos, self.STC_AVS_USERSLIDER)
-                    state = self.STC_AVS_DEFAULT
-            elif state == self.STC_AVS_ENDCOMMENT:
-                line = self.LineFromPosition(pos)
-                if self.GetStyleAt(self.PositionFromLine(line)) != self.STC_AVS_ENDCOMMENT:
-                    line += 1
-                level = (self.GetFoldLevel(line) & stc.STC_FOLDLEVELNUMBERMASK)
-                for line in range(line, self.LineFromPosition(end) + 1):
-                    self.SetFoldLevel(line, level)
-                self.ColourTo(end, self.STC_AVS_ENDCOMMENT)
-                break
-            ch = unichr(self.GetCharAt(pos))
-            if pos != start and (ch == unichr(0) or ch == '\n' or ch == '\r'):
-                self.UpdateFolding(self.LineFromPosition(pos), flag, prev_flag)
-                prev_flag = flag
-                flag = None
-            pos += 1
+        lexer = AvsLexer(self.avsfilterdict, self.app.avskeywords, self.app.avsdatatypes,
+            self.app.avsmiscwords, self.app.avsoperators, self.app.avssingleletters,
+            string_delimiters, self.app.options['usestringeol'],
+            self.app.options['syntaxhighlight_styleinsidetriplequotes'],
+            self.app.options['syntaxhighlight_preferfunctions'])
+        plugins = lexer.StyleLines(self, line, last_line,
+                                   self.GetLineCount() - 1 - self.unmodifiedLines,
+                                   self.lineFingerprints)
+        if self.GetEndStyled() == self.GetLength():
+            self.unmodifiedLines = self.GetLineCount()
+        for path in plugins:
+            self.parseDllname(path)
         if wx.VERSION > (2, 9):
             self.app.IdleCall.append((self.Refresh, tuple(), dict()))
 
-    def ColourTo(self, pos, style):
-        self.SetStyling(pos +1 - self.endstyled, style)
-        self.endstyled = pos+1
-
-    def parseDllname(self, start, end):
-        path = self.GetTextRange(start, end).lower().strip('"')
+    def parseDllname(self, path):
+        path = path.lower().strip('"')
         #~ print path
         ext = os.path.splitext(path)[1]
         if ext in ('.dll', '.so'):
@@ -2263,21 +2030,6 @@ class AvsStyledTextCtrl(stc.StyledTextCtrl):
                 self.app.dllnameunderscored.add(dllname)
                 self.app.defineScriptFilterInfo()
 
-    def UpdateFolding(self, line, flag, prev_flag):
-        if line == 0:
-            level = stc.STC_FOLDLEVELBASE
-        else:
-            level = self.GetFoldLevel(line - 1) & stc.STC_FOLDLEVELNUMBERMASK
-            if prev_flag:
-                level += 1
-        if flag == True:
-            level |= stc.STC_FOLDLEVELHEADERFLAG
-        elif flag == False:
-            level = max(stc.STC_FOLDLEVELBASE, level - 1)
-        elif not self.GetLine(line).strip():
-            level |=  stc.STC_FOLDLEVELWHITEFLAG
-        self.SetFoldLevel(line, level)
-
     def OnMarginClick(self, evt):
         # fold and unfold as needed
         if evt.GetMargin() == 2:
@@ -0,0 +1,441 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# avs_lexer - syntax highlighting of AviSynth scripts, a line at a time
+#
+# AvsLexer tokenizes each line with compiled patterns, starting from the state
+# the previous line ended in, which is kept in the line state of the
+# StyledTextCtrl.  StyleLines restyles a range of lines, and stops at the first
+# line past the modified ones that ends in the same state and fold level as
+# before, since the lines after it can't have changed.  It also keeps the
+# LineFingerprints of the lines it styles, digests of their code that tell if
+# the script changed without going through all its text.  wxPython isn't
+# needed, so any object with the StyledTextCtrl methods used here can be styled.
+#
+# Dependencies:
+#     Python (tested on v2.7)
+
+import hashlib
+import re
+
+# the style numbers of AvsStyledTextCtrl
+(
+    STC_AVS_DEFAULT, STC_AVS_COMMENT, STC_AVS_ENDCOMMENT,
+    STC_AVS_BLOCKCOMMENT, STC_AVS_NUMBER, STC_AVS_NUMBERBAD,
+    STC_AVS_OPERATOR, STC_AVS_STRING, STC_AVS_STRINGEOL,
+    STC_AVS_TRIPLE, STC_AVS_COREFILTER, STC_AVS_PLUGIN,
+    STC_AVS_CLIPPROPERTY, STC_AVS_USERFUNCTION, STC_AVS_UNKNOWNFUNCTION,
+    STC_AVS_USERSLIDER, STC_AVS_SCRIPTFUNCTION, STC_AVS_PARAMETER,
+    STC_AVS_ASSIGN, STC_AVS_KEYWORD, STC_AVS_MISCWORD,
+    STC_AVS_DATATYPE, STC_AVS_IDENTIFIER
+) = range(23)
+
+# the same values as wx.stc.STC_FOLDLEVEL*
+FOLDLEVELBASE = 0x400
+FOLDLEVELWHITEFLAG = 0x1000
+FOLDLEVELHEADERFLAG = 0x2000
+FOLDLEVELNUMBERMASK = 0x0FFF
+
+# Line states, packed in an int:
+#   bits 0-2   the mode the line ends in
+#   bit 3      the line ends with a backslash
+#   bit 4      a LoadPlugin call is waiting for its string argument
+#   bits 5-12  the nesting level of [* *] comments
+#   bits 13-20 the number of open parentheses
+(
+    MODE_DEFAULT, MODE_BLOCKCOMMENT, MODE_STRING, MODE_TRIPLE, MODE_ENDCOMMENT
+) = range(5)
+
+_SPACES = re.compile(r'[ \t]*')
+_NESTED_COMMENT = re.compile(r'\[\*|\*\]')
+_QUOTES = re.compile(r'"*')
+_COMMENT_STYLES = (STC_AVS_COMMENT, STC_AVS_BLOCKCOMMENT, STC_AVS_ENDCOMMENT)
+
+
+def PackState(mode, continued=False, loadplugin=False, nest=0, depth=0):
+    return (mode | continued << 3 | loadplugin << 4 | min(nest, 0xFF) << 5 |
+            min(depth, 0xFF) << 13)
+
+
+def UnpackState(state):
+    '''Return (mode, continued, loadplugin, nest, depth)'''
+    return (state & 7, bool(state & 8), bool(state & 16), state >> 5 & 0xFF,
+            state >> 13 & 0xFF)
+
+
+def LineFingerprint(text, runs):
+    '''Return the MD5 digest of the code in a line styled with 'runs', or 0 if none
+
+    Comments and whitespace outside of strings are left out, so editing them
+    doesn't change the fingerprint.
+    '''
+    code = []
+    start = 0
+    for end, style in runs:
+        if style not in _COMMENT_STYLES:
+            chars = text[start:end]
+            if style == STC_AVS_DEFAULT:
+                chars = chars.replace(' ', '').replace('\t', '').replace('\n', '')
+            if chars:
+                if code and code[-1][1] == style:
+                    code[-1] = code[-1][0] + chars, style
+                else:
+                    code.append((chars, style))
+        start = end
+    if not code:
+        return 0
+    md5 = hashlib.md5()
+    for chars, style in code:
+        if isinstance(chars, unicode):
+            chars = chars.encode('utf-8')
+        md5.update('{0}:{1}:'.format(len(chars), style))
+        md5.update(chars)
+    return md5.digest()
+
+
+class LineFingerprints(object):
+    '''The fingerprints of the lines of a script, see LineFingerprint
+
+    The table is kept in step with the text by calling InsertLines and
+    DeleteLines on modifications, and updated when lines are styled.
+    Digest() returns a digest of the code of the whole script, which only
+    needs to be computed again if a fingerprint changed.
+    '''
+
+    def __init__(self, lines=1):
+        self.lines = [0] * lines
+        self._digest = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __setitem__(self, line, fingerprint):
+        if self.lines[line] != fingerprint:
+            self.lines[line] = fingerprint
+            self._digest = None
+
+    def InsertLines(self, line, count):
+        '''Add 'count' lines before 'line', to be fingerprinted when styled'''
+        self.lines[line:line] = [0] * count
+        self._digest = None
+
+    def DeleteLines(self, line, count):
+        del self.lines[line:line+count]
+        self._digest = None
+
+    def Digest(self):
+        '''Return the MD5 digest of the fingerprints of the lines with code'''
+        if self._digest is None:
+            self._digest = hashlib.md5(''.join(filter(None, self.lines))).digest()
+        return self._digest
+
+
+class AvsLexer(object):
+    '''Tokenize AviSynth script lines for AvsStyledTextCtrl
+
+    'filterdict' maps lowercase function names to tuples with the style in
+    the second item, as AvsStyledTextCtrl.avsfilterdict.  The other word
+    lists are the ones of the application, and the options the values of
+    'usestringeol', 'syntaxhighlight_styleinsidetriplequotes' and
+    'syntaxhighlight_preferfunctions'.
+    '''
+
+    def __init__(self, filterdict, keywords, datatypes, miscwords, operators,
+                 singleletters, string_delimiters='"', stringeol=True,
+                 styleinsidetriplequotes=False, preferfunctions=False):
+        self.filterdict = filterdict
+        self.keywords = set(keywords)
+        self.datatypes = set(datatypes)
+        self.miscwords = set(miscwords)
+        self.operators = set(operators)
+        self.stringeol = stringeol
+        self.styleinsidetriplequotes = styleinsidetriplequotes
+        self.preferfunctions = preferfunctions
+        delimiter = u'[{0}]'.format(u''.join(re.escape(c) for c in string_delimiters))
+        single = u''.join(re.escape(c) for c in singleletters)
+        self._token = re.compile(ur'''
+            (?P<space>\s+)
+            |(?P<comment>\#[^\n]*\n?)
+            |(?P<block>/\*)
+            |(?P<nest>\[\*)
+            |(?P<slider>\[<)
+            |(?P<triple>{0}{{3}})
+            |(?P<string>{0})
+            |(?P<hex>\$\w*)
+            |(?P<word>[^\W\d]\w*{1})
+            |(?P<number>\d+)
+            |(?P<other>.)
+            '''.format(delimiter, u'|[{0}]'.format(single) if single else u''),
+            re.U | re.S | re.X).match
+        self._delimiter = re.compile(delimiter).search
+        self._triple = re.compile(delimiter + u'{3}').search
+
+    def Lex(self, text, state=0):
+        '''Style a line, which ends with '\\n' unless it's the last one
+
+        Returns (runs, state, fold_flag, plugins).  'runs' is a list of (end,
+        style) tuples covering the line, 'state' the one to lex the next line
+        with, 'fold_flag' True if a fold starts in the line, False if one ends
+        and None otherwise, and 'plugins' a list of the LoadPlugin strings,
+        quotes included.
+        '''
+        mode, continued, loadplugin, nest, depth = UnpackState(state)
+        if (mode != MODE_STRING and mode != MODE_TRIPLE and not continued and
+                not text.lstrip().startswith('\\')):
+            depth = 0
+        runs = []
+        flag = None
+        plugins = []
+        string_start = triple_start = None
+        pos = 0
+        end = len(text)
+
+        def Emit(end, style):
+            if runs and runs[-1][1] == style:
+                runs[-1] = end, style
+            else:
+                runs.append((end, style))
+
+        while pos < end:
+            if mode == MODE_DEFAULT:
+                match = self._token(text, pos)
+                kind = match.lastgroup
+                token_end = match.end()
+                if kind == 'space':
+                    Emit(token_end, STC_AVS_DEFAULT)
+                elif kind == 'comment':
+                    Emit(token_end, STC_AVS_COMMENT)
+                elif kind == 'block' or kind == 'nest':
+                    if kind == 'nest':
+                        nest += 1
+                    flag = True
+                    mode = MODE_BLOCKCOMMENT
+                    Emit(token_end, STC_AVS_BLOCKCOMMENT)
+                elif kind == 'slider':
+                    close = text.find('>]', token_end)
+                    if close == -1:
+                        token_end = end
+                        Emit(end, STC_AVS_NUMBERBAD)
+                    else:
+                        token_end = close + 2
+                        Emit(token_end, STC_AVS_USERSLIDER)
+                elif kind == 'triple' or kind == 'string':
+                    if loadplugin:
+                        string_start = token_end - 1 if kind == 'triple' else pos
+                    # the opening quotes are styled with the rest of the string
+                    if kind == 'string':
+                        mode = MODE_STRING
+                    elif self.styleinsidetriplequotes:
+                        Emit(token_end, STC_AVS_TRIPLE)
+                    else:
+                        triple_start = token_end - 1
+                        mode = MODE_TRIPLE
+                elif kind == 'hex':
+                    try:
+                        int(text[pos+1:token_end], 16)
+                        Emit(token_end, STC_AVS_NUMBER)
+                    except ValueError:
+                        Emit(token_end, STC_AVS_NUMBERBAD)
+                elif kind == 'word':
+                    word = match.group().lower()
+                    if word in self.datatypes and text[token_end:token_end+1].isspace():
+                        style = STC_AVS_DATATYPE
+                    elif word in self.keywords:
+                        style = STC_AVS_KEYWORD
+                    elif word in self.miscwords:
+                        style = STC_AVS_MISCWORD
+                        if word == '__end__':
+                            Emit(token_end, style)
+                            if token_end < end:
+                                Emit(end, STC_AVS_ENDCOMMENT)
+                            return runs, PackState(MODE_ENDCOMMENT), True, plugins
+                    else:
+                        next_pos = _SPACES.match(text, token_end).end()
+                        next_char = text[next_pos:next_pos+1]
+                        info = self.filterdict.get(word)
+                        if next_char == '(':
+                            if info is not None:
+                                style = info[1]
+                                if word == 'loadplugin':
+                                    loadplugin = True
+                            else:
+                                style = STC_AVS_UNKNOWNFUNCTION
+                        elif next_char == '=' and text[next_pos+1:next_pos+2] != '=':
+                            style = STC_AVS_PARAMETER if depth else STC_AVS_ASSIGN
+                        elif self.preferfunctions and info is not None:
+                            style = info[1]
+                        else:
+                            style = STC_AVS_DEFAULT
+                    Emit(token_end, style)
+                elif kind == 'number':
+                    Emit(token_end, STC_AVS_NUMBER)
+                else:
+                    char = match.group()
+                    if char in self.operators:
+                        if char == '(':
+                            depth += 1
+                        elif char == ')':
+                            depth = max(0, depth - 1)
+                        elif char == '{':
+                            flag = True
+                        elif char == '}':
+                            flag = None if flag else False
+                        Emit(token_end, STC_AVS_OPERATOR)
+                    else:
+                        Emit(token_end, STC_AVS_DEFAULT)
+                pos = token_end
+            elif mode == MODE_BLOCKCOMMENT:
+                if nest:
+                    match = _NESTED_COMMENT.search(text, pos)
+                    if match is None:
+                        pos = end
+                    else:
+                        pos = match.end()
+                        if match.group() == '[*':
+                            nest += 1
+                            flag = True
+                        else:
+                            nest -= 1
+                            flag = None if flag else False
+                            if not nest:
+                                mode = MODE_DEFAULT
+                else:
+                    close = text.find('*/', pos)
+                    if close == -1:
+                        pos = end
+                    else:
+                        pos = close + 2
+                        flag = None if flag else False
+                        mode = MODE_DEFAULT
+                Emit(pos, STC_AVS_BLOCKCOMMENT)
+            elif mode == MODE_STRING:
+                match = self._delimiter(text, pos)
+                if match is None:
+                    pos = end
+                    if self.stringeol:
+                        loadplugin = False
+                        mode = MODE_DEFAULT
+                        Emit(end, STC_AVS_STRINGEOL)
+                    else:
+                        Emit(end, STC_AVS_STRING)
+                else:
+                    pos = match.end()
+                    mode = MODE_DEFAULT
+                    Emit(pos, STC_AVS_STRING)
+                    if loadplugin:
+                        if string_start is not None:
+                            plugins.append(text[string_start:pos-1])
+                        loadplugin = False
+            elif mode == MODE_TRIPLE:
+                # AviSynth interprets """"""" as '"' etc.
+                close = None
+                if triple_start is not None:
+                    quotes = _QUOTES.match(text, pos).end() - pos
+                    if quotes > 3:
+                        close = pos + quotes
+                if close is None:
+                    match = self._triple(text, pos)
+                    if match is not None:
+                        close = match.end()
+                if close is None:
+                    pos = end
+                else:
+                    pos = close
+                    mode = MODE_DEFAULT
+                    triple_start = None
+                    if loadplugin:
+                        if string_start is not None:
+                            plugins.append(text[string_start:pos-1])
+                        loadplugin = False
+                Emit(pos, STC_AVS_TRIPLE)
+            else:
+                pos = end
+                Emit(end, STC_AVS_ENDCOMMENT)
+        if end > (runs[-1][0] if runs else 0):
+            # the text ends with opening quotes
+            if mode == MODE_TRIPLE:
+                Emit(end, STC_AVS_TRIPLE)
+            elif self.stringeol:
+                loadplugin = False
+                mode = MODE_DEFAULT
+                Emit(end, STC_AVS_STRINGEOL)
+            else:
+                Emit(end, STC_AVS_STRING)
+        continued = text.strip().endswith('\\')
+        return runs, PackState(mode, continued, loadplugin, nest, depth), flag, plugins
+
+    def StyleLines(self, ctrl, line, last_line, modified_line=None, fingerprints=None):
+        '''Style lines of a StyledTextCtrl, from 'line' to 'last_line'
+
+        Lines after 'modified_line', which haven't changed since they were
+        styled, stop the styling as soon as one of them ends in the same state
+        and fold level as before, and the control is marked as styled up to
+        the end.  The fingerprints of the lines styled are updated in the
+        LineFingerprints 'fingerprints', if given.  Returns the LoadPlugin
+        strings found.
+        '''
+        last_line = min(last_line, ctrl.GetLineCount() - 1)
+        if modified_line is None:
+            modified_line = last_line
+        if line:
+            state = ctrl.GetLineState(line - 1)
+            prev_level = ctrl.GetFoldLevel(line - 1)
+        else:
+            state = 0
+            prev_level = None
+        plugins = []
+        ctrl.StartStyling(ctrl.PositionFromLine(line), 31)
+        while line <= last_line:
+            text = ctrl.GetLine(line)
+            runs, new_state, flag, line_plugins = self.Lex(text, state)
+            start = 0
+            ascii = len(text.encode('utf-8')) == len(text)
+            for end, style in runs:
+                ctrl.SetStyling(end - start if ascii else
+                                len(text[start:end].encode('utf-8')), style)
+                start = end
+            plugins.extend(line_plugins)
+            if fingerprints is not None:
+                fingerprints[line] = LineFingerprint(text, runs)
+            if prev_level is None:
+                level = FOLDLEVELBASE
+            else:
+                level = prev_level & FOLDLEVELNUMBERMASK
+                if prev_level & FOLDLEVELHEADERFLAG:
+                    level += 1
+            if flag:
+                level |= FOLDLEVELHEADERFLAG
+            elif flag is False:
+                level = max(FOLDLEVELBASE, level - 1)
+            elif state & 7 != MODE_ENDCOMMENT and not text.strip():
+                level |= FOLDLEVELWHITEFLAG
+            unchanged = new_state == ctrl.GetLineState(line)
+            if level != ctrl.GetFoldLevel(line):
+                ctrl.SetFoldLevel(line, level)
+                unchanged = False
+            if not unchanged:
+                ctrl.SetLineState(line, new_state)
+            elif line > modified_line:
+                ctrl.StartStyling(ctrl.GetLength(), 31)
+                break
+            state = new_state
+            prev_level = level
+            line += 1
+        return plugins
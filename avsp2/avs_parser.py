@@ -0,0 +1,523 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# avs_parser - syntax tree of AviSynth scripts, for calltips and auto-sliders
+#
+# ParseScript splits a script in statements, a line each plus the lines joined
+# to it with backslashes, and parses each one on its own into its function
+# calls with their arguments, assignments and function definitions.  Given the
+# ScriptAST of the previous version of the text, only the statements of the
+# region that changed are parsed again, the others are reused.  Positions are
+# byte offsets in the UTF-8 text, like the ones of the StyledTextCtrl, and
+# relative to the start of the statement in the nodes kept in a Statement.
+# ScriptAST returns nodes with absolute positions.
+#
+# Dependencies:
+#     Python (tested on v2.7)
+
+import re
+import bisect
+
+_TOKEN = re.compile(r'''
+    (?P<space>[ \t\r\f\v]+)
+  | (?P<newline>\n)
+  | (?P<comment>\#[^\n]*)
+  | (?P<block>/\*.*?(?:\*/|\Z))
+  | (?P<nest>\[\*)
+  | (?P<slider>\[<[^\n]*?>\])
+  | (?P<triple>""".*?(?:"{3,}|\Z))
+  | (?P<string>"[^"\n]*"?)
+  | (?P<hex>\$\w*)
+  | (?P<number>\d+\.?\d*|\.\d+)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>==|!=|<>|<=|>=|&&|\|\||\+\+|.)
+''', re.S | re.X).match
+_NESTED_COMMENT = re.compile(r'\[\*|\*\]')
+_CONTINUED = re.compile(r'[ \t]*\\').match
+_SKIPPED = ('space', 'comment', 'block', 'nest')
+
+# names followed by parentheses that aren't function calls
+NOT_CALLS = set(('function', 'return', 'global', 'if', 'else', 'while', 'for',
+                 'try', 'catch', 'true', 'false', 'yes', 'no'))
+LITERALS = {'number': 'int', 'hex': 'int', 'string': 'string', 'triple': 'string'}
+
+
+def _Decode(text):
+    return text.decode('utf-8', 'replace')
+
+
+class Arg(object):
+    '''An argument of a Call
+
+    'name' is empty for positional arguments.  'start' and 'end' delimit
+    the argument between the commas or parentheses, 'valueStart' and
+    'valueEnd' its value, without the name, spaces and backslashes.  'kind'
+    is the type of a literal value ('int', 'float', 'string' or 'bool'), or
+    None for expressions.
+    '''
+
+    __slots__ = ('name', 'value', 'start', 'end', 'valueStart', 'valueEnd', 'kind')
+
+    def __init__(self, name, value, start, end, valueStart, valueEnd, kind):
+        self.name = name
+        self.value = value
+        self.start = start
+        self.end = end
+        self.valueStart = valueStart
+        self.valueEnd = valueEnd
+        self.kind = kind
+
+    def Moved(self, offset):
+        return Arg(self.name, self.value, self.start + offset, self.end + offset,
+                   self.valueStart + offset, self.valueEnd + offset, self.kind)
+
+
+class Call(object):
+    '''A function call with parentheses, 'name(args)' or 'clip.name(args)'
+
+    'start' and 'end' delimit the name, 'openpos' and 'closepos' are the
+    positions of the parentheses, 'closepos' is None if they aren't closed
+    in the statement.  'dotted' tells if the clip is passed with a dot.
+    '''
+
+    __slots__ = ('name', 'start', 'end', 'openpos', 'closepos', 'args', 'dotted')
+
+    def __init__(self, name, start, end, openpos, closepos=None, args=None, dotted=False):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.openpos = openpos
+        self.closepos = closepos
+        self.args = [] if args is None else args
+        self.dotted = dotted
+
+    def Moved(self, offset):
+        return Call(self.name, self.start + offset, self.end + offset,
+                    self.openpos + offset,
+                    None if self.closepos is None else self.closepos + offset,
+                    [arg.Moved(offset) for arg in self.args], self.dotted)
+
+
+class Assignment(object):
+    ''''name = value', 'kind' as in Arg'''
+
+    __slots__ = ('name', 'start', 'valueStart', 'valueEnd', 'kind', 'isGlobal')
+
+    def __init__(self, name, start, valueStart, valueEnd, kind, isGlobal=False):
+        self.name = name
+        self.start = start
+        self.valueStart = valueStart
+        self.valueEnd = valueEnd
+        self.kind = kind
+        self.isGlobal = isGlobal
+
+    def Moved(self, offset):
+        return Assignment(self.name, self.start + offset, self.valueStart + offset,
+                          self.valueEnd + offset, self.kind, self.isGlobal)
+
+
+class FunctionDef(object):
+    '''A user function definition, 'function name(params) { body }'
+
+    'openpos' and 'closepos' are the positions of the parentheses of the
+    parameters, 'bodyStart' of the opening brace and 'bodyEnd' of the closing
+    one.  Any of them may be None if it's missing.  'bodyEnd' is only set in
+    the nodes returned by ScriptAST.Functions, since the body may span
+    several statements.
+    '''
+
+    __slots__ = ('name', 'start', 'openpos', 'closepos', 'params', 'bodyStart', 'bodyEnd')
+
+    def __init__(self, name, start, openpos=None, closepos=None, params=u'',
+                 bodyStart=None, bodyEnd=None):
+        self.name = name
+        self.start = start
+        self.openpos = openpos
+        self.closepos = closepos
+        self.params = params
+        self.bodyStart = bodyStart
+        self.bodyEnd = bodyEnd
+
+    def Moved(self, offset):
+        def Move(pos):
+            return None if pos is None else pos + offset
+        return FunctionDef(self.name, self.start + offset, Move(self.openpos),
+                           Move(self.closepos), self.params, Move(self.bodyStart),
+                           Move(self.bodyEnd))
+
+
+class Statement(object):
+    '''The nodes of a statement, with positions relative to its start
+
+    'length' includes the newline that ends it.  'parens' is a list of
+    (open, close) of all the parentheses, 'close' None if unclosed, and
+    'braces' a list of (position, brace).  'end' tells if the statement
+    contains __END__, after which the script isn't parsed.
+    '''
+
+    __slots__ = ('length', 'calls', 'parens', 'assignments', 'functions', 'braces', 'end')
+
+    def __init__(self, length, calls, parens, assignments, functions, braces, end=False):
+        self.length = length
+        self.calls = calls
+        self.parens = parens
+        self.assignments = assignments
+        self.functions = functions
+        self.braces = braces
+        self.end = end
+
+
+def _Tokenize(text, pos):
+    '''Return (tokens, end, script_end) for the statement starting at 'pos'
+
+    The tokens are (kind, start, end) tuples, without spaces, comments and
+    the backslashes that join lines.
+    '''
+    tokens = []
+    length = len(text)
+    continued = False
+    while pos < length:
+        match = _TOKEN(text, pos)
+        kind = match.lastgroup
+        end = match.end()
+        if kind == 'nest':
+            nest = 1
+            while nest:
+                match = _NESTED_COMMENT.search(text, end)
+                if match is None:
+                    end = length
+                    break
+                end = match.end()
+                nest += 1 if match.group() == '[*' else -1
+        elif kind == 'newline':
+            if continued or _CONTINUED(text, end):
+                continued = False
+                pos = end
+                continue
+            return tokens, end, False
+        elif kind == 'name' and text[pos:end].lower() == '__end__':
+            return tokens, length, True
+        elif kind == 'op' and text[pos] == '\\':
+            continued = True
+            pos = end
+            continue
+        if kind not in _SKIPPED:
+            tokens.append((kind, pos, end))
+            continued = False
+        pos = end
+    return tokens, length, False
+
+
+def _Kind(text, tokens):
+    '''Return the type of a literal value, or None'''
+    if len(tokens) == 2 and tokens[0][0] == 'op' and text[tokens[0][1]] in '+-':
+        tokens = tokens[1:]
+    if len(tokens) != 1:
+        return
+    kind, start, end = tokens[0]
+    if kind == 'number':
+        return 'float' if '.' in text[start:end] else 'int'
+    if kind == 'name':
+        if text[start:end].lower() in ('true', 'false', 'yes', 'no'):
+            return 'bool'
+        return
+    return LITERALS.get(kind)
+
+
+def _Value(text, tokens, pos):
+    '''Return (value, valueStart, valueEnd, kind) of a list of tokens
+
+    'pos' is the position of an empty value.
+    '''
+    if not tokens:
+        return u'', pos, pos, None
+    valueStart = tokens[0][1]
+    valueEnd = tokens[-1][2]
+    return _Decode(text[valueStart:valueEnd]), valueStart, valueEnd, _Kind(text, tokens)
+
+
+def ParseStatement(text, pos=0):
+    '''Parse the statement of 'text' starting at 'pos' into a Statement'''
+    tokens, length, end = _Tokenize(text, pos)
+    calls = []
+    parens = []
+    assignments = []
+    functions = []
+    braces = []
+    stack = [] # [index in parens, Call or None, index of the first token of the arg]
+    statement_start = 0 # index of the first token after a brace or 'global'
+    isGlobal = False
+
+    def CloseArg(group, index, close, last=False):
+        call = group[1]
+        if call is None:
+            return
+        arg_tokens = tokens[group[2]:index]
+        if last and not arg_tokens and not call.args:
+            return # 'name()'
+        if (len(arg_tokens) > 1 and arg_tokens[0][0] == 'name' and
+                arg_tokens[1][0] == 'op' and text[arg_tokens[1][1]:arg_tokens[1][2]] == '='):
+            name = text[arg_tokens[0][1]:arg_tokens[0][2]]
+            value_tokens = arg_tokens[2:]
+        else:
+            name = ''
+            value_tokens = arg_tokens
+        start = call.args[-1].end + 1 if call.args else call.openpos + 1
+        value, valueStart, valueEnd, kind = _Value(text, value_tokens, close)
+        call.args.append(Arg(name, value, start, close, valueStart, valueEnd, kind))
+
+    for index, (kind, start, stop) in enumerate(tokens):
+        if kind == 'op':
+            char = text[start:stop]
+            if char == '(':
+                call = None
+                if index and tokens[index-1][0] == 'name':
+                    name_start, name_end = tokens[index-1][1:]
+                    name = text[name_start:name_end]
+                    before = tokens[index-2] if index > 1 else None
+                    if before is not None and text[before[1]:before[2]].lower() == 'function':
+                        functions.append(FunctionDef(name, before[1], start))
+                    elif name.lower() not in NOT_CALLS:
+                        dotted = before is not None and text[before[1]:before[2]] == '.'
+                        call = Call(name, name_start, name_end, start, dotted=dotted)
+                        calls.append(call)
+                stack.append([len(parens), call, index + 1])
+                parens.append((start, None))
+            elif char == ')' and stack:
+                group = stack.pop()
+                CloseArg(group, index, start, last=True)
+                parens[group[0]] = parens[group[0]][0], start
+                if group[1] is not None:
+                    group[1].closepos = start
+                for function in functions:
+                    if function.openpos == parens[group[0]][0]:
+                        function.closepos = start
+                        function.params = _Decode(text[function.openpos+1:start].strip())
+            elif char == ',' and stack:
+                CloseArg(stack[-1], index, start)
+                stack[-1][2] = index + 1
+            elif char in '{}':
+                braces.append((start, char))
+                if char == '{':
+                    for function in functions:
+                        if function.bodyStart is None and function.closepos is not None:
+                            function.bodyStart = start
+                if not stack:
+                    statement_start = index + 1
+                    isGlobal = False
+            elif char == '=' and not stack and index == statement_start + 1 and \
+                    tokens[index-1][0] == 'name':
+                name_start, name_end = tokens[index-1][1:]
+                value_tokens = []
+                for token in tokens[index+1:]:
+                    if token[0] == 'op' and text[token[1]] in '{}':
+                        break
+                    value_tokens.append(token)
+                value, valueStart, valueEnd, value_kind = _Value(text, value_tokens, stop)
+                assignments.append(Assignment(text[name_start:name_end], name_start,
+                                              valueStart, valueEnd, value_kind, isGlobal))
+        elif kind == 'name' and index == statement_start and not stack and \
+                text[start:stop].lower() == 'global':
+            statement_start = index + 1
+            isGlobal = True
+    # unclosed parentheses end with the statement
+    while stack:
+        group = stack.pop()
+        CloseArg(group, len(tokens), length - 1 if text[length-1] == '\n' else length,
+                 last=True)
+    offset = -pos
+    return Statement(length - pos, [call.Moved(offset) for call in calls],
+                     [(open + offset, None if close is None else close + offset)
+                      for open, close in parens],
+                     [assignment.Moved(offset) for assignment in assignments],
+                     [function.Moved(offset) for function in functions],
+                     [(brace_pos + offset, brace) for brace_pos, brace in braces], end)
+
+
+class ScriptAST(object):
+    '''The syntax tree of a script, a list of Statement
+
+    Use ParseScript to create it.  'text' is the text, encoded to UTF-8, and
+    'starts' the start of each statement in it.
+    '''
+
+    def __init__(self, text, statements, starts):
+        self.text = text
+        self.statements = statements
+        self.starts = starts
+        self._functions = None
+        self._variables = None
+
+    def StatementAt(self, pos):
+        '''Return the index of the statement at 'pos', or -1'''
+        index = bisect.bisect_right(self.starts, pos) - 1
+        if index >= 0 and pos < self.starts[index] + self.statements[index].length:
+            return index
+        return -1
+
+    def Calls(self):
+        '''Iterate over all the function calls of the script, in order'''
+        for start, statement in zip(self.starts, self.statements):
+            for call in statement.calls:
+                yield call.Moved(start)
+
+    def CallAt(self, pos):
+        '''Return the Call at 'pos', its name or opening parenthesis, or None'''
+        index = self.StatementAt(pos)
+        if index == -1:
+            return
+        start = self.starts[index]
+        pos -= start
+        for call in self.statements[index].calls:
+            if call.start <= pos <= call.openpos:
+                return call.Moved(start)
+
+    def OpenParenAt(self, pos):
+        '''Return the position of the innermost parenthesis open at 'pos'
+
+        The character at 'pos' is inside the parentheses if it's after the
+        opening one and not the closing one.  Returns None if there's none.
+        '''
+        index = self.StatementAt(pos)
+        if index == -1:
+            return
+        start = self.starts[index]
+        statement = self.statements[index]
+        pos -= start
+        for open, close in reversed(statement.parens):
+            if close is None:
+                close = statement.length
+                if self.text[start+close-1:start+close] == '\n':
+                    close -= 1
+            if open <= pos < close:
+                return open + start
+
+    def Functions(self):
+        '''Return the FunctionDef of all the function definitions'''
+        if self._functions is None:
+            self._Scopes()
+        return self._functions
+
+    def VarType(self, name):
+        '''Return the type of a variable if assigned a literal, or None
+
+        Only the last assignment outside of user functions is looked at.
+        '''
+        if self._variables is None:
+            self._Scopes()
+        return self._variables.get(name.lower())
+
+    def _Scopes(self):
+        functions = []
+        variables = {}
+        depth = 0
+        bodies = {} # depth: FunctionDef whose body is open
+        for start, statement in zip(self.starts, self.statements):
+            events = [(pos, 0, brace) for pos, brace in statement.braces]
+            events.extend((assignment.start, 1, assignment)
+                          for assignment in statement.assignments)
+            events.sort()
+            moved = [function.Moved(start) for function in statement.functions]
+            functions.extend(moved)
+            body_starts = dict((function.bodyStart, function) for function in moved
+                               if function.bodyStart is not None)
+            for pos, event, item in events:
+                if event == 1:
+                    if not bodies or item.isGlobal:
+                        variables[item.name.lower()] = item.kind
+                elif item == '{':
+                    depth += 1
+                    if pos + start in body_starts:
+                        bodies[depth] = body_starts[pos + start]
+                else:
+                    function = bodies.pop(depth, None)
+                    if function is not None:
+                        function.bodyEnd = pos + start
+                    depth = max(0, depth - 1)
+        self._functions = functions
+        self._variables = variables
+
+
+def _CommonPrefix(a, b):
+    '''Return the length of the common prefix of two strings'''
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _CommonSuffix(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a)-middle:len(a)-low] == b[len(b)-middle:len(b)-low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def ParseScript(text, previous=None):
+    '''Return the ScriptAST of a script
+
+    If 'previous' is the ScriptAST of an earlier version of the text, the
+    statements that didn't change are taken from it.
+    '''
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    statements = []
+    starts = []
+    pos = 0
+    tail = None
+    if previous is not None:
+        old = previous.text
+        if old == text:
+            return previous
+        prefix = _CommonPrefix(old, text)
+        suffix = _CommonSuffix(old, text, min(len(old), len(text)) - prefix)
+        delta = len(text) - len(old)
+        # the statement before the change may be joined to it
+        index = max(0, bisect.bisect_right(previous.starts, prefix) - 2)
+        statements = previous.statements[:index]
+        starts = previous.starts[:index]
+        if index < len(previous.starts):
+            pos = previous.starts[index]
+        elif starts:
+            pos = starts[-1] + statements[-1].length
+        tail = len(text) - suffix, delta, previous
+    while pos < len(text):
+        if tail is not None and pos >= tail[0]:
+            old_starts = tail[2].starts
+            index = bisect.bisect_left(old_starts, pos - tail[1])
+            if index < len(old_starts) and old_starts[index] == pos - tail[1]:
+                statements.extend(tail[2].statements[index:])
+                starts.extend(start + tail[1] for start in old_starts[index:])
+                break
+        statement = ParseStatement(text, pos)
+        statements.append(statement)
+        starts.append(pos)
+        if statement.end:
+            break
+        pos += statement.length
+    return ScriptAST(text, statements, starts)
@@ -67,6 +67,7 @@ import bisect
 import platform
 import textwrap
 import tempfile
+import Queue
 import StringIO
 import traceback
 import threading
@@ -84,6 +85,7 @@ import wx.lib.colourselect as colourselect
 import wxp
 import i18n
 import global_vars
+import pyavs_export
 from icons import AvsP_icon
 from icons import play_icon, pause_icon
 from icons import external_icon
@@ -102,6 +104,8 @@ from avsp2.macros import GenerateMacroReadme
 from avsp2.style_dialog import AvsStyleDialog
 from avsp2.export_dialog import AvsFunctionExportImportDialog
 from avsp2.function_dialog import AvsFunctionDialog
+from avsp2.script_tags import ScanScriptTags
+from avsp2.autocomplete import AutocompleteIndex
 
 from avsp2.timers import Timer
 
@@ -152,6 +156,7 @@ class MainFrame(AppFrame):
         self.SetPaths()
         self.LoadAvisynth()
         self.IdleCall = []
+        self.recentautocomplete = [] # lowercase names, the last picked first
         self.defineFilterInfo()
         if os.path.isfile(self.macrosfilename):
             try:
@@ -378,6 +383,17 @@ class MainFrame(AppFrame):
         self.play_speed_factor = 1.0
         self.play_drop = True
         self.playing_video = False
+        self.play_prefetcher = None
+        self.seek_worker = None
+        self.seek_focus = True
+        self.render_cache = None
+        self.SetRenderCache()
+        self.thumbnail_cache = None
+        self.SetThumbnailCache()
+        self.render_timings = None
+        self.timing_start = None
+        self.SetRenderTimings()
+        self.bookmark_menu_refresh_pending = False
         self.getPixelInfo = False
         self.sliderOpenString = '[<'
         self.sliderCloseString = '>]'
@@ -957,6 +973,7 @@ class MainFrame(AppFrame):
             'autocompletesingle': True,
             'autocompletevariables': True,
             'autocompleteicons': True,
+            'autocompletefuzzy': False,
             'calltipsoverautocomplete': False,
             'fdb_plugins': True,
             'fdb_userscriptfunctions': True,
@@ -978,6 +995,31 @@ class MainFrame(AppFrame):
             'videobackground': (0, 0, 0),
             'customvideobackground': (0, 0, 0),
             'errormessagefont': ('Arial', 24, '', '', (0, 0, 0)),
+            'framecachesize': 256,
+            'playbackprefetch': 8,
+            'asyncseek': True,
+            'exportworkers': 1,
+            'exportbuffer': 64,
+            'audiowaveform': False,
+            'scenethreshold': 20,
+            'scenehistthreshold': 0,
+            'sceneminlength': 12,
+            'indexcachesize': 256,
+            'thumbnails': False,
+            'thumbnailwidth': 160,
+            'thumbnailcount': 200,
+            'thumbnaildiskcache': False,
+            'thumbnailcachesize': 256,
+            'timingoverlay': False,
+            'timingframes': 300,
+            'nativeyuv2rgb': False,
+            'highbitdepthdither': False,
+            'rendercache': False,
+            'rendercachesize': 2048,
+            'rendercachemintime': 200,
+            'proxyscrubbing': False,
+            'proxyscale': 25,
+            'proxystep': 1,
             'cropminx': 16,
             'cropminy': 16,
             #~ 'zoomresizescript': 'BicubicResize(width-width%8, height-height%8, b=1/3, c=1/3)',
@@ -1472,8 +1514,18 @@ class MainFrame(AppFrame):
                         del avsfilterdict_autocomplete[lowername]
             elif lowername in self.options['filterremoved']:
                 del avsfilterdict_autocomplete[lowername]
-        self.avsazdict = self.GetAutocompleteDict(avsfilterdict_autocomplete)
-        self.avsazdict_all = self.GetAutocompleteDict(self.avsfilterdict)
+        # Only the names that changed are updated in the autocomplete indexes
+        if not hasattr(self, 'avsazdict'):
+            self.avsazdict = AutocompleteIndex()
+            self.avsazdict_all = AutocompleteIndex()
+        self.avsazdict.Update(self.GetAutocompleteNames(avsfilterdict_autocomplete))
+        self.avsazdict_all.Update(self.GetAutocompleteNames(self.avsfilterdict))
+        # Installed functions are ranked first by fuzzy autocompletion
+        installed = self.installed_plugins_filternames | self.installed_avsi_filternames
+        self.avsinstalledfilters = set(
+            lowername for lowername, (args, styletype, name, is_short) in self.avsfilterdict.iteritems()
+            if styletype == styleList[0] or lowername in installed or is_short in installed
+        )
         self.avssingleletters = [
             s for s in (self.avsfilterdict.keys()+self.avskeywords+self.avsmiscwords)
             if (len(s) == 1 and not s.isalnum() and s != '_')
@@ -1490,18 +1542,26 @@ class MainFrame(AppFrame):
         return ''
 
     @staticmethod
-    def GetAutocompleteDict(filter_dict):
-        """Create a list for each letter (for autocompletion)"""
-        avsazdict = collections.defaultdict(list)
-        for lowername in sorted(filter_dict.keys()):
+    def GetAutocompleteNames(filter_dict):
+        """Return {lowername: name} of the functions that can be autocompleted"""
+        names = {}
+        for lowername in filter_dict:
             first_letter = lowername[0]
             if first_letter.isalpha() or first_letter != '_':
                 for char in lowername:
                     if not char.isalnum() and char != '_':
                         break
                 else:
-                    avsazdict[first_letter].append(filter_dict[lowername][2])
-        return avsazdict
+                    names[lowername] = filter_dict[lowername][2]
+        return names
+
+    def AddRecentAutocomplete(self, name):
+        """Remember a function picked from the autocomplete list, for fuzzy ranking"""
+        lowername = name.lower()
+        if lowername in self.recentautocomplete:
+            self.recentautocomplete.remove(lowername)
+        self.recentautocomplete.insert(0, lowername)
+        del self.recentautocomplete[20:]
 
     def getFilterInfoFromAvisynth(self):
         self.avisynthVersion = (None,) * 3
@@ -1782,6 +1842,7 @@ class MainFrame(AppFrame):
                 ((_('Show autocomplete with variables'), wxp.OPT_ELEM_CHECK, 'autocompletevariables', _('Add user defined variables into autocomplete list'), dict() ), ),
                 ((_('Show autocomplete on single matched lowercase variable'), wxp.OPT_ELEM_CHECK, 'autocompletesingle', _('When typing a lowercase variable name, show autocomplete if there is only one item matched in keyword list'), dict(ident=20) ), ),
                 ((_('Show autocomplete with icons'), wxp.OPT_ELEM_CHECK, 'autocompleteicons', _("Add icons into autocomplete list. Using different type to indicate how well a filter's presets is defined"), dict() ), ),
+                ((_('Fuzzy autocomplete'), wxp.OPT_ELEM_CHECK, 'autocompletefuzzy', _("Also list the functions containing the typed letters in order, e.g. 'mdg' for MDegrain2, recently used and installed ones first"), dict() ), ),
                 ((_("Don't show autocomplete when calltip is active"), wxp.OPT_ELEM_CHECK, 'calltipsoverautocomplete', _('When calltip is active, autocomplete will not be activate automatically. You can still show autocomplete manually'), dict() ), ),
                 ((_('Autoparentheses level'), wxp.OPT_ELEM_RADIO, 'autoparentheses', _('Determines parentheses to insert upon autocompletion'), dict(choices=[(_('None " "'), 0),(_('Open "("'), 1),(_('Close "()"'), 2)])), ),
                 ((_('Preset activation key'), wxp.OPT_ELEM_RADIO, 'presetactivatekey', _('Determines which key activates the filter preset when the autocomplete box is visible'), dict(choices=[(_('Tab'), 'tab'),(_('Return'), 'return'),(_('Both'), 'both'),(_('None'), 'none')]) ), ),
@@ -1801,6 +1862,30 @@ class MainFrame(AppFrame):
                 ((_('Min text lines on video preview'), wxp.OPT_ELEM_SPIN, 'mintextlines', _('Minimum number of lines to show when displaying the video preview'), dict(min_val=0) ), ),
                 ((_('Customize video status bar...'), wxp.OPT_ELEM_BUTTON, 'videostatusbarinfo', _('Customize the video information shown in the program status bar'), dict(handler=self.OnConfigureVideoStatusBarMessage) ), ),
                 ((_('Error message font'), wxp.OPT_ELEM_FONT, 'errormessagefont', _('Set the font used for displaying the error if evaluating the script fails'), dict() ), ),
+                ((_('Playback read-ahead (frames)'), wxp.OPT_ELEM_SPIN, 'playbackprefetch', _('Render this many frames ahead in a background thread while playing the video, so occasional slow frames do not cause stuttering. Set it to 0 to render each frame when it is shown'), dict(min_val=0, max_val=256) ), ),
+                ((_('Render seeks in the background'), wxp.OPT_ELEM_CHECK, 'asyncseek', _('When dragging the video slider or stepping through frames, render only the last requested frame in a background thread and keep the program responsive meanwhile'), dict() ), ),
+                ((_('Convert YUV to RGB internally (*nix)'), wxp.OPT_ELEM_CHECK, 'nativeyuv2rgb', _("Convert the YUV video to RGB for displaying it with NumPy instead of AviSynth's filters. Chroma is not interpolated"), dict() ), ),
+                ((_('Dither high bit depth previews'), wxp.OPT_ELEM_CHECK, 'highbitdepthdither', _('Reduce stacked and interleaved 16-bit clips to 8 bits for the preview with ordered dithering instead of truncation'), dict() ), ),
+                ((_('Frame cache size (MB)'), wxp.OPT_ELEM_SPIN, 'framecachesize', _('Memory used per tab for keeping recently shown frames, so going back to them does not render them again. Set it to 0 to disable the cache'), dict(min_val=0, max_val=65536) ), ),
+                ((_('Save slow frames to disk'), wxp.OPT_ELEM_CHECK, 'rendercache', _('Keep the frames that take long to render in a cache on disk, so they are shown instantly when revisited, also after restarting the program. The cache is invalidated when the script or the files it references change'), dict() ), ),
+                ((_('Disk cache size (MB)'), wxp.OPT_ELEM_SPIN, 'rendercachesize', _('Maximum disk space used by the frame cache. The least recently shown frames are removed first'), dict(min_val=1, max_val=1048576) ), ),
+                ((_('Minimum render time (ms)'), wxp.OPT_ELEM_SPIN, 'rendercachemintime', _('Only save the frames that take at least this long to render'), dict(min_val=0, max_val=600000) ), ),
+                ((_('Scrub the timeline with a proxy'), wxp.OPT_ELEM_CHECK, 'proxyscrubbing', _('Render a low resolution copy of the script in the background and show it while dragging the video slider. The exact frame is rendered when the slider is released'), dict() ), ),
+                ((_('Proxy size (%)'), wxp.OPT_ELEM_SPIN, 'proxyscale', _('Size of the proxy relative to the video'), dict(min_val=1, max_val=100) ), ),
+                ((_('Proxy frame step'), wxp.OPT_ELEM_SPIN, 'proxystep', _('Render only one of every this many frames into the proxy'), dict(min_val=1, max_val=1000) ), ),
+                ((_('Export worker processes'), wxp.OPT_ELEM_SPIN, 'exportworkers', _('Number of processes used for rendering the frames when piping them to an external application or saving image sequences. Each one evaluates the script separately. Set it to 0 to use one per CPU, or to 1 to render the frames one at a time'), dict(min_val=0, max_val=256) ), ),
+                ((_('Export buffer (frames)'), wxp.OPT_ELEM_SPIN, 'exportbuffer', _('Maximum number of frames rendered by the export processes ahead of the one being written'), dict(min_val=1, max_val=4096) ), ),
+                ((_('Show the audio waveform'), wxp.OPT_ELEM_CHECK, 'audiowaveform', _('Read the audio of the script in the background and draw its waveform in the video slider. The waveform is saved to disk, so it is only read again when the script changes'), dict() ), ),
+                ((_('Scene change threshold'), wxp.OPT_ELEM_SPIN, 'scenethreshold', _('Minimum mean luma difference with the previous frame (0-255) for bookmarking a frame as a scene change'), dict(min_val=1, max_val=255) ), ),
+                ((_('Scene change histogram threshold (%)'), wxp.OPT_ELEM_SPIN, 'scenehistthreshold', _('If not 0, scene changes also need their luma histogram to differ by at least this much from the previous frame'), dict(min_val=0, max_val=100) ), ),
+                ((_('Minimum scene length'), wxp.OPT_ELEM_SPIN, 'sceneminlength', _('Scene changes closer than this many frames to the previous one are not bookmarked'), dict(min_val=1, max_val=100000) ), ),
+                ((_('Analysis cache size (MB)'), wxp.OPT_ELEM_SPIN, 'indexcachesize', _('Maximum disk space used by each of the saved audio waveforms, scene change measurements and frame hashes. The least recently used scripts are removed first'), dict(min_val=1, max_val=1048576) ), ),
+                ((_('Show thumbnails on the video slider'), wxp.OPT_ELEM_CHECK, 'thumbnails', _('Render small copies of the frames in the background and show them when hovering the video slider and in the bookmark menu. They are only rendered while the preview is not seeking or playing'), dict() ), ),
+                ((_('Thumbnail width'), wxp.OPT_ELEM_SPIN, 'thumbnailwidth', _('Width in pixels of the thumbnails'), dict(min_val=16, max_val=640) ), ),
+                ((_('Thumbnails along the clip'), wxp.OPT_ELEM_SPIN, 'thumbnailcount', _('Number of evenly spaced frames rendered in advance. The thumbnail nearest to the mouse pointer is shown until the exact one is rendered'), dict(min_val=0, max_val=10000) ), ),
+                ((_('Save thumbnails to disk'), wxp.OPT_ELEM_CHECK, 'thumbnaildiskcache', _('Keep the thumbnails in a cache on disk, so they are not rendered again after restarting the program while the script and the files it references do not change'), dict() ), ),
+                ((_('Thumbnail disk cache size (MB)'), wxp.OPT_ELEM_SPIN, 'thumbnailcachesize', _('Maximum disk space used by the saved thumbnails. The least recently shown ones are removed first'), dict(min_val=1, max_val=1048576) ), ),
+                ((_('Render timing history (frames)'), wxp.OPT_ELEM_SPIN, 'timingframes', _('Number of recently shown frames whose render timings are kept for the overlay percentiles and the CSV export'), dict(min_val=10, max_val=100000) ), ),
             ),
             (_('User Sliders'),
                 ((_('Hide slider window by default'), wxp.OPT_ELEM_CHECK, 'keepsliderwindowhidden', _('Keep the slider window hidden by default when previewing a video'), dict() ), ),
@@ -2438,6 +2523,7 @@ class MainFrame(AppFrame):
             (_('&Video'),
                 (_('Add/Remove bookmark'), 'Ctrl+B', self.OnMenuVideoBookmark, _('Mark the current frame on the frame slider')),
                 (_('Clear all bookmarks'), '', self.OnMenuVideoGotoClearAll, _('Clear all bookmarks')),
+                (_('Bookmark scene changes'), '', self.OnMenuVideoBookmarkSceneChanges, _('Measure the difference between consecutive frames in the background and bookmark the scene changes. The measurements are kept, so changing the thresholds in the options does not read the frames again')),
                 (_('Titled &bookmarks'),
                     (
                     (_('Move titled bookmark'), 'Ctrl+M', self.OnMenuVideoBookmarkMoveTitle, _('Move the nearest titled bookmark to the current position. A historic title will be restored if it matches the condition.')),
@@ -2593,6 +2679,8 @@ class MainFrame(AppFrame):
                 (_('External player'), 'F6', self.OnMenuVideoExternalPlayer, _('Play the current script in an external program')),
                 (''),
                 (_('Video information'), '', self.OnMenuVideoInfo, _('Show information about the video in a dialog box')),
+                (_('Show render timings'), '', self.OnMenuVideoRenderTimings, _('Show over the video the time spent rendering, converting, drawing and painting the last frames'), wx.ITEM_CHECK, self.options['timingoverlay']),
+                (_('Save render timings...'), '', self.OnMenuVideoSaveRenderTimings, _('Save the render timings of the last frames and their percentiles as CSV')),
             ),
             (_('&Options'),
                 (_('Always on top'), '', self.OnMenuOptionsAlwaysOnTop, _('Keep this window always on top of others'), wx.ITEM_CHECK, self.options['alwaysontop']),
@@ -2953,6 +3041,12 @@ class MainFrame(AppFrame):
         scriptWindow.encoding = 'latin1'
         scriptWindow.eol = None
         scriptWindow.AVI = None
+        scriptWindow.proxy = None
+        scriptWindow.audio_peaks = None
+        scriptWindow.scene_index = None
+        scriptWindow.frame_hashes = None
+        scriptWindow.thumbnails = None
+        scriptWindow.avs_source = None
         scriptWindow.display_clip_refresh_needed = False
         scriptWindow.previewtxt = []
         scriptWindow.sliderTexts = []
@@ -3083,6 +3177,8 @@ class MainFrame(AppFrame):
             self.videoSlider.Bind(wx.EVT_RIGHT_UP, self.OnSliderRightUp)
             self.videoSlider.Bind(wx.EVT_MIDDLE_DOWN, self.OnSliderMiddleDown)
             self.videoSlider.Bind(wx.EVT_LEFT_UP, self.OnSliderLeftUp)
+            self.videoSlider.SetWaveform(self.GetSliderWaveform, refresh=False)
+            self.videoSlider.SetThumbnails(self.GetSliderThumbnail)
             sizer.Add(self.videoSlider, 1, wx.EXPAND)
             videoControlWidgets.append(self.videoSlider)
         else:
@@ -3095,6 +3191,8 @@ class MainFrame(AppFrame):
             self.videoSlider2.Bind(wx.EVT_RIGHT_UP, self.OnSliderRightUp)
             self.videoSlider2.Bind(wx.EVT_MIDDLE_DOWN, self.OnSliderMiddleDown)
             self.videoSlider2.Bind(wx.EVT_LEFT_UP, self.OnSliderLeftUp)
+            self.videoSlider2.SetWaveform(self.GetSliderWaveform, refresh=False)
+            self.videoSlider2.SetThumbnails(self.GetSliderThumbnail)
             sizer.Add(self.videoSlider2, 1, wx.EXPAND)
             videoControlWidgets.append(self.videoSlider2)
 
@@ -3825,7 +3923,7 @@ class MainFrame(AppFrame):
         self.NewTab(copytab=True)
 
     def OnMenuCopyUnmarkedScript(self, event):
-        txt = self.getCleanText(self.currentScript.GetText()).replace('\n', '\r\n')
+        txt = self.currentScript.GetScriptTags().text.replace('\n', '\r\n')
         text_data = wx.TextDataObject(txt)
         if wx.TheClipboard.Open():
             wx.TheClipboard.SetData(text_data)
@@ -4064,6 +4162,39 @@ class MainFrame(AppFrame):
     def OnMenuVideoGotoClearAll(self, event):
         self.DeleteAllFrameBookmarks(bmtype=0)
 
+    def OnMenuVideoBookmarkSceneChanges(self, event):
+        script = self.currentScript
+        index = self.GetScriptSceneIndex(script)
+        if index is None:
+            return
+        if index.error_message:
+            wx.MessageBox(index.error_message, _('Error'), style=wx.OK|wx.ICON_ERROR)
+            self.StopScriptSceneIndex(script)
+            return
+        def Bookmark():
+            if script.scene_index is not index:
+                return
+            if index.error_message:
+                self.SetStatusText(_('Error measuring scene changes: {0}').format(index.error_message))
+                return
+            scenes = index.SceneChanges(self.options['scenethreshold'],
+                                        self.options['scenehistthreshold'] / 100.0 or None,
+                                        min_length=self.options['sceneminlength'])
+            if script == self.currentScript:
+                count = self.AddFrameBookmarkList(scenes)
+                self.SetStatusText(_('Bookmarked {0} scene changes').format(count))
+        if index.IsComplete():
+            Bookmark()
+            return
+        def OnProgress():
+            if index.IsComplete() or index.error_message:
+                wx.CallAfter(Bookmark)
+            elif index.Framecount:
+                wx.CallAfter(self.SetStatusText, _('Measuring scene changes... {0}%').format(
+                             100 * index.frames_done // index.Framecount))
+        index.callback = OnProgress
+        index.Scan()
+
     def OnMenuVideoGoto(self, event):
         if not self.separatevideowindow or not self.previewWindowVisible or self.FindFocus() != self.videoWindow:
             frameTextCtrl = self.frameTextCtrl
@@ -4149,7 +4280,7 @@ class MainFrame(AppFrame):
         mdc.SelectObject(bmp)
         if not script.AVI.DrawFrame(self.currentframenum, mdc):
             wx.MessageBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=self.currentframenum),
-                          script.AVI.clip.get_error())), _('Error'), style=wx.OK|wx.ICON_ERROR)
+                          script.AVI.frame_error_message or '')), _('Error'), style=wx.OK|wx.ICON_ERROR)
             return False
         bmp_data = wx.BitmapDataObject(bmp)
         if wx.TheClipboard.Open():
@@ -4505,8 +4636,15 @@ class MainFrame(AppFrame):
 
     def OnMenuVideoReleaseMemory(self, event):
         self.HidePreviewWindow()
+        if self.seek_worker is not None:
+            self.seek_worker.Cancel()
         for index in xrange(self.scriptNotebook.GetPageCount()):
             script = self.scriptNotebook.GetPage(index)
+            self.StopScriptProxy(script)
+            self.StopScriptWaveform(script)
+            self.StopScriptSceneIndex(script)
+            self.StopScriptFrameHashes(script)
+            self.StopScriptThumbnails(script)
             script.AVI = None
 
     def OnMenuVideoToggle(self, event):
@@ -4614,6 +4752,31 @@ class MainFrame(AppFrame):
     def OnMenuVideoExternalPlayer(self, event):
         self.RunExternalPlayer()
 
+    def OnMenuVideoRenderTimings(self, event):
+        id = event.GetId()
+        menuItem = self.GetMenuBar().FindItemById(id)
+        self.options['timingoverlay'] = not self.options['timingoverlay']
+        menuItem.Check(self.options['timingoverlay'])
+        if self.previewWindowVisible:
+            self.videoWindow.Refresh()
+
+    def OnMenuVideoSaveRenderTimings(self, event):
+        if self.render_timings is None:
+            return
+        filefilter = _('CSV files') + ' (*.csv)|*.csv|' + _('All files') + ' (*.*)|*.*'
+        dlg = wx.FileDialog(self, _('Save render timings'), self.GetProposedPath(only='dir'),
+                            'render_timings.csv', filefilter, wx.SAVE | wx.OVERWRITE_PROMPT)
+        ID = dlg.ShowModal()
+        if ID == wx.ID_OK:
+            filename = dlg.GetPath()
+            try:
+                with open(filename, 'wb') as f:
+                    self.render_timings.WriteCSV(f)
+            except EnvironmentError, err:
+                wx.MessageBox(_('Error saving the render timings:') + '\n' + str(err),
+                              _('Error'), style=wx.OK|wx.ICON_ERROR)
+        dlg.Destroy()
+
     def OnMenuVideoInfo(self, event):
         dlg = wx.Dialog(self, wx.ID_ANY, _('Video information'))
         vi = self.GetVideoInfoDict()
@@ -5347,15 +5510,16 @@ class MainFrame(AppFrame):
             self.playing_video = ''
         videoSlider = event.GetEventObject()
         frame = videoSlider.GetValue()
-        if self.options['dragupdate']:
+        if (not self.ShowProxyFrame(self.currentScript, frame) and
+                self.options['dragupdate']):
             if not self.separatevideowindow:
-                self.ShowVideoFrame(frame, adjust_handle=True)
+                self.SeekVideoFrame(frame, adjust_handle=True)
             else:
                 if event is not None and event.GetEventObject() in self.videoControlWidgets and self.previewWindowVisible:
-                    self.ShowVideoFrame(frame, adjust_handle=True, focus=False)
+                    self.SeekVideoFrame(frame, adjust_handle=True, focus=False)
                     self.currentScript.SetFocus()
                 else:
-                    self.ShowVideoFrame(frame, adjust_handle=True)
+                    self.SeekVideoFrame(frame, adjust_handle=True)
         bms = self.GetBookmarkFrameList()
         if frame in bms and bms[frame] == 0:
             color = wx.RED
@@ -5378,13 +5542,13 @@ class MainFrame(AppFrame):
             #~ return
         frame = videoSlider.GetValue()
         if not self.separatevideowindow:
-            self.ShowVideoFrame(frame, adjust_handle=videoSlider.adjust_handle)
+            self.SeekVideoFrame(frame, adjust_handle=videoSlider.adjust_handle)
         else:
             if event is not None and event.GetEventObject() in self.videoControlWidgets and self.previewWindowVisible:
-                self.ShowVideoFrame(frame, adjust_handle=videoSlider.adjust_handle, focus=False)
+                self.SeekVideoFrame(frame, adjust_handle=videoSlider.adjust_handle, focus=False)
                 self.currentScript.SetFocus()
             else:
-                self.ShowVideoFrame(frame, adjust_handle=videoSlider.adjust_handle)
+                self.SeekVideoFrame(frame, adjust_handle=videoSlider.adjust_handle)
         self.videoWindow.SetFocus()
         if self.playing_video == '':
             self.PlayPauseVideo()
@@ -5543,6 +5707,8 @@ class MainFrame(AppFrame):
             #~ else:
                 #~ self.videoSplitter.SplitVertically(self.videoWindow, newSliderWindow, script.lastSplitSliderPos)
 
+        self.RefreshSliderWaveform(script)
+
         # Misc
         #~ if not self.previewWindowVisible:
             #~ script.SetFocus()
@@ -6163,18 +6329,15 @@ class MainFrame(AppFrame):
                         yield int(round(start))
                         start += step
                 frames = float_range(frames/10, 9*frames/10 - 1, 8.0*frames/(10*samples))
-            crop_values = []
-            for i, frame in enumerate(frames):
-                button.SetLabel(_('Cancel') + ' ({0}/{1})'.format(i+1, samples))
-                crop_values_frame = clip.AutocropFrame(frame, tol)
-                if not crop_values_frame:
-                    button.SetLabel(_('Auto-crop'))
-                    return
-                crop_values.append(crop_values_frame)
+            def progress(done, total):
+                button.SetLabel(_('Cancel') + ' ({0}/{1})'.format(done, total))
                 wx.Yield()
-                if not button.running:
-                    button.SetLabel(_('Auto-crop'))
-                    return
+                return button.running
+            button.SetLabel(_('Cancel') + ' ({0}/{1})'.format(0, samples))
+            crop_values = clip.AutocropFrames(frames, tol, callback=progress)
+            if not crop_values:
+                button.SetLabel(_('Auto-crop'))
+                return
 
             # Get and apply final crop values
             script.autocrop_values = []
@@ -6284,8 +6447,7 @@ class MainFrame(AppFrame):
     # the following 2 func called from wxp.OptionsDialog, not MainFrame
     def x_OnCustomizeAutoCompList(self, event):
         choices = []
-        for keywords in self.avsazdict.values():
-            choices += keywords
+        choices += self.avsazdict.Names()
         choices.sort(key=lambda k: k.lower())
         dlg = wx.Dialog(self, wx.ID_ANY, _('Select autocomplete keywords'), style=wx.DEFAULT_DIALOG_STYLE|wx.RESIZE_BORDER)
         listbox = wx.CheckListBox(dlg, wx.ID_ANY, choices=choices)
@@ -6806,7 +6968,14 @@ class MainFrame(AppFrame):
         wx.TheClipboard.Flush()
         for index in xrange(self.scriptNotebook.GetPageCount()):
             script = self.scriptNotebook.GetPage(index)
+            self.StopScriptProxy(script)
+            self.StopScriptWaveform(script)
+            self.StopScriptSceneIndex(script)
+            self.StopScriptFrameHashes(script)
+            self.StopScriptThumbnails(script)
             script.AVI = None
+        if self.seek_worker is not None:
+            self.seek_worker.Stop(wait=False)
         pyavs.ExitRoutines()
         if self.boolSingleInstance:
             self.argsPosterThread.Stop()
@@ -7189,6 +7358,11 @@ class MainFrame(AppFrame):
         # Save last state
         self.lastClosed = self.GetTabInfo(index)
         # Delete the tab from the notebook
+        self.StopScriptProxy(script)
+        self.StopScriptWaveform(script)
+        self.StopScriptSceneIndex(script)
+        self.StopScriptFrameHashes(script)
+        self.StopScriptThumbnails(script)
         script.AVI = None #self.scriptNotebook.GetPage(index).AVI = None # clear memory
         # If only 1 tab, make another
         if self.scriptNotebook.GetPageCount() == 1:
@@ -7268,7 +7442,7 @@ class MainFrame(AppFrame):
             # Get script's text, adding the marked version of the script if required
             #~ txt = self.regexp.sub(self.re_replace, script.GetText())
             scriptText = script.GetText()
-            txt = self.getCleanText(scriptText)
+            txt = script.GetScriptTags().text
             if txt != scriptText and self.options['savemarkedavs']:
                 header = '### AvsP marked script ###'
                 base = '\n'.join(['# %s' % line for line in scriptText.split('\n')])
@@ -7312,9 +7486,7 @@ class MainFrame(AppFrame):
         return script, index
 
     def getCleanText(self, text):
-        text = self.cleanSliders(text)
-        text = self.cleanToggleTags(text)
-        return text
+        return ScanScriptTags(text).text
 
     def GetEncodedText(self, txt, bom=False):
         '''Prepare a script's text for saving it to file
@@ -7476,15 +7648,8 @@ class MainFrame(AppFrame):
             win.SetFocus()
         self.UpdateTabImages()
 
-    def cleanSliders(self, text):
-        return self.regexp.sub(self.re_replace, text)
-
     def cleanToggleTags(self, text):
-        for endtag in re.findall('\[/.*?\]', text):
-            tagname = endtag[2:-1]
-            expr = re.compile('\[%s(\s*=.*?)*?\].*?\[/%s\]' % (tagname, tagname), re.IGNORECASE|re.DOTALL)
-            text = expr.sub(self.re_replace2, text)
-        return text
+        return ScanScriptTags(text, sliders=False).text
 
     def ExportHTML(self, filename=None, ext_css=None, index=None):
         """Save a script as a HTML document
@@ -7729,9 +7894,11 @@ class MainFrame(AppFrame):
                     last_length=script.lastLength, f_encoding=script.encoding, eol=script.eol,
                     workdir=script.workdir, group=script.group, group_frame=script.group_frame)
 
-    def SaveImage(self, filename='', frame=None, silent=False, index=None, avs_clip=None, default='', quality=None, depth=None):
+    def SaveImage(self, filename='', frame=None, silent=False, index=None, avs_clip=None, default='', quality=None, depth=None, data=None):
         script, index = self.getScriptAtIndex(index)
         # avs_clip: use 'index' tab, but with an alternative clip
+        # data: the frame already rendered by RenderFrames, top-down RGB24 data
+        #       of the avs_clip display size, or the raw frame for 16-bit PNG
         if not avs_clip:
             avs_clip = script.AVI
         if script is None or avs_clip is None:
@@ -7807,10 +7974,13 @@ class MainFrame(AppFrame):
                 filename = '%s%s' % (filename, ext)
             #~if ext == '.png' and depth == 16:
             if ext == '.png' and (depth == 16 or depth is None and self.check_RGB48(script)):
-                ret = avs_clip.RawFrame(frame)
+                ret = data if data is not None else avs_clip.RawFrame(frame, reuse=True)
                 if ret:
                     self.SavePNG(filename, ret, avs_clip.Height / 2)
                     return filename
+            elif data is not None:
+                img = wx.ImageFromData(avs_clip.DisplayWidth, avs_clip.DisplayHeight, data)
+                ret = True
             else:
                 w = avs_clip.DisplayWidth
                 h = avs_clip.DisplayHeight
@@ -7823,7 +7993,8 @@ class MainFrame(AppFrame):
                               avs_clip.clip.get_error())), _('Error'), style=wx.OK|wx.ICON_ERROR)
                 return
             #~ bmp.SaveFile(filename, self.imageFormats[ext][1])
-            img = bmp.ConvertToImage()
+            if data is None:
+                img = bmp.ConvertToImage()
             if ext==".jpg":
                 if quality is None:
                     quality = self.options['jpegquality']
@@ -8577,6 +8748,10 @@ class MainFrame(AppFrame):
             bookmarkList.sort()
         width = len(str(max(bookmarkList)[0])) if bookmarkList else 0
         fmt = '%%%dd ' % width
+        thumbnails = self.currentScript.thumbnails
+        if thumbnails is not None:
+            thumbnails.Request([bookmark for bookmark, bmtype in bookmarkList if bmtype == 0],
+                               thumbnails.BOOKMARK)
         for bookmark, bmtype in bookmarkList:
             if bmtype == 0:
                 label = fmt % bookmark
@@ -8590,7 +8765,15 @@ class MainFrame(AppFrame):
                         label += '[??:??:??.???]'
                 if titleItem.IsChecked():
                     label += ' ' + self.bookmarkDict.get(bookmark, '')
-                menuItem = self.menuBookmark.Insert(pos, wx.ID_ANY, label, _('Jump to specified bookmark'))
+                data = thumbnails.Get(bookmark) if thumbnails is not None else None
+                if data is not None:
+                    menuItem = wx.MenuItem(self.menuBookmark, wx.ID_ANY, label, _('Jump to specified bookmark'))
+                    img = wx.ImageFromData(thumbnails.width, thumbnails.height, data)
+                    img.Rescale(64, max(1, 64 * thumbnails.height // thumbnails.width))
+                    menuItem.SetBitmap(img.ConvertToBitmap())
+                    self.menuBookmark.InsertItem(pos, menuItem)
+                else:
+                    menuItem = self.menuBookmark.Insert(pos, wx.ID_ANY, label, _('Jump to specified bookmark'))
                 self.Bind(wx.EVT_MENU, self.OnMenuVideoGotoFrameNumber, menuItem)
                 pos += 1
 
@@ -8612,7 +8795,8 @@ class MainFrame(AppFrame):
 
     def InsertUserSlider(self):
         script = self.currentScript
-        sliderTexts, sliderProperties = self.GetScriptSliderProperties(script.GetText())
+        scriptTags = script.GetScriptTags()
+        sliderTexts, sliderProperties = scriptTags.sliderTexts, scriptTags.sliderProperties
         #~ labels = [str(p[0].strip('"')) for p in sliderProperties]
         labels = []
         for p in sliderProperties:
@@ -8667,6 +8851,8 @@ class MainFrame(AppFrame):
         else:
             text = ' %s %i'  % (_('Frame'), frame)
         text2 = text.rsplit('\\T\\T', 1)
+        if self.seek_worker is not None and self.seek_worker.IsBusy():
+            text2[0] = text = u'{0}  [{1}]      '.format(text2[0].rstrip(), _('rendering...'))
         if primary:
             if len(text2) == 2:
                 statusBar = self.GetStatusBar()
@@ -8930,34 +9116,46 @@ class MainFrame(AppFrame):
                 #~ colorstring = 'hex = %s' % hexcolor.upper()
             #~ self.SetVideoStatusText(addon='%s%s, %s' % (' '*5,xystring, colorstring))
 
-            # Get color from display
-            rgb = dc.GetPixel(x, y)
-            R,G,B = rgb.Get()
-            A = 0
-            hexcolor = '$%02x%02x%02x' % (R,G,B)
-            Y = 0.257*R + 0.504*G + 0.098*B + 16
-            U = -0.148*R - 0.291*G + 0.439*B + 128
-            V = 0.439*R - 0.368*G - 0.071*B + 128
+            xdc, ydc = x, y
             if 'flipvertical' in self.flip:
                 y = script.AVI.DisplayHeight - 1 - y
             if 'fliphorizontal' in self.flip:
                 x = script.AVI.DisplayWidth - 1 - x
-            # Get color from AviSynth
-            if not self.bit_depth:
-                try:
-                    avsYUV = script.AVI.GetPixelYUV(x, y)
-                    if avsYUV != (-1,-1,-1):
-                        Y,U,V = avsYUV
-                    if script.AVI.IsRGB32:
-                        avsRGBA = script.AVI.GetPixelRGBA(x, y)
-                        if avsRGBA != (-1,-1,-1,-1):
-                            R,G,B,A = avsRGBA
-                    else:
-                        avsRGB = script.AVI.GetPixelRGB(x, y)
-                        if avsRGB != (-1,-1,-1):
-                            R,G,B = avsRGB
-                except:
-                    pass
+            # Get color from the current frame
+            rgb = yuv = None
+            if not self.bit_depth and getattr(pyavs, 'numpy', None) is not None:
+                rgb = script.AVI.GetRegion(None, x, y, 1, 1, 'rgb')
+                yuv = script.AVI.GetRegion(None, x, y, 1, 1, 'yuv')
+            if rgb is not None and yuv is not None and rgb.size:
+                R,G,B = [int(value) for value in rgb[0, 0]]
+                Y,U,V = [int(value) for value in yuv[0, 0]]
+                A = script.AVI.GetPixelRGBA(x, y)[3] if script.AVI.IsRGB32 else 0
+                hexcolor = '$%02x%02x%02x' % (R,G,B)
+            else:
+                # Get color from display
+                rgb = dc.GetPixel(xdc, ydc)
+                R,G,B = rgb.Get()
+                A = 0
+                hexcolor = '$%02x%02x%02x' % (R,G,B)
+                Y = 0.257*R + 0.504*G + 0.098*B + 16
+                U = -0.148*R - 0.291*G + 0.439*B + 128
+                V = 0.439*R - 0.368*G - 0.071*B + 128
+                # Get color from AviSynth
+                if not self.bit_depth:
+                    try:
+                        avsYUV = script.AVI.GetPixelYUV(x, y)
+                        if avsYUV != (-1,-1,-1):
+                            Y,U,V = avsYUV
+                        if script.AVI.IsRGB32:
+                            avsRGBA = script.AVI.GetPixelRGBA(x, y)
+                            if avsRGBA != (-1,-1,-1,-1):
+                                R,G,B,A = avsRGBA
+                        else:
+                            avsRGB = script.AVI.GetPixelRGB(x, y)
+                            if avsRGB != (-1,-1,-1):
+                                R,G,B = avsRGB
+                    except:
+                        pass
             if not string_:
                 return (x, y), hexcolor.upper()[1:], (R, G, B), (R, G, B, A), (Y, U, V)
             xystring = '%s=(%i,%i)' % (_('pos'),x,y)
@@ -9287,6 +9485,7 @@ class MainFrame(AppFrame):
         # Exit if disable preview option is turned on
         if self.options['disablepreview']:
             return
+        self.timing_start = time.time()
         # Update the script AVI
         if script is None:
             script = self.currentScript
@@ -9295,6 +9494,7 @@ class MainFrame(AppFrame):
         display_clip_refresh_needed = script.display_clip_refresh_needed
         if self.UpdateScriptAVI(script, forceRefresh, keep_env=keep_env) is None:
             #~ wx.MessageBox(_('Error loading the script'), _('Error'), style=wx.OK|wx.ICON_ERROR)
+            self.timing_start = None
             return False
         #~ # Exit if invalid user sliders
         #~ labels = []
@@ -9362,9 +9562,9 @@ class MainFrame(AppFrame):
             self.frameTextCtrl2.Replace(0, -1, str(framenum))
 
         # Check for errors when retrieving the frame before updating the gui
-        script.AVI.display_clip.get_frame(framenum)
-        error = script.AVI.display_clip.get_error()
-        if error is not None:
+        if not script.AVI._GetFrame(framenum):
+            error = script.AVI.frame_error_message or ''
+            self.timing_start = None
             self.HidePreviewWindow()
             wx.MessageBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=framenum),
                           error)), _('Error'), style=wx.OK|wx.ICON_ERROR)
@@ -9674,6 +9874,61 @@ class MainFrame(AppFrame):
         #~ button.SetToolTip(wx.ToolTip(_('Show slider window')))
         button.Refresh()
 
+    def SeekVideoFrame(self, framenum, wrap=True, script=None, focus=True, adjust_handle=False):
+        """Show a frame, rendering it in a background thread if it's not ready
+
+        Requests made while a frame is being rendered replace the pending one,
+        so only the last position is rendered when scrubbing.  The slider and
+        frame number are updated at once.  Falls back to ShowVideoFrame if
+        the clip has to be created or the frame is already rendered.
+        """
+        if script is None:
+            script = self.currentScript
+        clip = script.AVI
+        if (not self.options['asyncseek'] or not hasattr(pyavs, 'SeekWorker') or
+                clip is None or not clip.initialized or script.display_clip_refresh_needed or
+                self.options['disablepreview'] or not self.previewWindowVisible or
+                script != self.currentScript or self.UpdateScriptAVI(script) is not False or
+                self.videoSlider.GetMax() != clip.Framecount - 1):
+            if self.seek_worker is not None:
+                self.seek_worker.Cancel()
+            return self.ShowVideoFrame(framenum, wrap=wrap, script=script, focus=focus,
+                                       adjust_handle=adjust_handle)
+        if framenum < 0:
+            framenum = framenum % clip.Framecount if wrap else 0
+        framenum = min(framenum, clip.Framecount - 1)
+        if clip.IsFrameReady(framenum):
+            if self.seek_worker is not None:
+                self.seek_worker.Cancel()
+            return self.ShowVideoFrame(framenum, script=script, focus=focus)
+        if self.seek_worker is None:
+            self.seek_worker = pyavs.SeekWorker(self._OnSeekRendered)
+        self.seek_worker.Request(clip, framenum)
+        self.seek_focus = focus
+        self.videoSlider.SetValue(framenum)
+        self.frameTextCtrl.Replace(0, -1, str(framenum))
+        if self.separatevideowindow:
+            self.videoSlider2.SetValue(framenum)
+            self.frameTextCtrl2.Replace(0, -1, str(framenum))
+        self.SetVideoStatusText(framenum)
+        return True
+
+    def _OnSeekRendered(self, clip, framenum, frames):
+        """Called from the seek worker thread"""
+        AsyncCall(self._ShowSeekedFrame, clip, framenum, frames)
+
+    def _ShowSeekedFrame(self, clip, framenum, frames):
+        """Show a frame rendered by the seek worker, if it's still wanted"""
+        if self.seek_worker is None or not self.seek_worker.IsLatest(clip, framenum):
+            return
+        self.seek_worker.Cancel()
+        script = self.currentScript
+        if script.AVI is not clip:
+            return
+        if frames is not None:
+            clip._PresentFrame(framenum, frames)
+        self.ShowVideoFrame(framenum, script=script, focus=self.seek_focus)
+
     def ShowVideoOffset(self, offset=0, units='frames', focus=True):
         if self.playing_video:
             self.PlayPauseVideo()
@@ -9691,7 +9946,7 @@ class MainFrame(AppFrame):
         elif units in ('hr', 'hours'):
             offsetFrames = offset * int(round(script.AVI.Framerate * 60 * 60))
         framenum = offsetFrames + self.videoSlider.GetValue()
-        self.ShowVideoFrame(framenum, wrap=False, script=script, focus=focus)
+        self.SeekVideoFrame(framenum, wrap=False, script=script, focus=focus)
         if self.playing_video == '':
             self.PlayPauseVideo()
 
@@ -9724,6 +9979,39 @@ class MainFrame(AppFrame):
         if self.playing_video == '':
             self.PlayPauseVideo()
 
+    def SetRenderCache(self):
+        '''Create or resize the disk cache of slow frames according to the options'''
+        if not self.options['rendercache'] or not hasattr(pyavs, 'RenderCache'):
+            self.render_cache = None
+            return
+        max_bytes = self.options['rendercachesize'] * 1024 * 1024
+        if self.render_cache is None:
+            self.render_cache = pyavs.RenderCache(
+                os.path.join(self.programdir, 'rendercache'), max_bytes)
+        elif self.render_cache.max_bytes != max_bytes:
+            self.render_cache.resize(max_bytes)
+
+    def SetThumbnailCache(self):
+        '''Create, resize or remove the disk cache of thumbnails according to the options'''
+        if not self.options['thumbnaildiskcache'] or not hasattr(pyavs, 'RenderCache'):
+            self.thumbnail_cache = None
+            return
+        max_bytes = self.options['thumbnailcachesize'] * 1024 * 1024
+        if self.thumbnail_cache is None:
+            self.thumbnail_cache = pyavs.RenderCache(
+                os.path.join(self.programdir, 'thumbnails'), max_bytes)
+        elif self.thumbnail_cache.max_bytes != max_bytes:
+            self.thumbnail_cache.resize(max_bytes)
+
+    def SetRenderTimings(self):
+        '''Create or resize the render timings buffer according to the options'''
+        if not hasattr(pyavs, 'RenderTimings'):
+            return
+        if self.render_timings is None:
+            self.render_timings = pyavs.RenderTimings(self.options['timingframes'])
+        elif self.render_timings.size != self.options['timingframes']:
+            self.render_timings.resize(self.options['timingframes'])
+
     def UpdateScriptAVI(self, script=None, forceRefresh=False, keep_env=None, prompt=True):
         if not script:
             script = self.currentScript
@@ -9804,11 +10092,13 @@ class MainFrame(AppFrame):
                         self.SaveScript(filename)
                     wx.BeginBusyCursor()
                     script.AVI = None
+                    script.avs_source = (script.GetScriptTags().text, filename, workdir)
                     script.AVI = pyavs.AvsClip(
-                        self.getCleanText(scripttxt), filename, workdir=workdir, env=env,
+                        script.avs_source[0], filename, workdir=workdir, env=env,
                         fitHeight=fitHeight, fitWidth=fitWidth, oldFramecount=oldFramecount,
                         matrix=self.matrix, interlaced=self.interlaced, swapuv=self.swapuv,
-                        bit_depth=self.bit_depth)
+                        bit_depth=self.bit_depth, render_cache=self.render_cache,
+                        timings=self.render_timings)
                     wx.EndBusyCursor()
                 if not script.AVI.initialized:
                     if prompt:
@@ -9826,7 +10116,7 @@ class MainFrame(AppFrame):
                     script.AVI = None
                     return None
                 # Update the script tag properties
-                self.UpdateScriptTagProperties(script, scripttxt)
+                self.UpdateScriptTagProperties(script)
                 self.GetAutoSliderInfo(script, scripttxt)
                 script.previewtxt = self.ScriptChanged(script, return_styledtext=True)[1]
                 boolNewAVI = True
@@ -9849,6 +10139,11 @@ class MainFrame(AppFrame):
                     (oldWidth, oldHeight) != (script.AVI.DisplayWidth, script.AVI.DisplayHeight):
                 script.lastSplitVideoPos = None
             script.autocrop_values = None
+            self.UpdateScriptProxy(script)
+            self.UpdateScriptWaveform(script)
+            self.StopScriptSceneIndex(script)
+            self.StopScriptFrameHashes(script)
+            self.UpdateScriptThumbnails(script)
             if self.cropDialog.IsShown():
                 self.PaintCropWarnings()
             if self.playing_video == '':
@@ -9856,19 +10151,236 @@ class MainFrame(AppFrame):
 
         return boolNewAVI
 
+    def UpdateScriptProxy(self, script):
+        '''Start rendering the scrubbing proxy of a script, replacing the previous one'''
+        self.StopScriptProxy(script)
+        if (not self.options['proxyscrubbing'] or script.AVI is None or script.avs_source is None
+                or script.AVI.IsErrorClip() or not hasattr(pyavs, 'ProxyBuilder')):
+            return
+        text, filename, workdir = script.avs_source
+        script.proxy = pyavs.ProxyBuilder(text, filename, workdir,
+                                          scale=self.options['proxyscale'] / 100.0,
+                                          step=self.options['proxystep'],
+                                          matrix=script.AVI.matrix, interlaced=self.interlaced)
+
+    def StopScriptProxy(self, script):
+        if script.proxy is not None:
+            script.proxy.Stop(wait=False)
+            script.proxy = None
+
+    def UpdateScriptWaveform(self, script):
+        '''Start reading the audio peaks of a script, replacing the previous ones'''
+        self.StopScriptWaveform(script)
+        if (not self.options['audiowaveform'] or script.AVI is None or script.avs_source is None
+                or script.AVI.IsErrorClip() or not script.AVI.HasAudio
+                or not hasattr(pyavs, 'AudioPeakIndex') or pyavs.numpy is None):
+            return
+        text, filename, workdir = script.avs_source
+        script.audio_peaks = pyavs.AudioPeakIndex(text, filename, workdir,
+            cache_dir=os.path.join(self.programdir, 'audiopeaks'),
+            callback=lambda: wx.CallAfter(self.RefreshSliderWaveform, script))
+        self.RefreshSliderWaveform(script)
+
+    def StopScriptWaveform(self, script):
+        if script.audio_peaks is not None:
+            script.audio_peaks.Stop(wait=False)
+            script.audio_peaks = None
+            self.RefreshSliderWaveform(script)
+
+    def RefreshSliderWaveform(self, script):
+        if self and script == self.currentScript:
+            for slider in self.GetVideoSliderList():
+                slider.Refresh()
+
+    def GetSliderWaveform(self, width):
+        '''Return the audio peaks of the current script for the video slider
+
+        A (min, max) pair in the range -1..1 per pixel, with all the audio
+        channels merged.
+        '''
+        script = self.currentScript
+        peaks = script.audio_peaks
+        if peaks is None or script.AVI is None or not peaks.Audiorate:
+            return
+        slider = self.videoSlider
+        samples_per_frame = peaks.Audiorate / script.AVI.Framerate
+        start = int(slider.minValue * samples_per_frame)
+        end = int((slider.maxValue + 1) * samples_per_frame)
+        values = peaks.GetPeaks(start, end, width)
+        if values is None:
+            return
+        return zip(values[:, :, 0].min(axis=1) / 127.0, values[:, :, 1].max(axis=1) / 127.0)
+
+    def GetScriptSceneIndex(self, script):
+        '''Return the scene change index of a script, creating it if needed
+
+        Returns None if the script can't be previewed or NumPy is missing.
+
+        '''
+        if script.scene_index is None:
+            if (self.UpdateScriptAVI(script, prompt=True) is None or script.avs_source is None
+                    or script.AVI.IsErrorClip() or not hasattr(pyavs, 'SceneChangeIndex')
+                    or pyavs.numpy is None):
+                return
+            text, filename, workdir = script.avs_source
+            script.scene_index = pyavs.SceneChangeIndex(text, filename, workdir,
+                cache_dir=os.path.join(self.programdir, 'scenechanges'),
+                matrix=script.AVI.matrix, interlaced=self.interlaced)
+        return script.scene_index
+
+    def StopScriptSceneIndex(self, script):
+        if script.scene_index is not None:
+            script.scene_index.Stop(wait=False)
+            script.scene_index = None
+
+    def GetScriptFrameHashes(self, script):
+        '''Return the perceptual hash index of a script, creating it if needed
+
+        Returns None if the script can't be previewed or NumPy is missing.
+
+        '''
+        if script.frame_hashes is None:
+            if (self.UpdateScriptAVI(script, prompt=True) is None or script.avs_source is None
+                    or script.AVI.IsErrorClip() or not hasattr(pyavs, 'FrameHashIndex')
+                    or pyavs.numpy is None):
+                return
+            text, filename, workdir = script.avs_source
+            script.frame_hashes = pyavs.FrameHashIndex(text, filename, workdir,
+                script.AVI.Framecount, cache_dir=os.path.join(self.programdir, 'framehashes'),
+                workers=self.options['exportworkers'], matrix=script.AVI.matrix,
+                interlaced=self.interlaced)
+        return script.frame_hashes
+
+    def StopScriptFrameHashes(self, script):
+        if script.frame_hashes is not None:
+            script.frame_hashes.Stop(wait=False)
+            script.frame_hashes = None
+
+    def AddFrameBookmarkList(self, frames):
+        '''Add a list of frame bookmarks without toggling the existing ones
+
+        Frames that already have a bookmark or a selection start or end are
+        skipped.  Returns the number of new bookmarks.
+
+        '''
+        bookmarks = self.GetBookmarkFrameList()
+        frames = [frame for frame in frames if frame not in bookmarks]
+        if frames:
+            for slider in self.GetVideoSliderList():
+                for frame in frames:
+                    slider.SetBookmark(frame, refresh=False)
+                slider.RefreshBookmarks()
+            self.UpdateBookmarkMenu()
+        return len(frames)
+
+    def UpdateScriptThumbnails(self, script):
+        '''Start rendering the thumbnails of a script, replacing the previous ones'''
+        self.StopScriptThumbnails(script)
+        if (not self.options['thumbnails'] or script.AVI is None or script.avs_source is None
+                or script.AVI.IsErrorClip() or not hasattr(pyavs, 'ThumbnailRenderer')):
+            return
+        text, filename, workdir = script.avs_source
+        count = self.options['thumbnailcount']
+        script.thumbnails = pyavs.ThumbnailRenderer(text, filename, workdir,
+            width=self.options['thumbnailwidth'],
+            interval=-(-script.AVI.Framecount // count) if count else 0,
+            disk_cache=self.thumbnail_cache, matrix=script.AVI.matrix,
+            interlaced=self.interlaced,
+            callback=lambda frame: wx.CallAfter(self.OnThumbnailRendered, script, frame),
+            idle=self.IsIdleForThumbnails)
+        bookmarks = [frame for frame, bmtype in self.GetBookmarkFrameList().items() if bmtype == 0]
+        script.thumbnails.Request(bookmarks, script.thumbnails.BOOKMARK)
+
+    def StopScriptThumbnails(self, script):
+        if script.thumbnails is not None:
+            script.thumbnails.Stop(wait=False)
+            script.thumbnails = None
+
+    def IsIdleForThumbnails(self):
+        '''Called from the thumbnail threads, which wait while this returns False'''
+        return not self.playing_video and not (self.seek_worker is not None and
+                                               self.seek_worker.IsBusy())
+
+    def OnThumbnailRendered(self, script, frame):
+        if not self or script != self.currentScript or script.thumbnails is None:
+            return
+        for slider in self.GetVideoSliderList():
+            if slider.hoverValue is not None:
+                slider.RefreshThumbnail()
+        if (not self.bookmark_menu_refresh_pending and
+                self.GetBookmarkFrameList().get(frame) == 0):
+            self.bookmark_menu_refresh_pending = True
+            wx.CallLater(1000, self._RefreshBookmarkMenu)
+
+    def _RefreshBookmarkMenu(self):
+        self.bookmark_menu_refresh_pending = False
+        self.UpdateBookmarkMenu()
+
+    def GetSliderThumbnail(self, frame):
+        '''Return a (bitmap, frame) tuple with the thumbnail of the frame or the
+        nearest one already rendered, or None
+
+        The exact thumbnail is requested if missing.
+
+        '''
+        thumbnails = self.currentScript.thumbnails
+        if thumbnails is None:
+            return
+        nearest = thumbnails.GetNearest(frame)
+        if nearest is None or nearest[0] != frame:
+            thumbnails.Request([frame])
+        if nearest is None:
+            return
+        shown_frame, data = nearest
+        return wx.BitmapFromBuffer(thumbnails.width, thumbnails.height, data), shown_frame
+
+    def ShowProxyFrame(self, script, frame):
+        '''Paint the proxy frame nearest to 'frame' in the video preview
+
+        Returns False if the proxy is not available or hasn't reached the frame.
+
+        '''
+        if script.proxy is None or script.AVI is None or not self.previewWindowVisible:
+            return False
+        data = script.proxy.GetFrame(frame)
+        if data is None:
+            return False
+        img = wx.ImageFromData(script.proxy.width, script.proxy.height, data)
+        if 'flipvertical' in self.flip:
+            img = img.Mirror(False)
+        if 'fliphorizontal' in self.flip:
+            img = img.Mirror()
+        w = max(1, int(script.AVI.DisplayWidth * self.zoomfactor))
+        h = max(1, int(script.AVI.DisplayHeight * self.zoomfactor))
+        img.Rescale(w, h)
+        dc = wx.ClientDC(self.videoWindow)
+        dc.SetDeviceOrigin(self.xo, self.yo)
+        try: # DoPrepareDC causes NameError in wx2.9.1 and fixed in wx2.9.2
+            self.videoWindow.DoPrepareDC(dc)
+        except:
+            self.videoWindow.PrepareDC(dc)
+        dc.DrawBitmap(wx.BitmapFromImage(img), 0, 0)
+        return True
+
     def ScriptChanged(self, script=None, return_styledtext=False):
-        """Compare scripts including style, but excluding comment/newline/space"""
+        """Compare scripts including style, but excluding comment/newline/space
+
+        The digest of the line fingerprints kept by the script is compared
+        if available, otherwise the whole styled text.
+        """
         if script is None:
             script = self.currentScript
-        scripttxt = script.GetStyledText(0, script.GetTextLength())
-        styledtxt = []
-        for i in range(0, len(scripttxt), 2):
-            style = ord(scripttxt[i+1]) & 31
-            if style in script.commentStyle\
-            or (style == script.STC_AVS_DEFAULT and scripttxt[i] in ' \t\n'):
-                continue
-            styledtxt.append(scripttxt[i])
-            styledtxt.append(style)
+        styledtxt = script.GetCodeDigest()
+        if styledtxt is None:
+            scripttxt = script.GetStyledText(0, script.GetTextLength())
+            styledtxt = []
+            for i in range(0, len(scripttxt), 2):
+                style = ord(scripttxt[i+1]) & 31
+                if style in script.commentStyle\
+                or (style == script.STC_AVS_DEFAULT and scripttxt[i] in ' \t\n'):
+                    continue
+                styledtxt.append(scripttxt[i])
+                styledtxt.append(style)
         script_changed = styledtxt != script.previewtxt
         if return_styledtext:
             return script_changed, styledtxt
@@ -9876,46 +10388,45 @@ class MainFrame(AppFrame):
 
     def UpdateScriptTagProperties(self, script, scripttxt=None):
         if scripttxt is None:
-            scripttxt = script.GetText()
-        # First strip out comments from scripttxt
-        scripttxt = re.sub(r'#.*?\n', r'\n', '%s\n' % scripttxt)
-        # Get the toggle tag info
-        script.toggleTags = self.GetScriptToggleTagProperties(scripttxt, stripComments=False)
-        # Get the slider info
-        script.sliderTexts, script.sliderProperties = self.GetScriptSliderProperties(scripttxt, stripComments=False)
+            scriptTags = script.GetScriptTags()
+        else:
+            scriptTags = ScanScriptTags(scripttxt)
+        script.toggleTags = scriptTags.toggleTags
+        script.sliderTexts = scriptTags.sliderTexts
+        script.sliderProperties = scriptTags.sliderProperties
         if script.AVI.IsErrorClip():
             script.toggleTags = []
             script.sliderProperties = []
             script.sliderTexts = []
 
     def GetAutoSliderInfo(self, script, scripttxt=None):
-        script.OnStyleNeeded(None, forceAll=True)
         autoSliderInfo = []
         if script.AVI.IsErrorClip() or not self.options['autoslideron']:
             script.autoSliderInfo = []
             return
         nameDict = {}
-        posA = posB = 0
-        lastpos = script.GetTextLength()
-        while posB < lastpos:
-            posB = script.WordEndPosition(posA, 1)
-            word = script.GetTextRange(posA, posB)
-            #~ if word.lower() in script.keywords:
-            if script.GetStyleAt(posA) in script.keywordStyleList:
-                filterInfo = self.GetFilterArgMatchedInfo(script, posA)
-                if filterInfo is not None:
-                    wordlower = word.lower()
-                    if not wordlower in nameDict:
-                        nameDict[wordlower] = 1
-                        filterName = word
-                    else:
-                        nameDict[wordlower] += 1
-                        filterName = '%s (%i)' % (word, nameDict[wordlower])
-                    if filterInfo:
-                        autoSliderInfo.append((filterName,filterInfo))
-            posA = posB+1
+        for call in self.GetSliderFilterCalls(script):
+            filterInfo = self.GetFilterArgMatchedInfo(script, call.start)
+            if filterInfo is not None:
+                word = call.name
+                wordlower = word.lower()
+                if not wordlower in nameDict:
+                    nameDict[wordlower] = 1
+                    filterName = word
+                else:
+                    nameDict[wordlower] += 1
+                    filterName = '%s (%i)' % (word, nameDict[wordlower])
+                if filterInfo:
+                    autoSliderInfo.append((filterName,filterInfo))
         script.autoSliderInfo = autoSliderInfo
 
+    def GetSliderFilterCalls(self, script):
+        '''Iterate over the calls of a script to filters that can have sliders'''
+        for call in script.GetScriptAST().Calls():
+            info = script.avsfilterdict.get(call.name.lower())
+            if info is not None and info[1] in script.keywordStyleList:
+                yield call
+
     def GetFilterArgMatchedInfo(self, script, startwordpos):
         filterMatchedArgs = script.GetFilterMatchedArgs(startwordpos)
         returnInfo = []
@@ -9930,43 +10441,8 @@ class MainFrame(AppFrame):
             returnInfo.append((calltipArgEntry, argname, argvalue, index))
         return returnInfo
 
-    def GetScriptSliderProperties(self, scripttxt, stripComments=True):
-        # First strip out comments from scripttxt
-        if stripComments:
-            scripttxt = re.sub(r'#.*?\n', r'\n', '%s\n' % scripttxt)
-        # Then strip out toggle tags
-        scripttxt = self.cleanToggleTags(scripttxt)
-        # Then find any user sliders
-        sliderTexts = self.regexp.findall(scripttxt)
-        sliderProperties = []
-        for text in sliderTexts:
-            items = [s.strip() for s in text.lstrip(self.sliderOpenString).rstrip(self.sliderCloseString).split(',')]
-            if len(items) == 4:
-                info = (items[0], items[1], items[2])
-            else:
-                info = None
-            sliderProperties.append(info)
-        return sliderTexts, sliderProperties
-
-    def GetScriptToggleTagProperties(self, scripttxt, stripComments=True):
-        # First strip out comments from scripttxt
-        if stripComments:
-            scripttxt = re.sub(r'#.*?\n', r'\n', '%s\n' % scripttxt)
-        # Then find any toggle tags
-        toggleTags = []
-        for endtag in re.findall('\[/.*?\]', scripttxt):
-            tagname = endtag[2:-1]
-            #~ expr = re.compile('\[%s(\s*=.*?)*?\].*?\[/%s\]' % (tagname, tagname), re.IGNORECASE|re.DOTALL)
-            expr = re.compile('\[%s.*?\].*?\[/%s\]' % (tagname, tagname), re.IGNORECASE|re.DOTALL)
-            try:
-                txt = expr.findall(scripttxt)[0]
-                toggleTags.append((tagname, self.boolToggleTag(txt)))
-            except IndexError:
-                pass
-        return toggleTags
-
     def MakePreviewScriptFile(self, script):
-        txt = self.getCleanText(script.GetText())
+        txt = script.GetScriptTags().text
         txt = self.GetEncodedText(txt, bom=True)
         # Construct the filename of the temporary avisynth script
         dirname = self.GetProposedPath(only='dir')
@@ -10037,6 +10513,7 @@ class MainFrame(AppFrame):
             if __debug__:
                 print>>sys.stderr, 'Error in PaintAVIFrame: script is None'
             return
+        paint_start = time.time()
         if self.zoomwindow or self.zoomfactor != 1 or self.flip:
             try: # DoPrepareDC causes NameError in wx2.9.1 and fixed in wx2.9.2
                 self.videoWindow.DoPrepareDC(inputdc)
@@ -10060,7 +10537,7 @@ class MainFrame(AppFrame):
                 dc.SelectObject(bmp)
                 if not script.AVI.DrawFrame(frame, dc):
                     wx.MessageBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=frame),
-                                  script.AVI.clip.get_error())), _('Error'), style=wx.OK|wx.ICON_ERROR)
+                                  script.AVI.frame_error_message or '')), _('Error'), style=wx.OK|wx.ICON_ERROR)
                     return
                 self.PaintCropRectangles(dc, script)
                 self.PaintTrimSelectionMark(dc, script, frame)
@@ -10077,7 +10554,7 @@ class MainFrame(AppFrame):
                     self.videoWindow.PrepareDC(dc)
                 if not script.AVI.DrawFrame(frame, dc):
                     wx.MessageBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=frame),
-                                  script.AVI.clip.get_error())), _('Error'), style=wx.OK|wx.ICON_ERROR)
+                                  script.AVI.frame_error_message or '')), _('Error'), style=wx.OK|wx.ICON_ERROR)
                     return
         else:
             dc = wx.MemoryDC()
@@ -10090,7 +10567,7 @@ class MainFrame(AppFrame):
                 dc.SelectObject(bmp)
                 if not script.AVI.DrawFrame(frame, dc):
                     wx.MessageBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=frame),
-                                  script.AVI.clip.get_error())), _('Error'), style=wx.OK|wx.ICON_ERROR)
+                                  script.AVI.frame_error_message or '')), _('Error'), style=wx.OK|wx.ICON_ERROR)
                     return
                 if self.flip:
                     img = bmp.ConvertToImage()
@@ -10114,8 +10591,45 @@ class MainFrame(AppFrame):
                 wx.CallAfter(self.ShowVideoFrame)
                 self.firstToggled = False
         self.paintedframe = frame
+        timings = self.render_timings
+        if timings is not None:
+            shown_frame = script.AVI.current_frame
+            if self.timing_start is not None: # a frame was requested
+                timings.Add(shown_frame, 'paint', time.time() - paint_start)
+                timings.Add(shown_frame, 'total', time.time() - self.timing_start)
+                self.timing_start = None
+                timings.Commit(shown_frame)
+            else: # repaint (expose, resize...) of the same frame
+                timings.Discard(shown_frame)
+            if self.options['timingoverlay']:
+                self.PaintRenderTimings(inputdc)
         return True
 
+    def PaintRenderTimings(self, dc):
+        '''Paint the timings of the last frame and their percentiles over the video'''
+        last = self.render_timings.Last()
+        if last is None:
+            return
+        frame, record = last
+        percentiles = self.render_timings.Percentiles((50, 90, 99))
+        lines = [_('frame {0}').format(frame),
+                 '{0:<10}'.format('(ms)') + ''.join('{0:>8}'.format(column)
+                 for column in ('last', 'p50', 'p90', 'p99'))]
+        for stage in self.render_timings.stages:
+            lines.append('{0:<10}'.format(stage) + ''.join('{0:8.1f}'.format(value * 1000)
+                         for value in [record.get(stage, 0)] + percentiles[stage]))
+        dc.SetUserScale(1, 1)
+        dc.SetFont(wx.Font(8, wx.FONTFAMILY_TELETYPE, wx.NORMAL, wx.NORMAL))
+        line_height = dc.GetTextExtent('X')[1]
+        width = max(dc.GetTextExtent(line)[0] for line in lines)
+        dc.SetLogicalFunction(wx.COPY)
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.SetBrush(wx.BLACK_BRUSH)
+        dc.DrawRectangle(0, 0, width + 8, line_height * len(lines) + 8)
+        dc.SetTextForeground(wx.WHITE)
+        for i, line in enumerate(lines):
+            dc.DrawText(line, 4, 4 + i * line_height)
+
     def PaintTrimSelectionMark(self, dc, script, frame):
         if self.trimDialog.IsShown() and self.markFrameInOut:
             boolInside = self.ValueInSliderSelection(frame)
@@ -10389,6 +10903,11 @@ class MainFrame(AppFrame):
         if self.playing_video:
             self.play_timer.stop()
             self.playing_video = False
+            if self.play_prefetcher is not None:
+                self.play_prefetcher.Stop()
+                if debug_stats:
+                    print 'read-ahead: {0}'.format(self.play_prefetcher.stats())
+                self.play_prefetcher = None
             self.play_button.SetBitmapLabel(self.bmpPlay)
             self.play_button.Refresh()
 
@@ -10417,6 +10936,14 @@ class MainFrame(AppFrame):
             # Basic variables needed for the playback callback.
             self.play_initial_frame = self.currentframenum
             self.play_initial_time = time.time()
+            if debug_stats:
+                self.increment = 0
+                self.previous_time = self.play_initial_time
+
+            # Render the next frames in a worker thread, only present them here
+            if self.options['playbackprefetch'] and hasattr(pyavs, 'FramePrefetcher'):
+                self.play_prefetcher = pyavs.FramePrefetcher(script.AVI, 
+                    self.currentframenum + 1, self.options['playbackprefetch'])
 
             def _playback_cb():
                 if not self.playing_video:
@@ -10436,8 +10963,17 @@ class MainFrame(AppFrame):
                     increment = 1
                 if debug_stats:
                     print debug_stats_str
-                if not AsyncCall(self.ShowVideoFrame, frame + increment,
-                                 check_playing=True, focus=False).Wait():
+                prefetcher = self.play_prefetcher
+                if prefetcher is not None and prefetcher.clip is script.AVI:
+                    try:
+                        frames = prefetcher.Get(frame + increment, timeout=1)
+                    except Queue.Empty: # try again on the next tick
+                        return
+                    if not AsyncCall(self._ShowPrefetchedFrame, script, frame + increment,
+                                     frames).Wait():
+                        return
+                elif not AsyncCall(self.ShowVideoFrame, frame + increment,
+                                   check_playing=True, focus=False).Wait():
                     return
                 if self.currentframenum == script.AVI.Framecount - 1:
                     self.PlayPauseVideo()
@@ -10448,6 +10984,12 @@ class MainFrame(AppFrame):
             print(interval, self.play_timer)
             self.play_timer.start()
 
+    def _ShowPrefetchedFrame(self, script, framenum, frames):
+        """Show a frame rendered by the playback read-ahead thread"""
+        if frames is not None and script.AVI is not None:
+            script.AVI._PresentFrame(framenum, frames)
+        return self.ShowVideoFrame(framenum, check_playing=True, focus=False)
+
     def RunExternalPlayer(self, path=None, script=None, args=None, prompt=True):
         if script is None:
             script = self.currentScript
@@ -10507,37 +11049,6 @@ class MainFrame(AppFrame):
         self.pid = wx.Execute('%s "%s" %s' % (path, previewname, args), wx.EXEC_ASYNC, process)
         return True
 
-    def re_replace(self, mo):
-        items = mo.group().lstrip(self.sliderOpenString).rstrip(self.sliderCloseString).split(',')
-        if len(items) == 4:
-            return items[3].strip()
-        elif len(items) == 1 and 'separator' in items[0]:
-            return ''
-        else:
-            return mo.group()
-
-    def re_replace2(self, mo):
-        txt = mo.group()
-        if self.boolToggleTag(txt):
-            posA = txt.find(']') + 1
-            posB = txt.rfind('[')
-            return txt[posA:posB]
-        else:
-            return ''
-
-    def boolToggleTag(self, txt):
-        starttag = txt[1:txt.find(']')]
-        boolKeep = True
-        try:
-            name, value = starttag.split('=')
-            try:
-                boolKeep = bool(int(value))
-            except ValueError:
-                pass
-        except ValueError:
-            pass
-        return boolKeep
-
     def _x_re_replaceStrip(self, mo):
         return ''.join(re.split('\[.*?\]', mo.group()))
 
@@ -11708,52 +12219,20 @@ class MainFrame(AppFrame):
         else:
             filterName = slider.filterName
             iFilter = 1
-        startpos = 0
-        for i in range(iFilter):
-            startpos = script.FindText(startpos, script.GetTextLength(), filterName, stc.STC_FIND_WHOLEWORD)
-            if startpos == -1:
-                return (None, None, None)
-            startpos += 1
-            while script.GetStyleAt(startpos) not in script.keywordStyleList:
-                startpos = script.FindText(startpos, script.GetTextLength(), filterName, stc.STC_FIND_WHOLEWORD)
-                if startpos == -1:
-                    return (None, None, None)
-                startpos += 1
-        # Find the argument in the text
-        endwordpos = script.WordEndPosition(startpos, 1)
-        while chr(script.GetCharAt(endwordpos)) in (' ', '\t'):
-            endwordpos += 1
-        posEnd = script.BraceMatch(endwordpos)
-        if posEnd == -1:
+        filterName = filterName.lower()
+        for call in self.GetSliderFilterCalls(script):
+            if call.name.lower() == filterName:
+                iFilter -= 1
+                if not iFilter:
+                    break
+        else:
             return (None, None, None)
-        argIndex = slider.argIndex
-        for i in xrange(argIndex):
-            endwordpos = script.GetNextValidCommaPos(endwordpos+1)
-            if endwordpos is None:
-                return (None, None, None)
-        posA = endwordpos+1
-        posB = script.GetNextValidCommaPos(posA)
-        if posB is None or posB > posEnd:
-            posB = posEnd
-        text = script.GetTextRange(posA, posB)
-        posEqualSign = script.GetNextValidCommaPos(posA, checkChar='=')
-        if posEqualSign is not None and posEqualSign < posB:
-            posA = posEqualSign+1
-        pos = posA
-        while pos < posB:
-            c = unichr(script.GetCharAt(pos))
-            if c.strip() and c != '\\':
-                posA = pos
-                break
-            pos += 1
-        pos = posB
-        while pos > posA:
-            c = unichr(script.GetCharAt(pos-1))
-            if c.strip() and c != '\\':
-                posB = pos
-                break
-            pos -= 1
-        return script.GetTextRange(posA, posB), posA, posB
+        # Find the argument in the call
+        try:
+            arg = call.args[slider.argIndex]
+        except IndexError:
+            return (None, None, None)
+        return arg.value, arg.valueStart, arg.valueEnd
 
     def addAvsSliderSeparatorNew(self, script, label='', menu=None, row=None, sizer=None):
         if sizer is None:
@@ -11942,6 +12421,14 @@ class MainFrame(AppFrame):
             old_style_triple_quotes = self.options['syntaxhighlight_styleinsidetriplequotes']
             old_use_custom_video_background = self.options['use_customvideobackground']
             old_custom_video_background = self.options['customvideobackground']
+            old_frame_cache_size = self.options['framecachesize']
+            old_native_yuv2rgb = self.options['nativeyuv2rgb']
+            old_high_bit_depth_dither = self.options['highbitdepthdither']
+            old_render_cache = self.options['rendercache']
+            old_proxy = [self.options[key] for key in ('proxyscrubbing', 'proxyscale', 'proxystep')]
+            old_audio_waveform = self.options['audiowaveform']
+            old_thumbnails = [self.options[key] for key in ('thumbnails', 'thumbnailwidth',
+                              'thumbnailcount', 'thumbnaildiskcache')]
             self.options.update(dlg.GetDict())
             if self.options['pluginsdir'] != old_plugins_directory:
                 self.SetPluginsDirectory(old_plugins_directory)
@@ -11955,12 +12442,29 @@ class MainFrame(AppFrame):
                 os.chdir(self.ExpandVars(self.options['workdir']))
             else:
                 os.chdir(self.initialworkdir)
+            self.SetRenderCache()
+            self.SetThumbnailCache()
+            self.SetRenderTimings()
             for i in xrange(self.scriptNotebook.GetPageCount()):
                 script = self.scriptNotebook.GetPage(i)
                 if (self.options['syntaxhighlight_preferfunctions'] != old_prefer_functions or
                     self.options['syntaxhighlight_styleinsidetriplequotes'] != old_style_triple_quotes):
                         script.styling_refresh_needed = True
                 script.SetUserOptions()
+                if script.AVI and self.options['framecachesize'] != old_frame_cache_size:
+                    script.AVI.SetFrameCacheSize(self.options['framecachesize'])
+                if (self.options['nativeyuv2rgb'] != old_native_yuv2rgb or 
+                    self.options['highbitdepthdither'] != old_high_bit_depth_dither):
+                        script.display_clip_refresh_needed = True
+                if self.options['rendercache'] != old_render_cache:
+                    script.previewtxt = [] # recreate the clip with the new render cache
+                if old_proxy != [self.options[key] for key in ('proxyscrubbing', 'proxyscale', 'proxystep')]:
+                    self.UpdateScriptProxy(script)
+                if self.options['audiowaveform'] != old_audio_waveform:
+                    self.UpdateScriptWaveform(script)
+                if old_thumbnails != [self.options[key] for key in ('thumbnails', 'thumbnailwidth',
+                                      'thumbnailcount', 'thumbnaildiskcache')]:
+                    self.UpdateScriptThumbnails(script)
                 if not self.options['usetabimages']:
                     self.scriptNotebook.SetPageImage(i, -1)
             self.UpdateProgramTitle()
@@ -12393,10 +12897,9 @@ class MainFrame(AppFrame):
         script, index = self.getScriptAtIndex(index)
         if script is None:
             return False
-        txt = script.GetText()
         if clean:
-            txt = self.getCleanText(txt)
-        return txt
+            return script.GetScriptTags().text
+        return script.GetText()
 
     @AsyncCallWrapper
     def MacroGetSelectedText(self, index=None):
@@ -12881,6 +13384,74 @@ class MainFrame(AppFrame):
             return False
         return script.AVI.Framecount
 
+    @AsyncCallWrapper
+    def MacroGetVideoPlanes(self, framenum=None, index=None, display=False):
+        r'''GetVideoPlanes(framenum=None, index=None, display=False)
+
+        Returns a tuple of NumPy arrays with the planes of the frame 'framenum' of the
+        script at the tab integer 'index', without copying the video data: (Y, U, V)
+        for YUV, (Y,) for Y8 and (R, G, B) or (R, G, B, A) for RGB, with the rows
+        from top to bottom.  If 'framenum' is None, then the current frame is used.
+        If 'index' is None, then the currently selected tab is used.  If 'display' is
+        True, the planes of the RGB frame used for the video preview are returned
+        instead.  The arrays are read-only views of AviSynth's memory.  Requires
+        NumPy.
+
+        '''
+        script, index = self.getScriptAtIndex(index)
+        if script is None:
+            return False
+        self.refreshAVI = True
+        if self.UpdateScriptAVI(script) is None:
+            wx.MessageBox(_('Error loading the script'), _('Error'), style=wx.OK|wx.ICON_ERROR)
+            return False
+        if framenum is None:
+            framenum = self.GetFrameNumber()
+        planes = script.AVI.GetPlanes(framenum, display)
+        if planes is None:
+            wx.MessageBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=framenum),
+                          script.AVI.frame_error_message or '')), _('Error'), style=wx.OK|wx.ICON_ERROR)
+            return False
+        return planes
+
+    @AsyncCallWrapper
+    def MacroGetVideoRegion(self, x, y, w, h, space='yuv', framenum=None, index=None, stats=False):
+        r'''GetVideoRegion(x, y, w, h, space='yuv', framenum=None, index=None, stats=False)
+
+        Returns a NumPy array with the samples of the region of size ('w', 'h') at
+        the position ('x', 'y') of the frame 'framenum' of the script at the tab
+        integer 'index', with shape (h, w, 3).  The position is counted from the top
+        left corner and the region is clipped to the frame boundaries.  Valid values
+        for 'space': 'yuv', 'rgb'.  Subsampled chroma is repeated over the pixels it
+        covers.  If 'framenum' is None, then the current frame is used.  If 'index'
+        is None, then the currently selected tab is used.
+
+        If 'stats' is True, returns a dictionary with the region statistics instead:
+        'mean', 'min', 'max' and 'stdev' hold a tuple with a value for each channel
+        and 'count' the number of pixels.  Requires NumPy.
+
+        '''
+        script, index = self.getScriptAtIndex(index)
+        if script is None:
+            return False
+        self.refreshAVI = True
+        if self.UpdateScriptAVI(script) is None:
+            wx.MessageBox(_('Error loading the script'), _('Error'), style=wx.OK|wx.ICON_ERROR)
+            return False
+        if framenum is None:
+            framenum = self.GetFrameNumber()
+        if stats:
+            ret = script.AVI.GetRegionStats(framenum, x, y, w, h, space)
+        else:
+            ret = script.AVI.GetRegion(framenum, x, y, w, h, space)
+        if ret is None:
+            if stats and not script.AVI.frame_error_message:
+                return None
+            wx.MessageBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=framenum),
+                          script.AVI.frame_error_message or '')), _('Error'), style=wx.OK|wx.ICON_ERROR)
+            return False
+        return ret
+
     @AsyncCallWrapper
     def MacroGetPixelInfo(self, color='hex', wait=False, lines=False):
         '''GetPixelInfo(color='hex', wait=False, lines=False)
@@ -13078,10 +13649,11 @@ class MainFrame(AppFrame):
         return True
 
     # Don't use decorator on this one
-    def MacroPipe(self, cmd, text=None, frames=None, y4m=False, reorder_rgb=False, wait=False, callback=None, stdout=None, stderr=None):
-        r"""Pipe(cmd, text=None, frames=None, y4m=False, reorder_rgb=False, wait=False, callback=None, stdout=None, stderr=None)
+    def MacroPipe(self, cmd, text=None, frames=None, y4m=False, reorder_rgb=False, wait=False, callback=None, stdout=None, stderr=None, bit_depth=None, workers=None, audio=None, audio_format='wav'):
+        r"""Pipe(cmd, text=None, frames=None, y4m=False, reorder_rgb=False, wait=False, callback=None, stdout=None, stderr=None, bit_depth=None, workers=None, audio=None, audio_format='wav')
 
-        Pipe raw frame data to an external application (video only)
+        Pipe raw frame data to an external application, and optionally the audio
+        to another one
 
         cmd: right side of the pipe (Unicode string). Accepts several variables:
              {height}, {width}, {fps}, {frame_count}.
@@ -13109,28 +13681,25 @@ class MainFrame(AppFrame):
         stdout: file object where redirect stdout.  Defaults to sys.stdout on __debug__,
                 nowhere otherwise.
         stderr: file object where redirect stderr.  Defaults to stdout.
+        bit_depth: 's10', 's16', 'i10' or 'i16' to decode a stacked or interleaved
+                   high bit depth clip and pipe it as little-endian 16-bit samples.
+                   The {width} and {height} variables and the yuv4mpeg2 header
+                   defaults use the decoded size and depth.  Requires NumPy.
+        workers: number of processes that render the frames, each one with its own
+                 AviSynth environment.  Defaults to the 'Export worker processes'
+                 setting, 0 means one per CPU and 1 renders the frames one at a
+                 time in this process.  The frames are piped in order.
+        audio: command that receives the audio, from the first to the last frame
+               piped, at the same time as the video.  It accepts the same variables
+               as PipeAudio.  The audio is read in its own AviSynth environment.
+               If given, the Popen objects are returned as a (video, audio) tuple,
+               and the return code is the first non-zero one.
+        audio_format: 'wav', 'w64' or 'raw', as in PipeAudio.
 
         """
 
         # Evaluate text
-        workdir_exp = self.ExpandVars(self.options['workdir'])
-        if (self.options['useworkdir'] and self.options['alwaysworkdir']
-            and os.path.isdir(workdir_exp)):
-                workdir = workdir_exp
-        else:
-            workdir = self.currentScript.workdir if text is None else ''
-        if text is None:
-            text = self.getCleanText(self.currentScript.GetText())
-            filename = self.currentScript.filename
-            # vpy hack, remove when VapourSynth is supported
-            if os.name == 'nt' and filename.endswith('.vpy'):
-                self.SaveScript(filename)
-        else:
-            if os.path.isfile(text):
-                filename = text
-                text = self.GetTextFromFile(text)[0]
-            else:
-                filename = 'AVS script'
+        text, filename, workdir = self.GetExportSource(text)
         clip = pyavs.AvsClip(text, filename, workdir, display_clip=False,
                              reorder_rgb=reorder_rgb, interlaced=self.interlaced)
         if not clip.initialized or clip.IsErrorClip():
@@ -13142,66 +13711,179 @@ class MainFrame(AppFrame):
             total_frames = clip.Framecount
         elif callback:
             total_frames = len(frames)
+        width, height = clip.Width, clip.Height
+        if bit_depth:
+            if not clip.IsPlanar or pyavs.numpy is None:
+                self.MacroMsgBox(_('High bit depth piping requires a planar YUV clip and NumPy'),
+                                 _('Error'))
+                return
+            width, height = pyavs.HighBitDepthDecoder(bit_depth).Size(width, height)
+        if workers is None:
+            workers = self.options['exportworkers']
+        if workers != 1 or audio:
+            frames = list(frames)
+        if audio:
+            audio_clip = self._GetAudioClip(text, filename, workdir)
+            if audio_clip is None:
+                return
+            vi = audio_clip.clip.get_video_info()
+            audio_start = vi.audio_samples_from_frames(frames[0])
+            audio_end = min(vi.audio_samples_from_frames(frames[-1] + 1),
+                            audio_clip.Audiolength)
 
         # Create pipe
-        cmd = cmd.format(height=clip.Height, width=clip.Width, fps=clip.Framerate,
-                         frame_count=clip.Framecount)
-        cmd = cmd.encode(encoding)
-        cmd = shlex.split(cmd)
-        if stdout is None:
-            stdout = sys.stdout if __debug__ else subprocess.PIPE
-        if stderr is None:
-            stderr = subprocess.STDOUT
-        if os.name == 'nt':
-            info = subprocess.STARTUPINFO()
-            try:
-                info.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                info.wShowWindow = subprocess.SW_HIDE
-            except AttributeError:
-                import _subprocess
-                info.dwFlags |= _subprocess.STARTF_USESHOWWINDOW
-                info.wShowWindow = _subprocess.SW_HIDE
-            cmd = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=stdout,
-                                   stderr=stderr, startupinfo=info)
-        else:
-            cmd = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=stdout,
-                                   stderr=stderr)
+        cmd = self._StartPipe(cmd.format(height=height, width=width, fps=clip.Framerate,
+                              frame_count=clip.Framecount), stdout, stderr)
+        audio_cmd = audio_thread = None
+        if audio:
+            audio_cmd = self._StartPipe(audio.format(**self._AudioPipeVars(audio_clip,
+                                        audio_end - audio_start)), stdout, stderr)
+            audio_stop = threading.Event()
+            audio_result = []
+            audio_thread = threading.Thread(target=self._WriteAudio, name='AudioPipe',
+                args=(audio_clip, audio_cmd.stdin, audio_format, audio_start, audio_end),
+                kwargs=dict(stop=audio_stop, result=audio_result))
+            audio_thread.daemon = True
+            audio_thread.start()
+        def result(returncode=None):
+            if audio_cmd is not None:
+                if returncode != 1:
+                    audio_thread.join()
+                    if audio_result == [True]:
+                        audio_cmd.stdin.close()
+                    else:
+                        if audio_clip.audio_error_message:
+                            self.MacroMsgBox(audio_clip.audio_error_message, _('Error'))
+                        returncode = 1
+                if returncode == 1:
+                    audio_stop.set()
+                    for process in (cmd, audio_cmd):
+                        if process.poll() is None:
+                            process.terminate()
+                elif wait:
+                    returncode = cmd.wait() or audio_cmd.wait()
+                if wait:
+                    return (cmd, audio_cmd), returncode
+                return cmd, audio_cmd
+            if returncode == 1:
+                cmd.terminate()
+            elif wait:
+                returncode = cmd.wait()
+            if wait:
+                return cmd, returncode
+            return cmd
 
-        # Pipe the data and wait for the process to finish
+        # Pipe the data and wait for the process to finish.  The frames are
+        # written from another thread while the next ones are being rendered
+        export = writer = None
         try:
             if y4m:
-                if isinstance(y4m, dict):
-                    y4m_frame = y4m.pop('X_frame', True)
-                    if 'X_stream' in y4m:
-                        y4m['X'] = y4m.pop('X_stream')
-                    cmd.stdin.write(clip.Y4MHeader(**y4m))
-                else:
-                    y4m_frame = True
-                    cmd.stdin.write(clip.Y4MHeader())
+                y4m = dict(y4m) if isinstance(y4m, dict) else {}
+                y4m_frame = y4m.pop('X_frame', True)
+                if 'X_stream' in y4m:
+                    y4m['X'] = y4m.pop('X_stream')
+                if bit_depth:
+                    y4m.setdefault('depth', int(bit_depth[1:]))
+                    y4m.setdefault('width', width)
+                    y4m.setdefault('height', height)
+                cmd.stdin.write(clip.Y4MHeader(**y4m))
             else:
                 y4m_frame = False
+            if workers != 1:
+                export = pyavs_export.ParallelExport(text, filename, workdir, frames, workers,
+                        buffer_frames=self.options['exportbuffer'], y4m_header=y4m_frame,
+                        bit_depth=bit_depth, reorder_rgb=reorder_rgb, interlaced=self.interlaced)
+                rendered = iter(export)
+            writer = pyavs_export.PipeWriter(cmd.stdin)
             for i, frame in enumerate(frames):
                 if not callback or callback(i, frame, total_frames):
-                    buf = clip.RawFrame(frame, y4m_frame)
-                    error = clip.clip.get_error()
-                    if not error:
-                        cmd.stdin.write(buf)
+                    if export is None:
+                        chunks = clip.RawFrameChunks(frame, y4m_frame, bit_depth=bit_depth)
+                        error = clip.clip.get_error()
+                    else:
+                        buf = next(rendered, (None, None))[1]
+                        chunks = None if buf is None else [buf]
+                        error = export.error_message
+                    if chunks is not None:
+                        writer.Write(chunks)
                         continue
                     else:
                         self.MacroMsgBox(u'\n\n'.join((_('Error requesting frame {number}').
-                                         format(number=frame), error)), _('Error'))
-                cmd.terminate()
-                if wait:
-                    return cmd, 1
-                return cmd
+                                         format(number=frame), error or '')), _('Error'))
+                writer.Stop()
+                return result(1)
+            writer.Close()
             cmd.stdin.close()
             if callback and not callback(total_frames, frame, total_frames):
-                cmd.terminate()
-                if wait:
-                    return cmd, 1
-                return cmd
+                return result(1)
+            return result()
+        except Exception, err:
+            for process in (cmd, audio_cmd):
+                try:
+                    if process is not None and process.poll() is None:
+                        process.terminate()
+                except: pass
+            raise err
+        finally:
+            if writer is not None:
+                writer.Stop()
+            if export is not None:
+                export.Stop()
+            if audio_thread is not None:
+                audio_stop.set()
+
+    # Don't use decorator on this one
+    def MacroPipeAudio(self, cmd, text=None, format='wav', start=0, end=None, wait=False, callback=None, stdout=None, stderr=None):
+        r"""PipeAudio(cmd, text=None, format='wav', start=0, end=None, wait=False, callback=None, stdout=None, stderr=None)
+
+        Pipe the audio of a script to an external application
+
+        cmd: right side of the pipe (Unicode string). Accepts several variables:
+             {rate}, {channels}, {bits}, {samples} and {sample_format}, the
+             sample format as named by FFmpeg for raw PCM, e.g. 's16le' or 'f32le'.
+        text : script evaluated.  Defaults to the script in the current tab.  It
+               can also be a path to an AviSynth script.
+        format: 'wav', 'w64' or 'raw'.  WAV sizes are limited to 4 GB, the header
+                of longer audio says 4 GB.  Sony Wave64 ('w64') doesn't have that
+                limit.  'raw' sends only the interleaved samples.
+        start, end: range of samples to send, 'end' excluded.  Defaults to all.
+        wait: wait for the process to finish.  If False, return the Popen object.
+              If True, return a tuple (Popen object, return code).  The return code
+              is 1 if the user cancels.
+        callback: user function called before each block of samples is sent and
+                  after all of them are piped.  It receives the number of samples
+                  sent and the total, and must return True to keep piping, False
+                  to cancel.
+        stdout: file object where redirect stdout.  Defaults to sys.stdout on __debug__,
+                nowhere otherwise.
+        stderr: file object where redirect stderr.  Defaults to stdout.
+
+        The audio is read in blocks of about 1 MB, so long clips are not loaded
+        into memory.
+
+        """
+        if format not in ('wav', 'w64', 'raw'):
+            raise ValueError('Invalid audio format: {0}'.format(format))
+        text, filename, workdir = self.GetExportSource(text)
+        clip = self._GetAudioClip(text, filename, workdir)
+        if clip is None:
+            return
+        start = max(0, start)
+        end = clip.Audiolength if end is None else min(end, clip.Audiolength)
+        cmd = self._StartPipe(cmd.format(**self._AudioPipeVars(clip, end - start)),
+                              stdout, stderr)
+        try:
+            if self._WriteAudio(clip, cmd.stdin, format, start, end, callback):
+                cmd.stdin.close()
+                if not callback or callback(end - start, end - start):
+                    if wait:
+                        return cmd, cmd.wait()
+                    return cmd
+            elif clip.audio_error_message:
+                self.MacroMsgBox(clip.audio_error_message, _('Error'))
+            cmd.terminate()
             if wait:
-                return cmd, cmd.wait()
+                return cmd, 1
             return cmd
         except Exception, err:
             try:
@@ -13210,6 +13892,132 @@ class MainFrame(AppFrame):
             except: pass
             raise err
 
+    def _GetAudioClip(self, text, filename, workdir):
+        """Evaluate a script for reading its audio, show a message on error"""
+        clip = pyavs.AvsClip(text, filename, workdir, display_clip=False, frame_cache_size=0)
+        if not clip.initialized or clip.IsErrorClip():
+            self.MacroMsgBox(u'\n\n'.join((_('Error loading the script'), clip.error_message)),
+                             _('Error'))
+            return
+        if not clip.HasAudio:
+            self.MacroMsgBox(_('The clip has no audio'), _('Error'))
+            return
+        return clip
+
+    @staticmethod
+    def _AudioPipeVars(clip, samples):
+        return dict(rate=clip.Audiorate, channels=clip.Audiochannels, bits=clip.Audiobits,
+                    samples=samples, sample_format=clip.AudioFormat())
+
+    @staticmethod
+    def _WriteAudio(clip, stream, format, start, end, callback=None, stop=None, result=None):
+        """Write a header and the audio from sample 'start' to 'end' to a file object
+
+        Return True if all the samples were written.  It can be cancelled by
+        callback(samples written, total) or by setting 'stop', a threading.Event.
+        If 'result' is a list, the return value is appended to it, and any
+        exception is taken as a False return value.
+
+        """
+        try:
+            total = end - start
+            stream.write(clip.AudioHeader(format, total))
+            sample_size = clip.Audiochannels * clip.Audiobits // 8
+            done = 0
+            for block in clip.AudioBlocks(start, end):
+                if stop is not None and stop.is_set():
+                    break
+                if callback and not callback(done, total):
+                    break
+                stream.write(block)
+                done += len(block) // sample_size
+            ok = done == total
+        except Exception:
+            if result is None:
+                raise
+            ok = False
+        if result is not None:
+            result.append(ok)
+        return ok
+
+    def _StartPipe(self, cmd, stdout=None, stderr=None):
+        """Start a command line reading from a pipe, return the Popen object"""
+        cmd = cmd.encode(encoding)
+        cmd = shlex.split(cmd)
+        if stdout is None:
+            stdout = sys.stdout if __debug__ else subprocess.PIPE
+        if stderr is None:
+            stderr = subprocess.STDOUT
+        if os.name == 'nt':
+            info = subprocess.STARTUPINFO()
+            try:
+                info.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                info.wShowWindow = subprocess.SW_HIDE
+            except AttributeError:
+                import _subprocess
+                info.dwFlags |= _subprocess.STARTF_USESHOWWINDOW
+                info.wShowWindow = _subprocess.SW_HIDE
+            return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=stdout,
+                                    stderr=stderr, startupinfo=info)
+        return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=stdout,
+                                stderr=stderr)
+
+    def MacroRenderFrames(self, frames, text=None, rgb=False, bit_depth=None, workers=None):
+        r"""RenderFrames(frames, text=None, rgb=False, bit_depth=None, workers=None)
+
+        Render several frames in parallel, each worker process with its own AviSynth
+        environment.  Returns an iterable of (frame number, data) tuples, in the
+        order of 'frames'.  If the iteration stops early, its 'error_message' and
+        'error_frame' attributes tell why.
+
+        frames: sequence of frame numbers.
+        text: script evaluated.  Defaults to the script in the current tab.  It
+              can also be a path to an AviSynth script.
+        rgb: return top-down RGB24 data, converted with the current preview
+             matrix, instead of the raw frame data.
+        bit_depth: 's10', 's16', 'i10' or 'i16' to decode a stacked or interleaved
+                   clip to little-endian 16-bit samples.  Raw data only.
+        workers: number of processes.  Defaults to the 'Export worker processes'
+                 setting, 0 means one per CPU and 1 renders the frames one at a
+                 time.
+
+        """
+        text, filename, workdir = self.GetExportSource(text)
+        if workers is None:
+            workers = self.options['exportworkers']
+        matrix = self.currentScript.AVI.matrix if self.currentScript.AVI else 'Rec601'
+        return pyavs_export.ParallelExport(text, filename, workdir, frames,
+                workers, buffer_frames=self.options['exportbuffer'],
+                mode='rgb' if rgb else 'raw', bit_depth=None if rgb else bit_depth,
+                matrix=matrix, interlaced=self.interlaced)
+
+    def GetExportSource(self, text=None):
+        """Return the (text, filename, workdir) of a script for the export macros
+
+        'text' defaults to the script in the current tab.  It can also be a path
+        to an AviSynth script.
+
+        """
+        workdir_exp = self.ExpandVars(self.options['workdir'])
+        if (self.options['useworkdir'] and self.options['alwaysworkdir']
+            and os.path.isdir(workdir_exp)):
+                workdir = workdir_exp
+        else:
+            workdir = self.currentScript.workdir if text is None else ''
+        if text is None:
+            text = self.currentScript.GetScriptTags().text
+            filename = self.currentScript.filename
+            # vpy hack, remove when VapourSynth is supported
+            if os.name == 'nt' and filename.endswith('.vpy'):
+                self.SaveScript(filename)
+        else:
+            if os.path.isfile(text):
+                filename = text
+                text = self.GetTextFromFile(text)[0]
+            else:
+                filename = 'AVS script'
+        return text, filename, workdir
+
     @AsyncCallWrapper
     def MacroGetBookmarkFrameList(self, title=False):
         r'''GetBookmarkList(title=False)
@@ -13307,6 +14115,115 @@ class MainFrame(AppFrame):
         if clear_historic:
             self.OnMenuVideoBookmarkClearHistory(start=start, end=end)
 
+    # Don't use decorator on this one
+    def MacroSceneChanges(self, threshold=None, hist_threshold=None, start=0, end=None,
+                          min_length=None, bookmark=True):
+        r'''SceneChanges(threshold=None, hist_threshold=None, start=0, end=None, min_length=None, bookmark=True)
+
+        Returns the list of frames in the range [start, end] that start a new
+        scene in the current script, bookmarking them if 'bookmark' is True.
+        A frame is a scene change if the mean luma difference with the previous
+        frame is at least 'threshold' (0-255) and, if given, the difference
+        between their luma histograms is at least 'hist_threshold' (0-1).
+        Changes closer than 'min_length' frames to the previous one are
+        skipped.  Arguments set to None take the value from the program
+        options.  The frames are measured only the first time; calling this
+        function again with other thresholds returns at once.  Returns None
+        on error.
+
+        '''
+        script = AsyncCall(getattr, self, 'currentScript').Wait()
+        index = AsyncCall(self.GetScriptSceneIndex, script).Wait()
+        if index is None:
+            return
+        index.Scan(start, end)
+        index.Wait()
+        if index.error_message:
+            AsyncCall(wx.MessageBox, index.error_message, _('Error'),
+                      style=wx.OK|wx.ICON_ERROR).Wait()
+            return
+        if threshold is None:
+            threshold = self.options['scenethreshold']
+        if hist_threshold is None:
+            hist_threshold = self.options['scenehistthreshold'] / 100.0 or None
+        if min_length is None:
+            min_length = self.options['sceneminlength']
+        scenes = index.SceneChanges(threshold, hist_threshold, start, end, min_length)
+        if bookmark:
+            AsyncCall(self.AddFrameBookmarkList, scenes).Wait()
+        return scenes
+
+    def _ScanFrameHashes(self, start, end):
+        '''Hash the frames of the current script in [start, end], return the index'''
+        script = AsyncCall(getattr, self, 'currentScript').Wait()
+        index = AsyncCall(self.GetScriptFrameHashes, script).Wait()
+        if index is None:
+            return
+        index.Scan(start, end)
+        index.Wait()
+        if index.error_message:
+            AsyncCall(wx.MessageBox, index.error_message, _('Error'),
+                      style=wx.OK|wx.ICON_ERROR).Wait()
+            AsyncCall(self.StopScriptFrameHashes, script).Wait()
+            return
+        return index
+
+    # Don't use decorator on this one
+    def MacroSimilarFrames(self, frame=None, distance=4, start=0, end=None, bookmark=False):
+        r'''SimilarFrames(frame=None, distance=4, start=0, end=None, bookmark=False)
+
+        Returns the list of frames in the range [start, end] that look like
+        'frame' (the current frame if None), optionally bookmarking them.
+        Each frame is reduced to a 64-bit perceptual hash, and frames are
+        similar if their hashes differ in at most 'distance' bits.  The hashes
+        are computed in the background by the export worker processes, only
+        the first time they're needed.  Returns None on error.
+
+        '''
+        if frame is None:
+            frame = self.GetFrameNumber()
+        index = self._ScanFrameHashes(start, end)
+        if index is None:
+            return
+        if not index.IsComplete(frame, frame):
+            index = self._ScanFrameHashes(frame, frame)
+            if index is None:
+                return
+        frames = index.Similar(frame, distance, start, end)
+        if bookmark:
+            AsyncCall(self.AddFrameBookmarkList, frames).Wait()
+        return frames
+
+    # Don't use decorator on this one
+    def MacroDuplicateFrames(self, start=0, end=None, distance=0, min_length=2, select=True):
+        r'''DuplicateFrames(start=0, end=None, distance=0, min_length=2, select=True)
+
+        Returns the runs of repeated frames in the range [start, end] as a list
+        of (first, last) tuples.  A run has at least 'min_length' consecutive
+        frames, each one with a perceptual hash that differs in at most
+        'distance' bits from the previous one.  If 'select' is True the runs
+        are added as selections to the video slider.  The hashes are computed
+        in the background by the export worker processes, only the first time
+        they're needed.  Returns None on error.
+
+        '''
+        index = self._ScanFrameHashes(start, end)
+        if index is None:
+            return
+        runs = index.Duplicates(start, end, distance, min_length)
+        if select and runs:
+            AsyncCall(self.SetSliderSelections, runs).Wait()
+        return runs
+
+    def SetSliderSelections(self, selections):
+        '''Add (start, end) selections to the video slider'''
+        if not self.trimDialog.IsShown():
+            self.OnMenuVideoTrimEditor(None)
+        for i, (start, end) in enumerate(selections):
+            self.AddFrameBookmark(start, bmtype=1, toggle=False, refreshProgram=False)
+            self.AddFrameBookmark(end, bmtype=2, toggle=False,
+                                  refreshProgram=i == len(selections) - 1)
+
     @AsyncCallWrapper
     def MacroGetSliderSelections(self):
         r'''GetSelectionList()
@@ -13504,12 +14421,20 @@ class MainFrame(AppFrame):
             self.__doc__ += parent.FormatDocstring(self.GetVideoFramecount)
             self.GetPixelInfo = parent.MacroGetPixelInfo
             self.__doc__ += parent.FormatDocstring(self.GetPixelInfo)
+            self.GetVideoPlanes = parent.MacroGetVideoPlanes
+            self.__doc__ += parent.FormatDocstring(self.GetVideoPlanes)
+            self.GetVideoRegion = parent.MacroGetVideoRegion
+            self.__doc__ += parent.FormatDocstring(self.GetVideoRegion)
             self.GetVar = parent.MacroGetVar
             self.__doc__ += parent.FormatDocstring(self.GetVar)
             self.RunExternalPlayer = parent.MacroRunExternalPlayer
             self.__doc__ += parent.FormatDocstring(self.RunExternalPlayer)
             self.Pipe = parent.MacroPipe
             self.__doc__ += parent.FormatDocstring(self.Pipe)
+            self.PipeAudio = parent.MacroPipeAudio
+            self.__doc__ += parent.FormatDocstring(self.PipeAudio)
+            self.RenderFrames = parent.MacroRenderFrames
+            self.__doc__ += parent.FormatDocstring(self.RenderFrames)
             self.SaveImage = parent.MacroSaveImage
             self.__doc__ += parent.FormatDocstring(self.SaveImage)
             # Bookmarks
@@ -13519,6 +14444,12 @@ class MainFrame(AppFrame):
             self.__doc__ += parent.FormatDocstring(self.SetBookmark)
             self.ClearBookmarks = parent.MacroClearBookmarks
             self.__doc__ += parent.FormatDocstring(self.ClearBookmarks)
+            self.SceneChanges = parent.MacroSceneChanges
+            self.__doc__ += parent.FormatDocstring(self.SceneChanges)
+            self.SimilarFrames = parent.MacroSimilarFrames
+            self.__doc__ += parent.FormatDocstring(self.SimilarFrames)
+            self.DuplicateFrames = parent.MacroDuplicateFrames
+            self.__doc__ += parent.FormatDocstring(self.DuplicateFrames)
             self.GetSelectionList = parent.MacroGetSliderSelections
             self.__doc__ += parent.FormatDocstring(self.GetSelectionList)
             # Miscellaneous
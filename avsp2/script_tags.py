@@ -0,0 +1,149 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# script_tags - user sliders and toggle tags of AviSynth scripts
+#
+# ScanScriptTags goes once over the text of a script and returns, as a
+# ScriptTags, the text AviSynth is given, with the sliders replaced by their
+# values and the toggle tags removed, along with the sliders and toggle tags
+# found outside of # comments.  Toggle tags are paired with a stack, so the
+# scan takes linear time however many tags there are.
+#
+#     [<"label", min, max, value>]    user slider
+#     [<"separator">]                 slider separator
+#     [name=0] text [/name]           toggle tag, the text is kept unless 0
+#
+# Dependencies:
+#     Python (tested on v2.7)
+
+import re
+
+SLIDER_OPEN = '[<'
+SLIDER_CLOSE = '>]'
+
+_TOKEN = re.compile(r'''
+    (?P<slider>\[<.*?>\])
+  | (?P<endtag>\[/(?P<endname>[^\]\n]*)\])
+  | (?P<starttag>\[(?P<name>[^\]\n=/<*][^\]\n=]*?)\s*(?:=(?P<value>[^\]\n]*))?\])
+  | (?P<comment>\#)
+  | (?P<newline>\n)
+''', re.VERBOSE)
+
+
+def SliderValue(text):
+    '''Return what a slider is replaced with in the text given to AviSynth'''
+    items = text.lstrip(SLIDER_OPEN).rstrip(SLIDER_CLOSE).split(',')
+    if len(items) == 4:
+        return items[3].strip()
+    elif len(items) == 1 and 'separator' in items[0]:
+        return ''
+    return text
+
+
+def SliderProperties(text):
+    '''Return the (label, min, max) of a slider, or None for a separator'''
+    items = [s.strip() for s in text.lstrip(SLIDER_OPEN).rstrip(SLIDER_CLOSE).split(',')]
+    if len(items) == 4:
+        return items[0], items[1], items[2]
+
+
+class ScriptTags(object):
+    '''The result of ScanScriptTags
+
+    text             the text with the sliders and toggle tags cleaned
+    sliderTexts      the sliders, as written, not counting the ones in a
+                     disabled toggle tag
+    sliderProperties SliderProperties of each slider
+    toggleTags       (name, enabled) of each toggle tag, in the order of the
+                     end tags
+    toggleTagSpans   (start, end) of each toggle tag in the original text
+    '''
+
+    __slots__ = ('text', 'sliderTexts', 'sliderProperties', 'toggleTags', 'toggleTagSpans')
+
+    def __init__(self, text, sliderTexts, toggleTags, toggleTagSpans):
+        self.text = text
+        self.sliderTexts = sliderTexts
+        self.sliderProperties = [SliderProperties(slider) for slider in sliderTexts]
+        self.toggleTags = toggleTags
+        self.toggleTagSpans = toggleTagSpans
+
+
+def ScanScriptTags(text, sliders=True):
+    '''Find the sliders and toggle tags of a script in one pass
+
+    Returns a ScriptTags.  With sliders=False they're left in its text.
+    '''
+    pieces = []
+    sliderTexts = [] # (index in pieces, slider)
+    toggleTags = []
+    toggleTagSpans = []
+    stack = [] # (lowercase name, enabled, index in pieces, start, in a comment)
+    comment = False
+    pos = 0
+    for match in _TOKEN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'newline':
+            comment = False
+            continue
+        if kind == 'comment':
+            comment = True
+            continue
+        pieces.append(text[pos:match.start()])
+        pos = match.end()
+        token = match.group()
+        if kind == 'slider':
+            if not comment:
+                sliderTexts.append((len(pieces), token))
+            pieces.append(SliderValue(token) if sliders else token)
+        elif kind == 'starttag':
+            enabled = True
+            value = match.group('value')
+            if value is not None and '=' not in value:
+                try:
+                    enabled = bool(int(value))
+                except ValueError:
+                    pass
+            stack.append((match.group('name').lower(), enabled, len(pieces),
+                          match.start(), comment))
+            pieces.append(token)
+        else:
+            name = match.group('endname')
+            lowercase_name = name.lower()
+            for i in xrange(len(stack) - 1, -1, -1):
+                if stack[i][0] == lowercase_name:
+                    break
+            else: # no start tag, keep it as text
+                pieces.append(token)
+                continue
+            enabled, index, start, start_comment = stack[i][1:]
+            del stack[i:]
+            if enabled:
+                pieces[index] = ''
+            else:
+                del pieces[index:]
+                while sliderTexts and sliderTexts[-1][0] >= index:
+                    sliderTexts.pop()
+            if not (comment or start_comment):
+                toggleTags.append((name, enabled))
+                toggleTagSpans.append((start, match.end()))
+    pieces.append(text[pos:])
+    return ScriptTags(''.join(pieces), [slider for index, slider in sliderTexts],
+                      toggleTags, toggleTagSpans)
@@ -223,12 +223,17 @@ class SliderPlus(wx.Panel):
             self.wH += 4
         self.selections = None
         self.selmode = 0
+        self.waveform = None
+        self.thumbnails = None
+        self.thumbnailPopup = None
+        self.hoverValue = None
         self._DefineBrushes()
         # Event binding
         self.Bind(wx.EVT_PAINT, self._OnPaint)
         self.Bind(wx.EVT_SIZE, self._OnSize)
         self.Bind(wx.EVT_LEFT_DOWN, self._OnLeftDown)
         self.Bind(wx.EVT_MOTION, self._OnMouseMotion)
+        self.Bind(wx.EVT_LEAVE_WINDOW, self._OnLeaveWindow)
         self.Bind(wx.EVT_LEFT_UP, self._OnLeftUp)
         self.Bind(wx.EVT_MOUSEWHEEL, self._OnMouseWheel)
         self.Bind(wx.EVT_KEY_DOWN, self._OnKeyDown)
@@ -271,6 +276,7 @@ class SliderPlus(wx.Panel):
 
     def _OnLeftDown(self, event):
         self.app.lastshownframe = self.app.paintedframe
+        self.HideThumbnail()
         mousepos = event.GetPosition()
         x, y, w, h = self.GetRect()
         #~ pixelpos = int(self.value * (w-2*self.xo) / float(self.maxValue - self.minValue))
@@ -302,6 +308,15 @@ class SliderPlus(wx.Panel):
         event.Skip()
 
     def _OnMouseMotion(self, event):
+        if self.thumbnails is not None and not self.HasCapture():
+            x, y, w, h = self.GetRect()
+            xmouse = event.GetPosition().x
+            if self.xo <= xmouse <= w - self.xo:
+                self.hoverValue = int(round((xmouse-self.xo) * (self.maxValue - self.minValue) / float(w-2*self.xo)))
+                self.hoverValue = max(min(self.hoverValue, self.maxValue), self.minValue)
+                self.RefreshThumbnail()
+            else:
+                self.HideThumbnail()
         if event.Dragging() and event.LeftIsDown() and self.HasCapture():
             x, y, w, h = self.GetRect()
             xmouse, ymouse = event.GetPosition()
@@ -384,6 +399,10 @@ class SliderPlus(wx.Panel):
         event.SetEventObject(self)
         self.GetEventHandler().ProcessEvent(event)
 
+    def _OnLeaveWindow(self, event):
+        self.HideThumbnail()
+        event.Skip()
+
     def _OnSize(self, event):
         if self.IsDoubleBuffered():
             dc = wx.ClientDC(self)
@@ -428,6 +447,15 @@ class SliderPlus(wx.Panel):
                 pixelstart = int(start * wB / float(self.maxValue - self.minValue)) + self.xo
                 pixelstop = int(stop * wB / float(self.maxValue - self.minValue)) + self.xo
                 dc.DrawRectangle(pixelstart, yB, pixelstop - pixelstart, hB)
+        # Then draw the audio waveform
+        if self.waveform is not None and wB > 0:
+            peaks = self.waveform(wB)
+            if peaks is not None:
+                dc.SetPen(self.penShadow if boolEnabled else self.penGrayText)
+                yMid, hHalf = yB + hB / 2.0, (hB - 4) / 2.0
+                lines = [(xB + i, int(yMid - hi * hHalf), xB + i, int(yMid - lo * hHalf) + 1)
+                         for i, (lo, hi) in enumerate(peaks) if hi > lo]
+                dc.DrawLineList(lines)
         # Then draw the bookmark triangles
         dc.SetPen(self.penWindowBackground)
         if boolEnabled:
@@ -611,6 +639,58 @@ class SliderPlus(wx.Panel):
             self._PaintSlider(dc)
         return True
 
+    def SetWaveform(self, getter, refresh=True):
+        '''Draw an audio waveform in the bar
+
+        getter(width) must return a list of (min, max) pairs in the range
+        -1..1, one per pixel of the bar from minValue to maxValue, or None if
+        there's nothing to draw.  None removes the waveform.
+        '''
+        self.waveform = getter
+        if refresh:
+            self.Refresh()
+
+    def SetThumbnails(self, getter):
+        '''Show a thumbnail of the frame under the mouse pointer
+
+        getter(value) must return a (wx.Bitmap, value) tuple with the
+        thumbnail of the value or of a nearby one, or None if there isn't any
+        yet.  None disables the thumbnails.
+        '''
+        self.thumbnails = getter
+        if getter is None:
+            self.HideThumbnail()
+
+    def RefreshThumbnail(self):
+        '''Call the thumbnail getter again for the value under the mouse pointer'''
+        if self.thumbnails is None or self.hoverValue is None or not hasattr(wx, 'PopupWindow'):
+            return
+        thumbnail = self.thumbnails(self.hoverValue)
+        if thumbnail is None:
+            self.HideThumbnail(forget=False)
+            return
+        if self.thumbnailPopup is None:
+            self.thumbnailPopup = ThumbnailPopup(self)
+        bitmap, value = thumbnail
+        x, y, w, h = self.GetRect()
+        xpos = int(self.hoverValue * (w-2*self.xo) / float(self.maxValue - self.minValue)) + self.xo
+        self.thumbnailPopup.SetThumbnail(bitmap, value)
+        pw, ph = self.thumbnailPopup.GetSize()
+        left, top = self.ClientToScreen((xpos - pw/2, -ph - 2))
+        display = wx.Display(max(0, wx.Display.GetFromWindow(self))).GetClientArea()
+        left = max(display.x, min(left, display.x + display.width - pw))
+        if top < display.y:
+            top = self.ClientToScreen((0, h + 2))[1]
+        self.thumbnailPopup.Position((left, top), (0, 0))
+        if not self.thumbnailPopup.IsShown():
+            self.thumbnailPopup.Show()
+
+    def HideThumbnail(self, forget=True):
+        if forget:
+            self.hoverValue = None
+        if self.thumbnailPopup is not None and self.thumbnailPopup.IsShown():
+            self.thumbnailPopup.Hide()
+
     def SetBookmark(self, value, bmtype=0, refresh=True):
         # Type=0: bookmark, Type=1: selection start, Type=2: selection end
         if bmtype not in (0,1,2):
@@ -665,6 +745,19 @@ class SliderPlus(wx.Panel):
             self._PaintSlider(dc)
         return True
 
+    def RefreshBookmarks(self):
+        # Update the selections and repaint after SetBookmark(refresh=False)
+        if self.bookmarks:
+            self.selections = self._createSelections()
+        else:
+            self.selections = None
+        if self.IsDoubleBuffered():
+            dc = wx.ClientDC(self)
+        else:
+            dc = wx.BufferedDC(wx.ClientDC(self))
+        dc.Clear()
+        self._PaintSlider(dc)
+
     def GetBookmarks(self, copy=False):
         if not copy:
             return self.bookmarks
@@ -738,6 +831,41 @@ class SliderPlus(wx.Panel):
         return rectHandle.Inside(mousepos)
 
 
+if hasattr(wx, 'PopupWindow'):
+    class ThumbnailPopup(wx.PopupWindow):
+        """
+        Popup window with a frame thumbnail and its frame number
+        """
+        def __init__(self, parent):
+            wx.PopupWindow.__init__(self, parent)
+            self.bitmap = None
+            self.label = ''
+            self.Bind(wx.EVT_PAINT, self._OnPaint)
+
+        def SetThumbnail(self, bitmap, value):
+            self.bitmap = bitmap
+            self.label = str(value)
+            dc = wx.ClientDC(self)
+            dc.SetFont(wx.SystemSettings.GetFont(wx.SYS_DEFAULT_GUI_FONT))
+            self.labelHeight = dc.GetTextExtent(self.label)[1] + 2
+            self.SetSize((bitmap.GetWidth() + 2, bitmap.GetHeight() + self.labelHeight + 2))
+            self.Refresh()
+
+        def _OnPaint(self, event):
+            dc = wx.PaintDC(self)
+            if self.bitmap is None:
+                return
+            w, h = self.GetClientSize()
+            dc.SetPen(wx.BLACK_PEN)
+            dc.SetBrush(wx.Brush(wx.SystemSettings.GetColour(wx.SYS_COLOUR_INFOBK)))
+            dc.DrawRectangle(0, 0, w, h)
+            dc.DrawBitmap(self.bitmap, 1, 1)
+            dc.SetFont(wx.SystemSettings.GetFont(wx.SYS_DEFAULT_GUI_FONT))
+            dc.SetTextForeground(wx.SystemSettings.GetColour(wx.SYS_COLOUR_INFOTEXT))
+            tw = dc.GetTextExtent(self.label)[0]
+            dc.DrawText(self.label, (w - tw) / 2, self.bitmap.GetHeight() + 2)
+
+
 class AvsFilterAutoSliderInfo(wx.Dialog):
     """
     Dialog specifically for AviSynth filter auto-slider information.
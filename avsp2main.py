@@ -39,8 +39,11 @@
 #     icon.py (icons embedded in a Python script)
 #     i18n.py (internationalization and localization)
 #     global_vars.py (application info and other shared variables)
+import multiprocessing
+
 from avsp2.main import main
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # export worker processes on Windows
     print("Executing...")
     main()
\ No newline at end of file
@@ -0,0 +1,1342 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# avisynth_sim - simulated AviSynth backend for running pyavs without AviSynth
+#
+# A pure-Python stand-in for the part of avisynth.py and avisynth_cffi.py used
+# by pyavs, so the frame path can be benchmarked on a box without AviSynth or
+# AvxSynth.  Frames are ctypes buffers laid out like AviSynth's (planes at
+# offsets of a single buffer, rows aligned to 16 bytes, RGB bottom-up), and
+# the pointers handed out are ctypes pointers, which 'ffi.cast' converts as
+# pyavs expects from cffi.  Each clip keeps its last frame, so a filter that
+# reads the same frame of a clip several times, like MergeRGB, renders it
+# once, but there's no cache of several frames like AviSynth's.
+#
+# install() makes 'import avisynth' and 'import avisynth_cffi' load this
+# module, and 'import wx' a minimal headless stand-in if wxPython isn't
+# available.  The benchmarks in this directory that load pyavs use it.  It
+# must be called before importing pyavs:
+#
+#     import avisynth_sim
+#     avisynth_sim.install()
+#     import pyavs
+#     clip = pyavs.AvsClip('SimClip(1920, 1080, "YV12", length=500, cost=5)')
+#
+# Scripts are made of 'name = expression' assignments and expressions, one
+# per line, where an expression is a literal (int, float, $hex, "string",
+# """string""", true, false), a variable or a function call, optionally
+# followed by '.Function(args)' calls.  Named arguments and the implicit
+# 'last' work as in AviSynth, operators and user functions aren't supported.
+#
+# Sources: SimClip(width=640, height=480, pixel_type="YV12", length=1000,
+# fps=24, fps_denominator=1, cost=0.0, border=0, pattern="ramp",
+# audio_rate=48000, channels=2), where 'cost' is the time in ms taken to
+# render each frame (sleeping, without holding the GIL, like a native
+# filter), 'border' the width of a black border around the picture and
+# 'pattern' one of "ramp" (with a box moving on it), "bars" and "blank".
+# Also BlankClip, ColorBars, MessageClip and Version.
+#
+# Filters: ConvertToRGB/RGB24/RGB32/YV12/YV16/YV24/YV411/Y8/YUY2,
+# BilinearResize (and the other resizers, which use point sampling), Crop,
+# Trim, Loop, SelectEvery/Even/Odd, AssumeFPS/BFF/TFF/FrameBased/FieldBased,
+# SwapUV, FlipVertical, ShowRed/Green/Blue, MergeRGB, MergeARGB, Blur and
+# Subtitle (which draws nothing).  Audio is a 16-bit sine wave.
+#
+# Dependencies:
+#     Python (tested on v2.7)
+#     NumPy
+
+import os
+import re
+import sys
+import copy
+import math
+import time
+import types
+import ctypes
+import inspect
+import traceback
+
+import numpy
+
+
+class avs(object):
+    '''The avisynth_c.h constants used by pyavs'''
+
+    AVS_PLANAR_Y = 1 << 0
+    AVS_PLANAR_U = 1 << 1
+    AVS_PLANAR_V = 1 << 2
+
+    AVS_SAMPLE_INT8 = 1 << 0
+    AVS_SAMPLE_INT16 = 1 << 1
+    AVS_SAMPLE_INT24 = 1 << 2
+    AVS_SAMPLE_INT32 = 1 << 3
+    AVS_SAMPLE_FLOAT = 1 << 4
+
+    AVS_CS_BGR = 1 << 28
+    AVS_CS_YUV = 1 << 29
+    AVS_CS_INTERLEAVED = 1 << 30
+    AVS_CS_PLANAR = 1 << 31
+    AVS_CS_VPLANEFIRST = 1 << 3
+    AVS_CS_BGR24 = 1 << 0 | AVS_CS_BGR | AVS_CS_INTERLEAVED
+    AVS_CS_BGR32 = 1 << 1 | AVS_CS_BGR | AVS_CS_INTERLEAVED
+    AVS_CS_YUY2 = 1 << 2 | AVS_CS_YUV | AVS_CS_INTERLEAVED
+    AVS_CS_YV24 = AVS_CS_PLANAR | AVS_CS_YUV | AVS_CS_VPLANEFIRST | 3 << 8 | 3
+    AVS_CS_YV16 = AVS_CS_PLANAR | AVS_CS_YUV | AVS_CS_VPLANEFIRST | 3 << 8
+    AVS_CS_YV12 = AVS_CS_PLANAR | AVS_CS_YUV | AVS_CS_VPLANEFIRST
+    AVS_CS_YV411 = AVS_CS_PLANAR | AVS_CS_YUV | AVS_CS_VPLANEFIRST | 3 << 8 | 1
+    AVS_CS_Y8 = AVS_CS_PLANAR | AVS_CS_INTERLEAVED | AVS_CS_YUV
+
+    AVS_IT_BFF = 1 << 0
+    AVS_IT_TFF = 1 << 1
+    AVS_IT_FIELDBASED = 1 << 2
+
+    AVS_FRAME_ALIGN = 16
+
+
+# pixel_type: (avs value, bytes per pixel of the first plane, bits per pixel,
+#              chroma subsampling as (width, height) shifts or None)
+_FORMATS = {
+    'RGB24': (avs.AVS_CS_BGR24, 3, 24, None),
+    'RGB32': (avs.AVS_CS_BGR32, 4, 32, None),
+    'YUY2': (avs.AVS_CS_YUY2, 2, 16, None),
+    'YV24': (avs.AVS_CS_YV24, 1, 24, (0, 0)),
+    'YV16': (avs.AVS_CS_YV16, 1, 16, (1, 0)),
+    'YV12': (avs.AVS_CS_YV12, 1, 12, (1, 1)),
+    'YV411': (avs.AVS_CS_YV411, 1, 12, (2, 0)),
+    'Y8': (avs.AVS_CS_Y8, 1, 8, None),
+}
+
+
+class AvisynthError(Exception):
+    pass
+
+
+class _FFI(object):
+    '''The part of cffi.FFI used by pyavs, working on ctypes pointers'''
+
+    NULL = None
+
+    def cast(self, ctype, value):
+        address = _Address(value)
+        if ctype == 'void *':
+            return ctypes.c_void_p(address)
+        if ctype.endswith('*'):
+            return ctypes.cast(address, ctypes.POINTER(ctypes.c_ubyte))
+        return address
+
+ffi = _FFI()
+
+
+def _Address(value):
+    '''Return the address of a ctypes pointer or buffer, a c_void_p or an int'''
+    if isinstance(value, (int, long)):
+        return value
+    if isinstance(value, ctypes.c_void_p):
+        return value.value
+    if isinstance(value, ctypes._Pointer):
+        return ctypes.cast(value, ctypes.c_void_p).value
+    return ctypes.addressof(value)
+
+
+class AVS_VideoInfo(object):
+
+    def __init__(self, width=0, height=0, pixel_type='RGB32', num_frames=0,
+                 fps_numerator=24, fps_denominator=1, image_type=0,
+                 audio_samples_per_second=0, num_audio_samples=0, nchannels=0):
+        self.width = width
+        self.height = height
+        self.format = pixel_type
+        self.pixel_type = _FORMATS[pixel_type][0]
+        self.num_frames = num_frames
+        self.fps_numerator = fps_numerator
+        self.fps_denominator = fps_denominator
+        self.image_type = image_type
+        self.audio_samples_per_second = audio_samples_per_second
+        self.sample_type = avs.AVS_SAMPLE_INT16
+        self.num_audio_samples = num_audio_samples
+        self.nchannels = nchannels
+
+    def __str__(self):
+        return '{0}, {1}x{2} {3}, {4} frames'.format(self.__class__, self.width,
+                self.height, self.format, self.num_frames)
+
+    def copy(self, **fields):
+        '''Return a copy with some fields changed, 'format' for the pixel_type'''
+        vi = copy.copy(self)
+        for field, value in fields.iteritems():
+            setattr(vi, field, value)
+        vi.pixel_type = _FORMATS[vi.format][0]
+        return vi
+
+    def has_video(self):
+        return self.width != 0
+
+    def has_audio(self):
+        return self.audio_samples_per_second != 0 and self.num_audio_samples > 0
+
+    def is_rgb(self):
+        return self.format in ('RGB24', 'RGB32')
+
+    def is_rgb24(self):
+        return self.format == 'RGB24'
+
+    def is_rgb32(self):
+        return self.format == 'RGB32'
+
+    def is_yuv(self):
+        return not self.is_rgb()
+
+    def is_yuy2(self):
+        return self.format == 'YUY2'
+
+    def is_yv24(self):
+        return self.format == 'YV24'
+
+    def is_yv16(self):
+        return self.format == 'YV16'
+
+    def is_yv12(self):
+        return self.format == 'YV12'
+
+    def is_yv411(self):
+        return self.format == 'YV411'
+
+    def is_y8(self):
+        return self.format == 'Y8'
+
+    def is_planar(self):
+        return self.format not in ('RGB24', 'RGB32', 'YUY2')
+
+    def is_interleaved(self):
+        return not self.is_planar()
+
+    def is_color_space(self, color_space):
+        return self.pixel_type == color_space
+
+    def is_field_based(self):
+        return bool(self.image_type & avs.AVS_IT_FIELDBASED)
+
+    def is_parity_known(self):
+        return bool(self.image_type & (avs.AVS_IT_BFF | avs.AVS_IT_TFF))
+
+    def is_bff(self):
+        return bool(self.image_type & avs.AVS_IT_BFF)
+
+    def is_tff(self):
+        return bool(self.image_type & avs.AVS_IT_TFF)
+
+    def _Subsampling(self, plane, index):
+        if plane == avs.AVS_PLANAR_Y:
+            return 0
+        if self.is_y8():
+            raise AvisynthError('Filter error: plane subsampling not available '
+                                'on Y8 pixel type.')
+        if self.is_yuy2():
+            return (1, 0)[index]
+        if not self.is_planar():
+            raise AvisynthError('Filter error: plane subsampling called with '
+                                'unsupported pixel type.')
+        return _FORMATS[self.format][3][index]
+
+    def get_plane_width_subsampling(self, plane):
+        return self._Subsampling(plane, 0)
+
+    def get_plane_height_subsampling(self, plane):
+        return self._Subsampling(plane, 1)
+
+    def bits_per_pixel(self):
+        return _FORMATS[self.format][2]
+
+    def bytes_from_pixels(self, pixels):
+        return pixels * _FORMATS[self.format][1]
+
+    def row_size(self):
+        return self.bytes_from_pixels(self.width)
+
+    def bmp_size(self):
+        return self.bits_per_pixel() * self.width * self.height >> 3
+
+    def samples_per_second(self):
+        return self.audio_samples_per_second
+
+    def bytes_per_channel_sample(self):
+        return 2
+
+    def bytes_per_audio_sample(self):
+        return 2 * self.nchannels
+
+    def audio_samples_from_frames(self, frames):
+        if not self.fps_numerator:
+            return 0
+        return (frames * self.audio_samples_per_second * self.fps_denominator //
+                self.fps_numerator)
+
+    def frames_from_audio_samples(self, samples):
+        if not self.audio_samples_per_second:
+            return 0
+        return (samples * self.fps_numerator // self.fps_denominator //
+                self.audio_samples_per_second)
+
+    def audio_channels(self):
+        return self.nchannels
+
+
+class AVS_VideoFrame(object):
+    '''A frame: (offset, pitch, row size, height) of each plane in a buffer
+
+    Frames made by Crop or SwapUV share the buffer of the source frame.
+    '''
+
+    def __init__(self, buf, planes):
+        self.buf = buf
+        self.planes = planes
+
+    def _Plane(self, plane):
+        return self.planes.get(plane, (self.planes[avs.AVS_PLANAR_Y][0], 0, 0, 0))
+
+    def get_pitch(self, plane=avs.AVS_PLANAR_Y):
+        return self._Plane(plane)[1]
+
+    def get_row_size(self, plane=avs.AVS_PLANAR_Y):
+        return self._Plane(plane)[2]
+
+    def get_height(self, plane=avs.AVS_PLANAR_Y):
+        return self._Plane(plane)[3]
+
+    def get_offset(self, plane=avs.AVS_PLANAR_Y):
+        return self._Plane(plane)[0]
+
+    def get_read_ptr(self, plane=avs.AVS_PLANAR_Y):
+        return ctypes.cast(ctypes.addressof(self.buf) + self._Plane(plane)[0],
+                           ctypes.POINTER(ctypes.c_ubyte))
+
+    get_write_ptr = get_read_ptr
+
+    def is_writable(self):
+        return True
+
+
+def _NewFrame(vi, align=avs.AVS_FRAME_ALIGN):
+    '''Return a new frame for a video info, with uninitialized planes'''
+    row_size = vi.row_size()
+    layout = [(avs.AVS_PLANAR_Y, row_size, vi.height)]
+    if vi.is_planar() and not vi.is_y8():
+        sub_width, sub_height = _FORMATS[vi.format][3]
+        for plane in (avs.AVS_PLANAR_V, avs.AVS_PLANAR_U):
+            layout.append((plane, row_size >> sub_width, vi.height >> sub_height))
+    planes = {}
+    size = 0
+    for plane, row_size, height in layout:
+        pitch = (row_size + align - 1) // align * align
+        planes[plane] = (size, pitch, row_size, height)
+        size += pitch * height
+    return AVS_VideoFrame((ctypes.c_ubyte * size)(), planes)
+
+
+def _Planes(frame, vi):
+    '''Return writable arrays over the planes of a frame
+
+    Planar formats get a (rows, columns) array per plane, RGB a single
+    (rows, columns, bytes per pixel) bottom-up array and YUY2 a single
+    (rows, columns / 2, 4) array of Y0 U Y1 V samples.
+    '''
+    arrays = []
+    for plane in (avs.AVS_PLANAR_Y, avs.AVS_PLANAR_U, avs.AVS_PLANAR_V):
+        if plane not in frame.planes:
+            break
+        offset, pitch, row_size, height = frame.planes[plane]
+        if vi.is_rgb() or vi.is_yuy2():
+            step = 4 if vi.is_yuy2() else _FORMATS[vi.format][1]
+            shape, strides = (height, row_size // step, step), (pitch, step, 1)
+        else:
+            shape, strides = (height, row_size), (pitch, 1)
+        arrays.append(numpy.ndarray(shape, numpy.uint8, frame.buf, offset, strides))
+    return arrays
+
+
+def _Matrix(matrix):
+    '''Return (Kr, Kb, TV levels) for an AviSynth matrix name'''
+    matrix = matrix or 'Rec601'
+    kr, kb = (0.2126, 0.0722) if matrix.endswith('709') else (0.299, 0.114)
+    return kr, kb, not matrix.upper().startswith('PC')
+
+
+_YUV_TABLES = {}
+
+def _YUVTables(matrix):
+    '''Return the lookup tables of _YUVToRGB, in 1/64 units'''
+    if matrix not in _YUV_TABLES:
+        kr, kb, tv = _Matrix(matrix)
+        kg = 1 - kr - kb
+        values = numpy.arange(256, dtype=numpy.float64)
+        y = (values - 16) * (255 / 219.0) if tv else values
+        c = (values - 128) * (255 / 224.0 if tv else 1)
+        terms = (y + 0.5, 2 * (1 - kr) * c, -2 * (1 - kb) * kb / kg * c,
+                 -2 * (1 - kr) * kr / kg * c, 2 * (1 - kb) * c)
+        _YUV_TABLES[matrix] = [numpy.round(term * 64).astype(numpy.int16) for term in terms]
+    return _YUV_TABLES[matrix]
+
+
+def _YUVToRGB(y, u, v, matrix, subsampling=(0, 0)):
+    '''Return a (rows, columns, 3) BGR array from YUV planes
+
+    U and V can be subsampled by 'subsampling' (width, height) shifts, or be
+    single values for Y8.
+    '''
+    luma, rv, gu, gv, bu = _YUVTables(matrix)
+    y = luma.take(y)
+    bgr = numpy.empty(y.shape + (3,), numpy.uint8)
+    for i, value in enumerate((bu.take(u), gu.take(u) + gv.take(v), rv.take(v))):
+        value = _Upsample(value, *subsampling) + y
+        value >>= 6
+        bgr[:, :, i] = numpy.clip(value, 0, 255, value)
+    return bgr
+
+
+def _RGBToYUV(bgr, matrix):
+    '''Return full resolution YUV planes from a (rows, columns, 3) BGR array'''
+    kr, kb, tv = _Matrix(matrix)
+    b, g, r = [bgr[:, :, i].astype(numpy.float32) for i in range(3)]
+    y = kr * r + (1 - kr - kb) * g + kb * b
+    u = (b - y) / (2 * (1 - kb))
+    v = (r - y) / (2 * (1 - kr))
+    if tv:
+        y = y * (219 / 255.0) + 16
+        u *= 224 / 255.0
+        v *= 224 / 255.0
+    return tuple(numpy.clip(plane + 0.5, 0, 255).astype(numpy.uint8)
+                 for plane in (y, u + 128, v + 128))
+
+
+def _Upsample(plane, sub_width, sub_height):
+    if sub_height:
+        plane = plane.repeat(1 << sub_height, 0)
+    if sub_width:
+        plane = plane.repeat(1 << sub_width, 1)
+    return plane
+
+
+def _YUVPlanes(frame, vi):
+    '''Return the Y, U and V planes of a YUV frame and the chroma subsampling
+
+    U and V are single neutral values for Y8.
+    '''
+    planes = _Planes(frame, vi)
+    if vi.is_yuy2():
+        packed = planes[0]
+        y = packed[:, :, 0::2].reshape(vi.height, vi.width)
+        return y, packed[:, :, 1], packed[:, :, 3], (1, 0)
+    if vi.is_y8():
+        neutral = numpy.array([[128]], numpy.uint8)
+        return planes[0], neutral, neutral, (0, 0)
+    return planes[0], planes[1], planes[2], _FORMATS[vi.format][3]
+
+
+def _ToYUV(frame, vi, matrix=None):
+    '''Return the full resolution Y, U and V planes of a frame'''
+    if vi.is_rgb():
+        return _RGBToYUV(_ToRGB(frame, vi), matrix)
+    y, u, v, subsampling = _YUVPlanes(frame, vi)
+    if vi.is_y8():
+        u = v = numpy.empty_like(y)
+        u.fill(128)
+        return y, u, v
+    return y, _Upsample(u, *subsampling), _Upsample(v, *subsampling)
+
+
+def _ToRGB(frame, vi, matrix=None):
+    '''Return the top-down (rows, columns, 3) BGR array of a frame'''
+    if vi.is_rgb():
+        return _Planes(frame, vi)[0][::-1, :, :3]
+    y, u, v, subsampling = _YUVPlanes(frame, vi)
+    return _YUVToRGB(y, u, v, matrix, subsampling)
+
+
+def _FromYUV(vi, y, u, v):
+    '''Return a new frame from full resolution YUV planes'''
+    frame = _NewFrame(vi)
+    planes = _Planes(frame, vi)
+    if vi.is_yuy2():
+        packed = planes[0]
+        packed[:, :, 0] = y[:, 0::2]
+        packed[:, :, 1] = u[:, 0::2]
+        packed[:, :, 2] = y[:, 1::2]
+        packed[:, :, 3] = v[:, 0::2]
+        return frame
+    planes[0][:] = y
+    if not vi.is_y8():
+        sub_width, sub_height = _FORMATS[vi.format][3]
+        planes[1][:] = u[::1 << sub_height, ::1 << sub_width]
+        planes[2][:] = v[::1 << sub_height, ::1 << sub_width]
+    return frame
+
+
+def _FromRGB(vi, bgr):
+    '''Return a new RGB frame from a top-down (rows, columns, 3) BGR array'''
+    frame = _NewFrame(vi)
+    packed = _Planes(frame, vi)[0]
+    packed[::-1, :, :3] = bgr
+    if vi.is_rgb32():
+        packed[:, :, 3] = 255
+    return frame
+
+
+def _CheckPixelType(name, pixel_type, width, height):
+    if pixel_type not in _FORMATS:
+        raise AvisynthError('{0}: unknown pixel_type "{1}"'.format(name, pixel_type))
+    sub_width, sub_height = _FORMATS[pixel_type][3] or ((1, 0) if pixel_type == 'YUY2'
+                                                        else (0, 0))
+    if width % (1 << sub_width) or height % (1 << sub_height):
+        raise AvisynthError('{0}: {1} needs a width multiple of {2} and a height '
+                            'multiple of {3}'.format(name, pixel_type, 1 << sub_width,
+                                                     1 << sub_height))
+
+
+# Clips
+
+class AVS_Clip(object):
+    '''Base class of the simulated sources and filters'''
+
+    def __init__(self, vi):
+        self.vi = vi
+        self._error = None
+        self._last = None, None
+
+    def get_error(self):
+        error, self._error = self._error, None
+        return error
+
+    def get_video_info(self):
+        return self.vi.copy()
+
+    def get_version(self):
+        return 6
+
+    def get_frame(self, n):
+        self._error = None
+        try:
+            return self._Frame(n)
+        except AvisynthError as err:
+            self._error = str(err)
+        except Exception as err:
+            self._error = ''.join(traceback.format_exception_only(type(err), err))
+
+    def get_parity(self, n):
+        return self.vi.is_tff()
+
+    def get_audio(self, buf, start, count):
+        '''Write 'count' samples from 'start' to an address or ctypes buffer'''
+        vi = self.vi
+        samples = numpy.zeros((count, max(1, vi.nchannels)), numpy.int16)
+        first, last = max(start, 0), min(start + count, vi.num_audio_samples)
+        if vi.has_audio() and last > first:
+            samples[first - start:last - start] = self._Audio(first, last - first)
+        ctypes.memmove(_Address(buf), samples.ctypes.data, count * vi.bytes_per_audio_sample())
+        return 0
+
+    def set_cache_hints(self, cachehints, frame_range):
+        return 0
+
+    def _Frame(self, n):
+        n = min(max(n, 0), self.vi.num_frames - 1)
+        last = self._last # (frame number, frame)
+        if last[0] != n:
+            last = self._last = n, self._Render(n)
+        return last[1]
+
+    def _Render(self, n):
+        raise NotImplementedError
+
+    def _Audio(self, start, count):
+        '''Return a (count, channels) int16 array'''
+        return numpy.zeros((count, self.vi.nchannels), numpy.int16)
+
+
+class _Source(AVS_Clip):
+    '''A still pattern, optionally with a box moving over it'''
+
+    # Y, U, V of the AviSynth color bars
+    bars = ((180, 128, 128), (162, 44, 142), (131, 156, 44), (112, 72, 58),
+            (84, 184, 198), (65, 100, 212), (35, 212, 114))
+
+    def __init__(self, name, width, height, pixel_type, length, fps_numerator,
+                 fps_denominator=1, pattern='ramp', border=0, cost=0.0, motion=False,
+                 audio_rate=0, channels=0):
+        _CheckPixelType(name, pixel_type, width, height)
+        if isinstance(fps_numerator, float):
+            fps_numerator, fps_denominator = int(round(fps_numerator * 1000)), 1000
+        vi = AVS_VideoInfo(width, height, pixel_type, max(1, length), fps_numerator,
+                           fps_denominator, audio_samples_per_second=audio_rate,
+                           nchannels=channels)
+        vi.num_audio_samples = vi.audio_samples_from_frames(vi.num_frames)
+        AVS_Clip.__init__(self, vi)
+        self.cost = cost
+        self.border = max(0, min(border, width // 2, height // 2))
+        self.motion = motion
+        y, u, v = self._Pattern(pattern, width, height)
+        if vi.is_rgb():
+            self.base = _FromRGB(vi, _YUVToRGB(y, u, v, 'Rec601'))
+        else:
+            self.base = _FromYUV(vi, y, u, v)
+
+    def _Pattern(self, pattern, width, height):
+        y = numpy.empty((height, width), numpy.uint8)
+        u = numpy.empty_like(y)
+        v = numpy.empty_like(y)
+        y.fill(16)
+        u.fill(128)
+        v.fill(128)
+        b = self.border
+        area = (slice(b, height - b), slice(b, width - b))
+        if pattern == 'ramp':
+            rows, columns = numpy.mgrid[0:height - 2 * b, 0:width - 2 * b]
+            y[area] = 96 + (columns * 139 // max(1, width - 2 * b))
+            u[area] = 96 + (rows * 64 // max(1, height - 2 * b))
+            v[area] = 160 - (columns * 64 // max(1, width - 2 * b))
+        elif pattern == 'bars':
+            edges = numpy.linspace(b, width - b, len(self.bars) + 1).astype(int)
+            for (left, right), (Y, U, V) in zip(zip(edges, edges[1:]), self.bars):
+                for plane, value in ((y, Y), (u, U), (v, V)):
+                    plane[b:height - b, left:right] = value
+        elif pattern != 'blank':
+            raise AvisynthError('SimClip: unknown pattern "{0}"'.format(pattern))
+        return y, u, v
+
+    def _Render(self, n):
+        if self.cost:
+            time.sleep(self.cost / 1000.0)
+        frame = AVS_VideoFrame(type(self.base.buf).from_buffer_copy(self.base.buf),
+                               self.base.planes)
+        if self.motion:
+            vi, b = self.vi, self.border
+            size = max(2, min(vi.width, vi.height) // 8)
+            x = b + n * 8 % max(1, vi.width - 2 * b - size)
+            y = b + n * 4 % max(1, vi.height - 2 * b - size)
+            offset, pitch, row_size, height = frame.planes[avs.AVS_PLANAR_Y]
+            luma = numpy.ndarray((height, row_size), numpy.uint8, frame.buf, offset, (pitch, 1))
+            luma[y:y + size, vi.bytes_from_pixels(x):vi.bytes_from_pixels(x + size)] = 235
+        return frame
+
+    def _Audio(self, start, count):
+        vi = self.vi
+        t = numpy.arange(start, start + count, dtype=numpy.float64)
+        wave = (numpy.sin(t * (2 * math.pi * 440 / vi.audio_samples_per_second)) * 8192)
+        return wave.astype(numpy.int16)[:, None].repeat(vi.nchannels, 1)
+
+
+class _Filter(AVS_Clip):
+
+    def __init__(self, child, vi=None):
+        AVS_Clip.__init__(self, vi or child.vi.copy())
+        self.child = child
+
+    def _Audio(self, start, count):
+        return self.child._Audio(start, count)
+
+
+class _Remap(_Filter):
+    '''Return the frames of the child clip in another order'''
+
+    def __init__(self, child, num_frames, mapping, **fields):
+        _Filter.__init__(self, child, child.vi.copy(num_frames=max(1, num_frames), **fields))
+        self.vi.num_audio_samples = min(child.vi.num_audio_samples,
+                                        self.vi.audio_samples_from_frames(self.vi.num_frames))
+        self.mapping = mapping
+
+    def _Render(self, n):
+        return self.child._Frame(self.mapping(n))
+
+
+class _Convert(_Filter):
+
+    def __init__(self, child, pixel_type, matrix):
+        _CheckPixelType('ConvertTo' + pixel_type, pixel_type, child.vi.width, child.vi.height)
+        _Filter.__init__(self, child, child.vi.copy(format=pixel_type))
+        self.matrix = matrix
+
+    def _Render(self, n):
+        frame = self.child._Frame(n)
+        if self.vi.is_rgb():
+            return _FromRGB(self.vi, _ToRGB(frame, self.child.vi, self.matrix))
+        return _FromYUV(self.vi, *_ToYUV(frame, self.child.vi, self.matrix))
+
+
+class _Resize(_Filter):
+
+    def __init__(self, child, width, height):
+        _CheckPixelType('Resize', child.vi.format, width, height)
+        _Filter.__init__(self, child, child.vi.copy(width=width, height=height))
+
+    def _Render(self, n):
+        src = self.child._Frame(n)
+        dst = _NewFrame(self.vi)
+        for src_plane, dst_plane in zip(_Planes(src, self.child.vi), _Planes(dst, self.vi)):
+            rows = numpy.arange(dst_plane.shape[0]) * src_plane.shape[0] // dst_plane.shape[0]
+            columns = (numpy.arange(dst_plane.shape[1]) * src_plane.shape[1] //
+                       dst_plane.shape[1])
+            dst_plane[:] = src_plane[rows][:, columns]
+        return dst
+
+
+class _Crop(_Filter):
+
+    def __init__(self, child, left, top, width, height):
+        _Filter.__init__(self, child, child.vi.copy(width=width, height=height))
+        self.left, self.top = left, top
+
+    def _Render(self, n):
+        frame = self.child._Frame(n)
+        vi = self.vi
+        planes = {}
+        for plane, (offset, pitch, row_size, height) in frame.planes.iteritems():
+            if vi.is_rgb():
+                row = height - self.top - vi.height # bottom-up
+                column = vi.bytes_from_pixels(self.left)
+                planes[plane] = (offset + row * pitch + column, pitch, vi.row_size(), vi.height)
+            else:
+                sub_width = vi.get_plane_width_subsampling(plane) if vi.is_planar() else 0
+                sub_height = vi.get_plane_height_subsampling(plane) if vi.is_planar() else 0
+                planes[plane] = (offset + (self.top >> sub_height) * pitch +
+                                 vi.bytes_from_pixels(self.left >> sub_width), pitch,
+                                 vi.row_size() >> sub_width, vi.height >> sub_height)
+        return AVS_VideoFrame(frame.buf, planes)
+
+
+class _SwapUV(_Filter):
+
+    def _Render(self, n):
+        frame = self.child._Frame(n)
+        planes = dict(frame.planes)
+        planes[avs.AVS_PLANAR_U] = frame.planes[avs.AVS_PLANAR_V]
+        planes[avs.AVS_PLANAR_V] = frame.planes[avs.AVS_PLANAR_U]
+        return AVS_VideoFrame(frame.buf, planes)
+
+
+class _Function(_Filter):
+    '''Apply a function to the plane arrays (source, destination) of each frame'''
+
+    def __init__(self, child, function, vi=None):
+        _Filter.__init__(self, child, vi)
+        self.function = function
+
+    def _Render(self, n):
+        src = self.child._Frame(n)
+        dst = _NewFrame(self.vi)
+        self.function(_Planes(src, self.child.vi), _Planes(dst, self.vi))
+        return dst
+
+
+class _MergeRGB(AVS_Clip):
+
+    def __init__(self, clips, pixel_type):
+        for clip in clips:
+            if not clip.vi.is_rgb():
+                raise AvisynthError('MergeRGB: RGB data only')
+            if (clip.vi.width, clip.vi.height) != (clips[0].vi.width, clips[0].vi.height):
+                raise AvisynthError('MergeRGB: All clips must have the same dimensions.')
+        AVS_Clip.__init__(self, clips[0].vi.copy(format=pixel_type))
+        self.clips = clips
+
+    def _Render(self, n):
+        frame = _NewFrame(self.vi)
+        packed = _Planes(frame, self.vi)[0]
+        # (A,) R, G, B from the matching channel of each clip, A from blue
+        channels = (3, 2, 1, 0) if len(self.clips) == 4 else (2, 1, 0)
+        for clip, channel in zip(self.clips, channels):
+            source = _Planes(clip._Frame(n), clip.vi)[0]
+            packed[:, :, channel] = source[:, :, 0 if channel == 3 else channel]
+        if len(self.clips) == 3 and self.vi.is_rgb32():
+            packed[:, :, 3] = 255
+        return frame
+
+    def _Audio(self, start, count):
+        return self.clips[0]._Audio(start, count)
+
+
+# Script functions
+
+_FUNCTIONS = {}
+
+def _Register(clip=True):
+    '''Register a script function, 'clip' if its first argument is a clip'''
+    def register(function):
+        args, varargs, keywords, defaults = inspect.getargspec(function)
+        function.params = args[1:]
+        function.required = len(args) - 1 - len(defaults or ())
+        function.varargs = bool(varargs)
+        function.keywords = bool(keywords)
+        function.takes_clip = clip
+        _FUNCTIONS[function.__name__.lower()] = function
+        return function
+    return register
+
+
+def _Call(env, name, args, kwargs):
+    '''Call a script function, inserting 'last' if needed'''
+    try:
+        function = _FUNCTIONS[name.lower()]
+    except KeyError:
+        raise AvisynthError("Script error: there is no function named '{0}'".format(name))
+    args = list(args)
+    if function.takes_clip and not (args and isinstance(args[0], AVS_Clip)):
+        last = env.vars.get('last')
+        if isinstance(last, AVS_Clip):
+            args.insert(0, last)
+    params = function.params
+    positional = set(params[:len(args)])
+    if (len(args) > len(params) and not function.varargs or
+            positional.intersection(kwargs) or
+            not function.keywords and not set(kwargs).issubset(params) or
+            not set(params[:function.required]).issubset(positional.union(kwargs)) or
+            function.takes_clip and not isinstance(args[0], AVS_Clip)):
+        raise AvisynthError("Script error: Invalid arguments to function '{0}'".format(name))
+    return function(env, *args, **kwargs)
+
+
+@_Register(clip=False)
+def SimClip(env, width=640, height=480, pixel_type='YV12', length=1000, fps=24,
+            fps_denominator=1, cost=0.0, border=0, pattern='ramp', audio_rate=48000,
+            channels=2):
+    return _Source('SimClip', width, height, pixel_type, length, fps, fps_denominator,
+                   pattern, border, cost, pattern == 'ramp', audio_rate, channels)
+
+@_Register(clip=False)
+def BlankClip(env, length=240, width=640, height=480, pixel_type='RGB32', fps=24,
+              fps_denominator=1, audio_rate=44100, channels=1, **options):
+    return _Source('BlankClip', width, height, pixel_type, length, fps, fps_denominator,
+                   'blank', audio_rate=audio_rate, channels=channels)
+
+@_Register(clip=False)
+def ColorBars(env, width=640, height=480, pixel_type='RGB32'):
+    return _Source('ColorBars', width, height, pixel_type, 107892, 30000, 1001, 'bars',
+                   audio_rate=48000, channels=2)
+
+@_Register(clip=False)
+def MessageClip(env, message, width=-1, height=-1, shrink=False, **options):
+    return _Source('MessageClip', width if width > 0 else 640, height if height > 0 else 480,
+                   'RGB32', 240, 24, pattern='blank')
+
+@_Register(clip=False)
+def Version(env):
+    return _Source('Version', 436, 80, 'RGB24', 240, 24, pattern='bars')
+
+@_Register(clip=False)
+def VersionNumber(env):
+    return 2.6
+
+@_Register(clip=False)
+def VersionString(env):
+    return 'AviSynth 2.60, simulated by avisynth_sim'
+
+@_Register(clip=False)
+def Eval(env, script, name=''):
+    return _Script(env, script, name).Run()
+
+@_Register(clip=False)
+def Import(env, filename):
+    path = os.path.join(env.working_dir or '', filename)
+    try:
+        with open(path) as script:
+            text = script.read()
+    except IOError as err:
+        raise AvisynthError('Import: unable to open "{0}" ({1})'.format(filename, err))
+    return _Script(env, text, filename).Run()
+
+@_Register()
+def Width(env, clip):
+    return clip.vi.width
+
+@_Register()
+def Height(env, clip):
+    return clip.vi.height
+
+@_Register()
+def FrameCount(env, clip):
+    return clip.vi.num_frames
+
+@_Register()
+def FrameRate(env, clip):
+    return clip.vi.fps_numerator / float(clip.vi.fps_denominator)
+
+def _ConvertTo(pixel_type, clip, matrix):
+    if clip.vi.format == pixel_type:
+        return clip
+    return _Convert(clip, pixel_type, matrix)
+
+@_Register()
+def ConvertToRGB(env, clip, matrix='Rec601', interlaced=False):
+    return clip if clip.vi.is_rgb() else _ConvertTo('RGB32', clip, matrix)
+
+@_Register()
+def ConvertToRGB24(env, clip, matrix='Rec601', interlaced=False):
+    return _ConvertTo('RGB24', clip, matrix)
+
+@_Register()
+def ConvertToRGB32(env, clip, matrix='Rec601', interlaced=False):
+    return _ConvertTo('RGB32', clip, matrix)
+
+@_Register()
+def ConvertToYV12(env, clip, interlaced=False, matrix='Rec601', **options):
+    return _ConvertTo('YV12', clip, matrix)
+
+@_Register()
+def ConvertToYV16(env, clip, interlaced=False, matrix='Rec601', **options):
+    return _ConvertTo('YV16', clip, matrix)
+
+@_Register()
+def ConvertToYV24(env, clip, interlaced=False, matrix='Rec601', **options):
+    return _ConvertTo('YV24', clip, matrix)
+
+@_Register()
+def ConvertToYV411(env, clip, interlaced=False, matrix='Rec601', **options):
+    return _ConvertTo('YV411', clip, matrix)
+
+@_Register()
+def ConvertToYUY2(env, clip, interlaced=False, matrix='Rec601', **options):
+    return _ConvertTo('YUY2', clip, matrix)
+
+@_Register()
+def ConvertToY8(env, clip, matrix='Rec601'):
+    return _ConvertTo('Y8', clip, matrix)
+
+@_Register()
+def BilinearResize(env, clip, target_width, target_height, *source, **options):
+    return _Resize(clip, target_width, target_height)
+
+for _name in ('PointResize', 'BicubicResize', 'LanczosResize', 'Lanczos4Resize',
+              'Spline16Resize', 'Spline36Resize', 'Spline64Resize', 'GaussResize'):
+    _FUNCTIONS[_name.lower()] = BilinearResize
+
+@_Register()
+def Crop(env, clip, left, top, width=0, height=0, align=False):
+    vi = clip.vi
+    if width <= 0:
+        width += vi.width - left
+    if height <= 0:
+        height += vi.height - top
+    if left < 0 or top < 0 or width <= 0 or height <= 0 or (
+            left + width > vi.width or top + height > vi.height):
+        raise AvisynthError("Crop: you cannot use crop to enlarge or 'shift' a clip")
+    _CheckPixelType('Crop', vi.format, left, top)
+    _CheckPixelType('Crop', vi.format, width, height)
+    return _Crop(clip, left, top, width, height)
+
+@_Register()
+def Trim(env, clip, first_frame, last_frame, pad=True):
+    if last_frame == 0:
+        last_frame = clip.vi.num_frames - 1
+    elif last_frame < 0:
+        last_frame = first_frame - last_frame - 1
+    return _Remap(clip, last_frame - first_frame + 1, lambda n: first_frame + n)
+
+@_Register()
+def Loop(env, clip, times=-1, start=0, end=10000000):
+    frames = clip.vi.num_frames
+    start = min(max(start, 0), frames - 1)
+    end = min(max(end, start), frames - 1)
+    length = end - start + 1
+    if times < 0:
+        times = 10000000 // length
+    def mapping(n):
+        if n < start:
+            return n
+        if n < start + length * times:
+            return start + (n - start) % length
+        return n - length * (times - 1)
+    return _Remap(clip, frames + length * (times - 1), mapping)
+
+@_Register()
+def SelectEvery(env, clip, step_size, *offsets):
+    offsets = offsets or (0,)
+    return _Remap(clip, clip.vi.num_frames * len(offsets) // step_size,
+                  lambda n: n // len(offsets) * step_size + offsets[n % len(offsets)],
+                  fps_denominator=clip.vi.fps_denominator * step_size,
+                  fps_numerator=clip.vi.fps_numerator * len(offsets))
+
+@_Register()
+def SelectEven(env, clip):
+    return SelectEvery(env, clip, 2, 0)
+
+@_Register()
+def SelectOdd(env, clip):
+    return SelectEvery(env, clip, 2, 1)
+
+@_Register()
+def AssumeFPS(env, clip, numerator, denominator=1, sync_audio=False):
+    if isinstance(numerator, float):
+        numerator, denominator = int(round(numerator * 1000)), 1000
+    return _Remap(clip, clip.vi.num_frames, lambda n: n, fps_numerator=numerator,
+                  fps_denominator=denominator)
+
+def _ImageType(clip, set=0, clear=0):
+    return _Remap(clip, clip.vi.num_frames, lambda n: n,
+                  image_type=clip.vi.image_type & ~clear | set)
+
+@_Register()
+def AssumeBFF(env, clip):
+    return _ImageType(clip, avs.AVS_IT_BFF, avs.AVS_IT_TFF)
+
+@_Register()
+def AssumeTFF(env, clip):
+    return _ImageType(clip, avs.AVS_IT_TFF, avs.AVS_IT_BFF)
+
+@_Register()
+def AssumeFrameBased(env, clip):
+    return _ImageType(clip, clear=avs.AVS_IT_FIELDBASED)
+
+@_Register()
+def AssumeFieldBased(env, clip):
+    return _ImageType(clip, avs.AVS_IT_FIELDBASED)
+
+@_Register()
+def SwapUV(env, clip):
+    if not clip.vi.is_yuv() or clip.vi.is_y8():
+        raise AvisynthError('SwapUV: YUV data only')
+    if clip.vi.is_yuy2():
+        def swap(src, dst):
+            dst[0][:] = src[0][:, :, (0, 3, 2, 1)]
+        return _Function(clip, swap)
+    return _SwapUV(clip)
+
+@_Register()
+def FlipVertical(env, clip):
+    def flip(src, dst):
+        for source, destination in zip(src, dst):
+            destination[:] = source[::-1]
+    return _Function(clip, flip)
+
+def _Show(clip, name, channel, pixel_type):
+    if not clip.vi.is_rgb():
+        raise AvisynthError('{0}: RGB data only'.format(name))
+    def show(src, dst):
+        dst[0][:, :, :3] = src[0][:, :, channel, None]
+        if dst[0].shape[2] == 4:
+            dst[0][:, :, 3] = 255
+    return _Function(clip, show, clip.vi.copy(format=pixel_type))
+
+@_Register()
+def ShowRed(env, clip, pixel_type='RGB32'):
+    return _Show(clip, 'ShowRed', 2, pixel_type)
+
+@_Register()
+def ShowGreen(env, clip, pixel_type='RGB32'):
+    return _Show(clip, 'ShowGreen', 1, pixel_type)
+
+@_Register()
+def ShowBlue(env, clip, pixel_type='RGB32'):
+    return _Show(clip, 'ShowBlue', 0, pixel_type)
+
+@_Register()
+def MergeRGB(env, r, g, b, pixel_type='RGB32'):
+    return _MergeRGB([r, g, b], pixel_type)
+
+@_Register()
+def MergeARGB(env, a, r, g, b):
+    return _MergeRGB([a, r, g, b], 'RGB32')
+
+@_Register()
+def Blur(env, clip, amount=1.0, amount_v=None, mmx=True):
+    def blur(src, dst):
+        for source, destination in zip(src, dst):
+            # [1 2 1] / 4 vertically and horizontally
+            plane = source.astype(numpy.uint16)
+            plane[1:-1] = (plane[:-2] + 2 * plane[1:-1] + plane[2:] + 2) >> 2
+            plane[:, 1:-1] = (plane[:, :-2] + 2 * plane[:, 1:-1] + plane[:, 2:] + 2) >> 2
+            destination[:] = plane
+    return _Function(clip, blur)
+
+@_Register()
+def Subtitle(env, clip, text, **options):
+    return clip
+
+
+# Script evaluation
+
+_TOKENS = re.compile(r'''[ \t\r]*(?:
+      (?P<comment>\#[^\n]*)
+    | (?P<continuation>\\[ \t\r]*\n|\n[ \t\r]*\\)
+    | (?P<string>"""[\s\S]*?"""|"[^"\n]*")
+    | (?P<number>\$[0-9a-fA-F]+|\d+\.\d*|\.\d+|\d+)
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<op>[-().,=\n])
+    | (?P<end>\Z)
+    )''', re.X)
+
+
+class _Script(object):
+    '''Evaluate a script in the environment's variable scope'''
+
+    def __init__(self, env, text, name=''):
+        self.env = env
+        self.name = name
+        self.tokens = []
+        pos = 0
+        while True:
+            match = _TOKENS.match(text, pos)
+            if match is None:
+                raise self.Error('syntax error', text.count('\n', 0, pos) + 1)
+            kind = match.lastgroup
+            if kind not in ('comment', 'continuation'):
+                self.tokens.append((kind, match.group(kind), text.count('\n', 0, pos) + 1))
+            if kind == 'end':
+                break
+            pos = match.end()
+        self.pos = 0
+
+    def Error(self, message, line=None):
+        if line is None:
+            line = self.tokens[min(self.pos, len(self.tokens) - 1)][2]
+        return AvisynthError('Script error: {0}\n({1}, line {2})'.format(
+                             message, self.name or 'Script', line))
+
+    def Peek(self, offset=0):
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)][:2]
+
+    def Next(self):
+        token = self.Peek()
+        self.pos += 1
+        return token
+
+    def Expect(self, op):
+        if self.Next() != ('op', op):
+            raise self.Error('expected "{0}"'.format(op.replace('\n', 'end of line')))
+
+    def Run(self):
+        '''Evaluate the script and return the value of its last expression'''
+        vars = self.env.vars
+        result = None
+        while self.Peek()[0] != 'end':
+            if self.Peek() == ('op', '\n'):
+                self.Next()
+                continue
+            if self.Peek()[0] == 'name' and self.Peek(1) == ('op', '='):
+                name = self.Next()[1]
+                self.Next()
+                vars[name.lower()] = self.Expression()
+                result = None
+            else:
+                result = self.Expression()
+                if isinstance(result, AVS_Clip):
+                    vars['last'] = result
+        return vars.get('last') if result is None else result
+
+    def Expression(self):
+        value = self.Primary()
+        while self.Peek() == ('op', '.'):
+            self.Next()
+            kind, name = self.Next()
+            if kind != 'name':
+                raise self.Error('expected a function name')
+            args, kwargs = self.Arguments() if self.Peek() == ('op', '(') else ([], {})
+            value = self.Call(name, [value] + args, kwargs)
+        return value
+
+    def Primary(self):
+        kind, value = self.Next()
+        if kind == 'string':
+            return value[3:-3] if value.startswith('"""') else value[1:-1]
+        if kind == 'number':
+            if value.startswith('$'):
+                return int(value[1:], 16)
+            return float(value) if '.' in value else int(value)
+        if (kind, value) == ('op', '-'):
+            number = self.Primary()
+            if not isinstance(number, (int, long, float)):
+                raise self.Error('"-" needs a number')
+            return -number
+        if (kind, value) == ('op', '('):
+            value = self.Expression()
+            self.Expect(')')
+            return value
+        if kind == 'name':
+            name = value.lower()
+            if name in ('true', 'false'):
+                return name == 'true'
+            if self.Peek() == ('op', '('):
+                return self.Call(value, *self.Arguments())
+            if name in self.env.vars:
+                return self.env.vars[name]
+            if name in self.env.global_vars:
+                return self.env.global_vars[name]
+            if name not in _FUNCTIONS:
+                raise self.Error("I don't know what '{0}' means".format(value))
+            return self.Call(value, [], {})
+        raise self.Error('syntax error')
+
+    def Arguments(self):
+        self.Expect('(')
+        args, kwargs = [], {}
+        if self.Peek() == ('op', ')'):
+            self.Next()
+            return args, kwargs
+        while True:
+            if self.Peek()[0] == 'name' and self.Peek(1) == ('op', '='):
+                name = self.Next()[1].lower()
+                self.Next()
+                kwargs[name] = self.Expression()
+            else:
+                args.append(self.Expression())
+            token = self.Next()
+            if token == ('op', ')'):
+                return args, kwargs
+            if token != ('op', ','):
+                raise self.Error('expected "," or ")"')
+
+    def Call(self, name, args, kwargs):
+        try:
+            return _Call(self.env, name, args, kwargs)
+        except AvisynthError as err:
+            if str(err).startswith('Script error'):
+                raise self.Error(str(err)[len('Script error: '):])
+            raise
+
+
+class AVS_ScriptEnvironment(object):
+
+    def __init__(self, version=3):
+        self.vars = {}
+        self.global_vars = {}
+        self.working_dir = None
+
+    def get_error(self):
+        return None
+
+    def get_cpu_flags(self):
+        return 0
+
+    def check_version(self, version):
+        return version <= 6
+
+    def function_exists(self, name):
+        return name.lower() in _FUNCTIONS
+
+    def invoke(self, name, args=[], arg_names=None):
+        if not isinstance(args, (list, tuple)):
+            args = [args]
+        if isinstance(arg_names, basestring):
+            arg_names = [arg_names]
+        positional, named = [], {}
+        for value, arg_name in zip(args, arg_names or [None] * len(args)):
+            if arg_name is None:
+                positional.append(value)
+            else:
+                named[arg_name.lower()] = value
+        return _Call(self, name, positional, named)
+
+    def get_var(self, name, type=False):
+        name = name.lower()
+        if name in self.vars:
+            value = self.vars[name]
+        elif name in self.global_vars:
+            value = self.global_vars[name]
+        else:
+            raise AvisynthError('NotFound')
+        if type:
+            return value, _TypeName(value)
+        return value
+
+    def set_var(self, name, value):
+        self.vars[name.lower()] = value
+        return 0
+
+    def set_global_var(self, name, value):
+        self.global_vars[name.lower()] = value
+        return 0
+
+    def bit_blt(self, dstp, dst_pitch, srcp, src_pitch, row_size, height):
+        dst, src = _Address(dstp), _Address(srcp)
+        if dst_pitch == src_pitch == row_size:
+            ctypes.memmove(dst, src, row_size * height)
+            return
+        for row in range(height):
+            ctypes.memmove(dst + row * dst_pitch, src + row * src_pitch, row_size)
+
+    def set_memory_max(self, memory):
+        return memory
+
+    def set_working_dir(self, new_dir):
+        self.working_dir = new_dir
+        return 0
+
+
+def _TypeName(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, long)):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, basestring):
+        return 'string'
+    if isinstance(value, AVS_Clip):
+        return 'clip'
+    return None
+
+
+# Headless stand-in for the wxPython drawing used by pyavs.AvsClip.DrawFrame
+
+class Bitmap(object):
+    '''Holds a copy of the RGB24 data, as a native bitmap would'''
+
+    def __init__(self, width, height, data):
+        self.size = width, height
+        self.data = bytearray(buffer(data))
+
+    def GetSize(self):
+        return self.size
+
+    def CopyFromBuffer(self, data):
+        self.data[:] = buffer(data)
+
+
+class DC(object):
+    '''Counts the bitmaps drawn on it'''
+
+    def __init__(self):
+        self.drawn = 0
+
+    def DrawBitmap(self, bitmap, x, y, useMask=False):
+        self.drawn += 1
+
+
+def install(headless_wx=True):
+    '''Load this module for 'import avisynth' and 'import avisynth_cffi'
+
+    If 'headless_wx' is True and wxPython can't be imported, 'import wx'
+    loads a module with BitmapFromBuffer, Bitmap and DC.  The options read by
+    pyavs that are otherwise set by the main window get their defaults, with
+    the AviSynth RGB conversion for display.  Must be called before importing
+    pyavs.
+    '''
+    module = sys.modules[__name__]
+    sys.modules['avisynth'] = sys.modules['avisynth_cffi'] = module
+    import global_vars
+    global_vars.options.setdefault('errormessagefont', ('Arial', 24))
+    global_vars.options.setdefault('nativeyuv2rgb', False)
+    if headless_wx:
+        try:
+            import wx
+        except ImportError:
+            wx = types.ModuleType('wx', 'Headless stand-in from avisynth_sim')
+            wx.Bitmap = Bitmap
+            wx.BitmapFromBuffer = Bitmap
+            wx.DC = wx.MemoryDC = DC
+            sys.modules['wx'] = wx
@@ -0,0 +1,91 @@
+# AvsP - an AviSynth editor
+# 
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+# 
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# bench_buffers - memory use of AvsClip.RawFrame with and without buffer reuse
+# 
+# Reads every frame of a ColorBars clip with RawFrame, as MacroPipe does, and 
+# reports the time, the number of output buffers allocated per frame and the 
+# peak RSS.  pyavs runs on the simulated AviSynth backend of avisynth_sim.py, 
+# which allocates its frames with ctypes arrays, so only the RawFrame output 
+# buffers are counted.  Each mode runs in its own process so the peak RSS of 
+# one doesn't hide the other.
+# 
+# Usage: python benchmarks/bench_buffers.py [frames] [width] [height]
+# 
+# Dependencies:
+#     Python (tested on v2.7)
+#     NumPy
+#     resource module (*nix)
+
+import os
+import sys
+import time
+import ctypes
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(reuse, frames, width, height):
+    '''Read the frames and print "result: ms allocations/frame peak_rss_MB"'''
+    import avisynth_sim
+    avisynth_sim.install()
+    import pyavs
+    script = ('ColorBars(width={0}, height={1}, pixel_type="YV12")'
+              '.Trim(0, {2}).Loop(2)'.format(width, height, frames * 2))
+    clip = pyavs.AvsClip(script, display_clip=False, frame_cache_size=0)
+    if not clip.initialized or clip.IsErrorClip():
+        sys.exit('Error creating the clip: {0}'.format(clip.error_message))
+    # Count the output buffers created by RawFrame
+    allocations = [0]
+    create_string_buffer = ctypes.create_string_buffer
+    def counting_create_string_buffer(*args):
+        allocations[0] += 1
+        return create_string_buffer(*args)
+    ctypes.create_string_buffer = counting_create_string_buffer
+    start = time.time()
+    for frame in range(frames):
+        buf = clip.RawFrame(frame, True, reuse=reuse)
+    elapsed = (time.time() - start) * 1000 / frames
+    ctypes.create_string_buffer = create_string_buffer
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # bytes instead of KB
+        peak /= 1024
+    print 'result:', elapsed, float(allocations[0]) / frames, peak / 1024.0
+
+
+def main(frames=200, width=1920, height=1080):
+    print 'RawFrame, YV12 {0}x{1} ({2} frames)'.format(width, height, frames)
+    for reuse in (False, True):
+        output = subprocess.check_output([sys.executable, __file__, '--run', 
+                    str(int(reuse)), str(frames), str(width), str(height)])
+        line = [line for line in output.splitlines() if line.startswith('result:')][-1]
+        elapsed, allocations, peak = [float(value) for value in line.split()[1:]]
+        print ('{0:<13}{1:8.2f} ms  {2:5.2f} allocations/frame  '
+               'peak RSS {3:7.1f} MB'.format('reused:' if reuse else 'new buffers:', 
+                                             elapsed, allocations, peak))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(bool(int(sys.argv[2])), *[int(arg) for arg in sys.argv[3:6]])
+    else:
+        main(*[int(arg) for arg in sys.argv[1:4]])
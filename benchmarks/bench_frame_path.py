@@ -0,0 +1,213 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# bench_frame_path - speed and memory of the pyavs frame path, without AviSynth
+#
+# Runs pyavs on the simulated AviSynth backend of avisynth_sim.py, so it works
+# on any box with NumPy, and reports the ms per frame and the peak RSS of:
+#
+#     GetFrame         AvsClip._GetFrame, source and display frames
+#     GetFrame-cached  the same, going over 16 frames held by the frame cache
+#     RawFrame         AvsClip.RawFrame with a y4m header, reusing the buffer
+#     RawFrameChunks   AvsClip.RawFrameChunks with a y4m header
+#     DrawFrame        AvsClip.DrawFrame with the AviSynth RGB conversion
+#     DrawFrame-numpy  AvsClip.DrawFrame with YUV2RGBConverter (nativeyuv2rgb)
+#     AutocropFrame    AvsClip.AutocropFrame on a clip with a black border
+#     MacroPipe        the frame path of MacroPipe with 'exportworkers' 1,
+#                      RawFrameChunks and PipeWriter to /dev/null
+#     MacroPipe-export the same with ParallelExport and --workers processes
+#
+# Each case runs in its own process, so the peak RSS is its own.  --cost adds
+# a rendering time per frame, in ms.  With --save the results are written to
+# a JSON file, and with --compare they are checked against one: the exit
+# status is 1 if a case is slower or uses more memory than the saved one by
+# more than --tolerance (0.25 = 25 %), so it can be used as a CI check.
+# --repeat keeps the fastest of several runs, to lower the noise.
+#
+# Usage: python benchmarks/bench_frame_path.py [--frames N] [--size WxH]
+#            [--pixel-type YV12] [--cost MS] [--workers N] [--cases A,B,...]
+#            [--repeat N] [--save FILE] [--compare FILE] [--tolerance 0.25]
+#
+# Dependencies:
+#     Python (tested on v2.7)
+#     NumPy
+#     resource module (*nix)
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CASES = ('GetFrame', 'GetFrame-cached', 'RawFrame', 'RawFrameChunks', 'DrawFrame',
+         'DrawFrame-numpy', 'AutocropFrame', 'MacroPipe', 'MacroPipe-export')
+BORDER = 16
+
+
+def script(args):
+    return ('SimClip({0}, {1}, "{2}", length={3}, cost={4}, border={5})'.format(
+            args.width, args.height, args.pixel_type, args.frames, args.cost, BORDER))
+
+
+def run(case, args):
+    '''Run a case and print "result: ms_per_frame peak_rss_MB"'''
+    import avisynth_sim
+    avisynth_sim.install()
+    import global_vars
+    import pyavs
+    import pyavs_export
+    text = script(args)
+    frames = range(args.frames)
+    display = case.startswith(('GetFrame', 'DrawFrame'))
+    if case == 'DrawFrame-numpy':
+        global_vars.options['nativeyuv2rgb'] = True
+    cache_size = 256 if case == 'GetFrame-cached' else 0
+    clip = pyavs.AvsClip(text, display_clip=display, frame_cache_size=cache_size)
+    if not clip.initialized or clip.IsErrorClip():
+        sys.exit('Error creating the clip: {0}'.format(clip.error_message))
+    if case == 'GetFrame-cached':
+        window = range(16)
+        for frame in window:
+            clip._GetFrame(frame)
+        frames = [window[i % len(window)] for i in range(args.frames)]
+    start = time.time()
+    if case.startswith('GetFrame'):
+        for frame in frames:
+            clip._GetFrame(frame)
+    elif case == 'RawFrame':
+        for frame in frames:
+            clip.RawFrame(frame, True, reuse=True)
+    elif case == 'RawFrameChunks':
+        for frame in frames:
+            clip.RawFrameChunks(frame, True)
+    elif case.startswith('DrawFrame'):
+        dc = avisynth_sim.DC()
+        for frame in frames:
+            clip.DrawFrame(frame, dc)
+    elif case == 'AutocropFrame':
+        for frame in frames:
+            crop = clip.AutocropFrame(frame)
+        if crop != (BORDER,) * 4:
+            sys.exit('Wrong crop values: {0}'.format(crop))
+    elif case.startswith('MacroPipe'):
+        with open(os.devnull, 'wb') as stream:
+            stream.write(clip.Y4MHeader())
+            writer = pyavs_export.PipeWriter(stream)
+            if case == 'MacroPipe':
+                for frame in frames:
+                    writer.Write(clip.RawFrameChunks(frame, True))
+            else:
+                export = pyavs_export.ParallelExport(text, frames=frames,
+                                                     workers=args.workers, y4m_header=True)
+                for frame, data in export:
+                    writer.Write([data])
+                if export.error_message:
+                    sys.exit(export.error_message)
+            writer.Close()
+    elapsed = (time.time() - start) * 1000 / len(frames)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # bytes instead of KB
+        peak /= 1024
+    print 'result:', elapsed, peak / 1024.0
+
+
+def measure(case, args):
+    '''Return (ms per frame, peak RSS in MB), the fastest of args.repeat runs'''
+    results = []
+    for i in range(max(1, args.repeat)):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                          '--run', case] + sys.argv[1:])
+        line = [line for line in output.splitlines() if line.startswith('result:')][-1]
+        results.append(tuple(float(value) for value in line.split()[1:]))
+    return min(results)
+
+
+def settings(args):
+    return dict(frames=args.frames, width=args.width, height=args.height,
+                pixel_type=args.pixel_type, cost=args.cost, workers=args.workers)
+
+
+def main(args):
+    cases = args.cases.split(',') if args.cases else CASES
+    for case in cases:
+        if case not in CASES:
+            sys.exit('Unknown case "{0}", available: {1}'.format(case, ', '.join(CASES)))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings(args):
+            sys.exit('The settings differ from the baseline: {0}'.format(baseline['settings']))
+    print 'Simulated {0} {1}x{2}, {3} ms/frame rendering ({4} frames)'.format(
+          args.pixel_type, args.width, args.height, args.cost, args.frames)
+    results = {}
+    regressions = []
+    for case in cases:
+        elapsed, peak = results[case] = measure(case, args)
+        line = '{0:<18}{1:8.2f} ms  {2:8.1f} fps  peak RSS {3:7.1f} MB'.format(
+               case + ':', elapsed, 1000 / elapsed if elapsed else 0, peak)
+        if baseline is not None and case in baseline['results']:
+            old_elapsed, old_peak = baseline['results'][case]
+            time_change = elapsed / old_elapsed - 1 if old_elapsed else 0
+            memory_change = peak / old_peak - 1 if old_peak else 0
+            line += '  ({0:+.0%} time, {1:+.0%} memory)'.format(time_change, memory_change)
+            if max(time_change, memory_change) > args.tolerance:
+                regressions.append(case)
+                line += '  REGRESSION'
+        print line
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(settings=settings(args), results=results), f, indent=1,
+                      sort_keys=True)
+    if regressions:
+        sys.exit('Regressions: {0}'.format(', '.join(regressions)))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the pyavs frame path on '
+                                     'a simulated AviSynth backend')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--size', default='1920x1080', help='WIDTHxHEIGHT')
+    parser.add_argument('--pixel-type', default='YV12')
+    parser.add_argument('--cost', type=float, default=0.0,
+                        help='rendering time per frame in ms')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='processes used by MacroPipe-export')
+    parser.add_argument('--cases', help='comma-separated list of cases')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--save', help='write the results to a JSON file')
+    parser.add_argument('--compare', help='compare to the results in a JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.width, args.height = [int(value) for value in args.size.lower().split('x')]
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    if args.run:
+        run(args.run, args)
+    else:
+        main(args)
@@ -0,0 +1,729 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# bench_lexer - syntax highlighting of large scripts, line lexer vs the old one
+#
+# Styles a generated script of --lines lines with the AvsLexer of
+# AvsStyledTextCtrl.OnStyleNeeded and with the previous lexer, which went
+# through the text a character at a time, on a StyledTextCtrl stand-in, so
+# wxPython isn't needed.  The stand-in is pure Python, which makes each call
+# to it cheaper than in wx, so the gains are on the low side.  The cases are:
+#
+#     open           style the whole script, as when opening it
+#     edit-all       edit a line, then style the whole script, as
+#                    GetAutoSliderInfo does before refreshing the preview
+#     edit-visible   edit a line, then style a screen from it, as when typing
+#     comment-all    open a [* *] comment in the middle, which ends up
+#                    commenting out the rest, then style it all
+#
+# The styles and fold levels of both lexers are compared after each case.
+#
+# Usage: python benchmarks/bench_lexer.py [--lines N] [--edits N]
+#
+# Dependencies:
+#     Python (tested on v2.7)
+
+import os
+import sys
+import time
+import bisect
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avsp2 import avs_lexer
+from avsp2.avs_lexer import AvsLexer
+
+SCREEN_LINES = 60
+
+
+class stc(object):
+    '''The wx.stc constants used by the lexers'''
+    STC_FOLDLEVELBASE = avs_lexer.FOLDLEVELBASE
+    STC_FOLDLEVELWHITEFLAG = avs_lexer.FOLDLEVELWHITEFLAG
+    STC_FOLDLEVELHEADERFLAG = avs_lexer.FOLDLEVELHEADERFLAG
+    STC_FOLDLEVELNUMBERMASK = avs_lexer.FOLDLEVELNUMBERMASK
+
+
+class App(object):
+
+    def __init__(self):
+        self.options = {'wrap': False, 'usestringeol': True,
+                        'syntaxhighlight_styleinsidetriplequotes': False,
+                        'syntaxhighlight_preferfunctions': False}
+        self.avskeywords = ['return', 'global', 'function', 'last',
+                            'true', 'false', 'try', 'catch']
+        self.avsdatatypes = ['clip', 'int', 'float', 'string', 'bool', 'var']
+        self.avsoperators = ['-', '*', ',', '.', '/', ':', '?', '\\', '+', '<', '>', '=',
+                             '(', ')', '[', ']', '{', '}', '!', '%', '&', '|']
+        self.avsmiscwords = ['__end__']
+        self.avssingleletters = []
+        self.dllnameunderscored = set()
+
+    def defineScriptFilterInfo(self):
+        pass
+
+
+class StyledTextCtrl(object):
+    '''The part of wx.stc.StyledTextCtrl used by the lexers, ASCII only
+
+    Line states and fold levels are kept across edits as Scintilla does.
+    '''
+    STC_AVS_DEFAULT = avs_lexer.STC_AVS_DEFAULT
+    STC_AVS_COMMENT = avs_lexer.STC_AVS_COMMENT
+    STC_AVS_ENDCOMMENT = avs_lexer.STC_AVS_ENDCOMMENT
+    STC_AVS_BLOCKCOMMENT = avs_lexer.STC_AVS_BLOCKCOMMENT
+    STC_AVS_NUMBER = avs_lexer.STC_AVS_NUMBER
+    STC_AVS_NUMBERBAD = avs_lexer.STC_AVS_NUMBERBAD
+    STC_AVS_OPERATOR = avs_lexer.STC_AVS_OPERATOR
+    STC_AVS_STRING = avs_lexer.STC_AVS_STRING
+    STC_AVS_STRINGEOL = avs_lexer.STC_AVS_STRINGEOL
+    STC_AVS_TRIPLE = avs_lexer.STC_AVS_TRIPLE
+    STC_AVS_UNKNOWNFUNCTION = avs_lexer.STC_AVS_UNKNOWNFUNCTION
+    STC_AVS_USERSLIDER = avs_lexer.STC_AVS_USERSLIDER
+    STC_AVS_PARAMETER = avs_lexer.STC_AVS_PARAMETER
+    STC_AVS_ASSIGN = avs_lexer.STC_AVS_ASSIGN
+    STC_AVS_KEYWORD = avs_lexer.STC_AVS_KEYWORD
+    STC_AVS_MISCWORD = avs_lexer.STC_AVS_MISCWORD
+    STC_AVS_DATATYPE = avs_lexer.STC_AVS_DATATYPE
+    STC_AVS_IDENTIFIER = avs_lexer.STC_AVS_IDENTIFIER
+
+    def __init__(self, text):
+        self.app = App()
+        self.filename = 'bench.avs'
+        self.avsfilterdict = dict((name.lower(), ('', style)) for name, style in (
+            ('LoadPlugin', avs_lexer.STC_AVS_COREFILTER),
+            ('FFVideoSource', avs_lexer.STC_AVS_PLUGIN),
+            ('Trim', avs_lexer.STC_AVS_COREFILTER),
+            ('Levels', avs_lexer.STC_AVS_COREFILTER),
+            ('Tweak', avs_lexer.STC_AVS_COREFILTER),
+            ('Subtitle', avs_lexer.STC_AVS_COREFILTER),
+            ('Width', avs_lexer.STC_AVS_CLIPPROPERTY)))
+        self.commentStyle = [self.STC_AVS_COMMENT, self.STC_AVS_BLOCKCOMMENT,
+                             self.STC_AVS_ENDCOMMENT]
+        self.text = u''
+        self.styles = []
+        self.line_starts = [0]
+        self.line_states = [0]
+        self.fold_levels = [stc.STC_FOLDLEVELBASE]
+        self.end_styled = self.styling_pos = 0
+        self.InsertText(0, text)
+
+    def _Modified(self, pos, length, inserted):
+        pass
+
+    def InsertText(self, pos, text):
+        line = self.LineFromPosition(pos)
+        self.text = self.text[:pos] + text + self.text[pos:]
+        self.styles[pos:pos] = [0] * len(text)
+        self._UpdateLines(line, text.count('\n'))
+        self.end_styled = min(self.end_styled, pos)
+        self._Modified(pos, len(text), True)
+
+    def DeleteRange(self, pos, length):
+        line = self.LineFromPosition(pos)
+        removed = self.text[pos:pos+length].count('\n')
+        self.text = self.text[:pos] + self.text[pos+length:]
+        del self.styles[pos:pos+length]
+        del self.line_states[line+1:line+1+removed]
+        del self.fold_levels[line+1:line+1+removed]
+        self._UpdateLines(line, 0)
+        self.end_styled = min(self.end_styled, pos)
+        self._Modified(pos, length, False)
+
+    def _UpdateLines(self, line, added):
+        for i in range(added):
+            self.line_states.insert(line + 1, self.line_states[line + 1]
+                                    if line + 1 < len(self.line_states) else 0)
+            self.fold_levels.insert(line + 1, self.fold_levels[line + 1]
+                                    if line + 1 < len(self.fold_levels) else stc.STC_FOLDLEVELBASE)
+        self.line_starts = [0]
+        find = self.text.find
+        pos = find('\n')
+        while pos != -1:
+            self.line_starts.append(pos + 1)
+            pos = find('\n', pos + 1)
+
+    def GetLength(self):
+        return len(self.text)
+
+    def GetLineCount(self):
+        return len(self.line_starts)
+
+    def LinesOnScreen(self):
+        return SCREEN_LINES
+
+    def LineFromPosition(self, pos):
+        return bisect.bisect_right(self.line_starts, pos) - 1
+
+    def PositionFromLine(self, line):
+        if line >= len(self.line_starts):
+            return len(self.text)
+        return self.line_starts[max(0, line)]
+
+    def GetLineEndPosition(self, line):
+        if line + 1 >= len(self.line_starts):
+            return len(self.text)
+        return self.line_starts[line + 1] - 1
+
+    def GetLine(self, line):
+        if line + 1 >= len(self.line_starts):
+            return self.text[self.PositionFromLine(line):]
+        return self.text[self.line_starts[line]:self.line_starts[line + 1]]
+
+    def GetTextRange(self, start, end):
+        return self.text[start:end]
+
+    def GetCharAt(self, pos):
+        if 0 <= pos < len(self.text):
+            return ord(self.text[pos])
+        return 0
+
+    def GetStyleAt(self, pos):
+        if 0 <= pos < len(self.styles):
+            return self.styles[pos]
+        return 0
+
+    def GetLineState(self, line):
+        return self.line_states[line] if 0 <= line < len(self.line_states) else 0
+
+    def SetLineState(self, line, state):
+        if 0 <= line < len(self.line_states):
+            self.line_states[line] = state
+
+    def GetFoldLevel(self, line):
+        if 0 <= line < len(self.fold_levels):
+            return self.fold_levels[line]
+        return stc.STC_FOLDLEVELBASE
+
+    def SetFoldLevel(self, line, level):
+        if 0 <= line < len(self.fold_levels):
+            self.fold_levels[line] = level
+
+    def GetEndStyled(self):
+        return self.end_styled
+
+    def StartStyling(self, pos, mask):
+        self.end_styled = self.styling_pos = min(pos, len(self.text))
+
+    def SetStyling(self, length, style):
+        end = min(self.styling_pos + length, len(self.text))
+        self.styles[self.styling_pos:end] = [style] * (end - self.styling_pos)
+        self.end_styled = self.styling_pos = end
+
+    def Colourise(self, start, end):
+        self.end_styled = min(self.end_styled, start)
+        self.OnStyleNeeded(None, forceAll=True)
+
+    def StyleTo(self, pos):
+        '''Style up to 'pos', as a StyleNeeded event'''
+        if self.end_styled < pos:
+            self.OnStyleNeeded(Event(pos))
+
+
+class Event(object):
+
+    def __init__(self, pos):
+        self.pos = pos
+
+    def GetPosition(self):
+        return self.pos
+
+
+class LineLexerCtrl(StyledTextCtrl):
+    '''The AvsStyledTextCtrl styling with AvsLexer'''
+
+    def __init__(self, text):
+        self.unmodifiedLines = 0
+        StyledTextCtrl.__init__(self, text)
+
+    def _Modified(self, pos, length, inserted):
+        if inserted:
+            pos += length
+        self.unmodifiedLines = min(self.unmodifiedLines,
+            self.GetLineCount() - 1 - self.LineFromPosition(pos))
+
+    def Colourise(self, start, end):
+        self.unmodifiedLines = 0
+        StyledTextCtrl.Colourise(self, start, end)
+
+    def OnStyleNeeded(self, event, forceAll=False):
+        line = self.LineFromPosition(self.GetEndStyled())
+        if forceAll:
+            last_line = self.GetLineCount() - 1
+        elif self.app.options['wrap']: # workaround
+            last_line = line + self.LinesOnScreen()
+        else:
+            last_line = self.LineFromPosition(event.GetPosition())
+        string_delimiters = ['"', "'"] if self.filename.endswith('.vpy') else '"'
+        lexer = AvsLexer(self.avsfilterdict, self.app.avskeywords, self.app.avsdatatypes,
+            self.app.avsmiscwords, self.app.avsoperators, self.app.avssingleletters,
+            string_delimiters, self.app.options['usestringeol'],
+            self.app.options['syntaxhighlight_styleinsidetriplequotes'],
+            self.app.options['syntaxhighlight_preferfunctions'])
+        plugins = lexer.StyleLines(self, line, last_line,
+                                   self.GetLineCount() - 1 - self.unmodifiedLines)
+        if self.GetEndStyled() == self.GetLength():
+            self.unmodifiedLines = self.GetLineCount()
+        for path in plugins:
+            self.parseDllname(path)
+
+    def parseDllname(self, path):
+        path = path.lower().strip('"')
+        ext = os.path.splitext(path)[1]
+        if ext in ('.dll', '.so'):
+            dllname = os.path.basename(path[:-len(ext)])
+            if dllname.count('_') and dllname not in self.app.dllnameunderscored:
+                self.app.dllnameunderscored.add(dllname)
+                self.app.defineScriptFilterInfo()
+
+
+class CharLexerCtrl(StyledTextCtrl):
+    '''The AvsStyledTextCtrl styling before AvsLexer'''
+
+    def OnStyleNeeded(self, event, forceAll=False):
+        if forceAll:
+            start = -1
+            line = 0
+            isCommentNest = 0
+            end = self.GetLength()
+        else:
+            pos = self.GetEndStyled()
+            line = self.LineFromPosition(pos)
+            start = self.PositionFromLine(line) - 1
+            if self.GetStyleAt(start) == self.STC_AVS_BLOCKCOMMENT:
+                isCommentNest = self.GetLineState(line - 1)
+            else:
+                isCommentNest = 0
+            if self.app.options['wrap']: # workaround
+                end = self.GetLineEndPosition(line + self.LinesOnScreen()) + 1
+            else:
+                end = event.GetPosition()
+        if start < 1:
+            start = 0
+            state = self.STC_AVS_DEFAULT
+        else:
+            state = self.GetStyleAt(start)
+            if state == self.STC_AVS_STRINGEOL:
+                start += 1
+                state = self.STC_AVS_DEFAULT
+        isLoadPlugin = False
+        flag = None # True -> start, False -> end
+        if line and self.GetFoldLevel(line - 1) & stc.STC_FOLDLEVELHEADERFLAG:
+            prev_flag = True
+        else:
+            prev_flag = None
+        self.endstyled = pos = start
+        fragment = []
+        hexfragment = []
+        # vpy hack, remove when VapourSynth is supported (with a custom Python lexer)
+        string_delimiters = ['"', "'"] if self.filename.endswith('.vpy') else '"'
+        self.StartStyling(pos, 31)
+        while pos <= end:
+            ch = unichr(self.GetCharAt(pos))
+            isEOD = (ch == unichr(0))
+            isEOL = (ch == '\n' or ch == '\r' or isEOD)
+            if state == self.STC_AVS_DEFAULT:
+                if ch == '#':
+                    state = self.STC_AVS_COMMENT
+                elif ch == '/' and unichr(self.GetCharAt(pos+1)) == '*':
+                    pos += 1
+                    flag = True
+                    state = self.STC_AVS_BLOCKCOMMENT
+                elif ch in string_delimiters:
+                    self.ColourTo(pos-1, state)
+                    if unichr(self.GetCharAt(pos+1)) in string_delimiters and unichr(self.GetCharAt(pos+2)) in string_delimiters:
+                        pos += 2
+                        if self.app.options['syntaxhighlight_styleinsidetriplequotes']:
+                            self.ColourTo(pos, self.STC_AVS_TRIPLE)
+                        else:
+                            triple_start = pos
+                            state = self.STC_AVS_TRIPLE
+                    else:
+                        state = self.STC_AVS_STRING
+                    if isLoadPlugin:
+                        isLoadPlugin = pos
+                elif ch == '$':
+                    hexfragment = []
+                    state = self.STC_AVS_NUMBERBAD
+                elif ch == '[' and unichr(self.GetCharAt(pos+1)) == '*':
+                    pos += 1
+                    isCommentNest += 1
+                    self.SetLineState(self.LineFromPosition(pos), isCommentNest)
+                    flag = True
+                    state = self.STC_AVS_BLOCKCOMMENT
+                elif ch == '[' and unichr(self.GetCharAt(pos+1)) == '<':
+                    pos += 1
+                    state = self.STC_AVS_USERSLIDER
+                elif ch.isalpha() or ch == '_' or ch in self.app.avssingleletters:
+                    fragment = [ch]
+                    state = self.STC_AVS_IDENTIFIER
+                elif ch.isdigit():
+                    state = self.STC_AVS_NUMBER
+                elif ch in self.app.avsoperators:
+                    self.ColourTo(pos - 1, state)
+                    self.ColourTo(pos, self.STC_AVS_OPERATOR)
+                    if ch == '{':
+                        flag = True
+                    elif ch == '}':
+                        flag = None if flag else False
+                else:
+                    if isEOD:
+                        self.ColourTo(pos - 1, self.STC_AVS_DEFAULT)
+                    else:
+                        self.ColourTo(pos, self.STC_AVS_DEFAULT)
+            elif state == self.STC_AVS_COMMENT:
+                if isEOL:
+                    if isEOD:
+                        self.ColourTo(pos - 1, self.STC_AVS_COMMENT)
+                    else:
+                        self.ColourTo(pos, self.STC_AVS_COMMENT)
+                    state = self.STC_AVS_DEFAULT
+            elif state == self.STC_AVS_BLOCKCOMMENT:
+                if isEOD or pos == end:
+                    self.ColourTo(pos - 1, self.STC_AVS_BLOCKCOMMENT)
+                elif isEOL:
+                    self.SetLineState(self.LineFromPosition(pos), isCommentNest)
+                elif isCommentNest:
+                    if ch == '*' and unichr(self.GetCharAt(pos+1)) == ']':
+                        pos += 1
+                        isCommentNest -= 1
+                        self.SetLineState(self.LineFromPosition(pos), isCommentNest)
+                        flag = None if flag else False
+                        if not isCommentNest:
+                            self.ColourTo(pos, self.STC_AVS_BLOCKCOMMENT)
+                            state = self.STC_AVS_DEFAULT
+                    elif ch == '[' and unichr(self.GetCharAt(pos+1)) == '*':
+                        pos += 1
+                        isCommentNest += 1
+                        self.SetLineState(self.LineFromPosition(pos), isCommentNest)
+                        flag = True
+                elif ch == '*' and unichr(self.GetCharAt(pos+1)) == '/':
+                    pos += 1
+                    self.ColourTo(pos, self.STC_AVS_BLOCKCOMMENT)
+                    flag = None if flag else False
+                    state = self.STC_AVS_DEFAULT
+            elif state == self.STC_AVS_IDENTIFIER:
+                if fragment[0] not in self.app.avssingleletters and (ch.isalnum() or ch == '_'):
+                    fragment.append(ch)
+                else:
+                    pos2 = pos
+                    pos -= 1
+                    word =''.join(fragment).lower()
+                    while unichr(self.GetCharAt(pos2)) in (u' ', u'\t'):
+                        pos2 += 1
+                    ch2 = unichr(self.GetCharAt(pos2))
+                    if word in self.app.avsdatatypes and unichr(self.GetCharAt(pos+1)).isspace():
+                        self.ColourTo(pos, self.STC_AVS_DATATYPE)
+                    elif word in self.app.avskeywords:
+                        self.ColourTo(pos, self.STC_AVS_KEYWORD)
+                    elif word in self.app.avsmiscwords:
+                        self.ColourTo(pos, self.STC_AVS_MISCWORD)
+                        if word == '__end__':
+                            line = self.LineFromPosition(pos)
+                            self.UpdateFolding(line, True, prev_flag)
+                            level = (self.GetFoldLevel(line) & stc.STC_FOLDLEVELNUMBERMASK) + 1
+                            for line in range(line + 1, self.LineFromPosition(end) + 1):
+                                self.SetFoldLevel(line, level)
+                            self.ColourTo(end, self.STC_AVS_ENDCOMMENT)
+                            break
+                    elif ch2 == u'(':
+                        if word in self.avsfilterdict:
+                            #~ self.ColourTo(pos, self.keywordstyles[word])
+                            self.ColourTo(pos, self.avsfilterdict[word][1])
+                            if word == 'loadplugin':
+                                isLoadPlugin = True
+                        else:
+                            self.ColourTo(pos, self.STC_AVS_UNKNOWNFUNCTION)
+                    elif ch2 == u'=' and unichr(self.GetCharAt(pos2 + 1)) != '=':
+                        if self.GetOpenParenthesesPos(pos - len(word)):
+                            self.ColourTo(pos, self.STC_AVS_PARAMETER)
+                        else:
+                            self.ColourTo(pos, self.STC_AVS_ASSIGN)
+                    else:
+                        if self.app.options['syntaxhighlight_preferfunctions'] and \
+                                word in self.avsfilterdict:
+                            #~ self.ColourTo(pos, self.keywordstyles[word])
+                            self.ColourTo(pos, self.avsfilterdict[word][1])
+                        else:
+                            self.ColourTo(pos, self.STC_AVS_DEFAULT)
+                    fragment = []
+                    state = self.STC_AVS_DEFAULT
+            elif state == self.STC_AVS_STRING:
+                if self.app.options['usestringeol']:
+                    if unichr(self.GetCharAt(pos-1)) in string_delimiters and unichr(self.GetCharAt(pos)) in string_delimiters and unichr(self.GetCharAt(pos+1)) in string_delimiters:
+                        state = self.STC_AVS_TRIPLE
+                        pos += 1
+                    elif ch in string_delimiters or isEOL:
+                        if isEOL:
+                            if isEOD:
+                                self.ColourTo(pos - 1, self.STC_AVS_STRINGEOL)
+                            else:
+                                self.ColourTo(pos, self.STC_AVS_STRINGEOL)
+                            isLoadPlugin = False
+                        else:
+                            self.ColourTo(pos, self.STC_AVS_STRING)
+                            if isLoadPlugin:
+                                self.parseDllname(isLoadPlugin, pos)
+                                isLoadPlugin = False
+                        state = self.STC_AVS_DEFAULT
+                else:
+                    if unichr(self.GetCharAt(pos-1)) in string_delimiters and unichr(self.GetCharAt(pos)) in string_delimiters and unichr(self.GetCharAt(pos+1)) in string_delimiters:
+                        state = self.STC_AVS_TRIPLE
+                        pos += 1
+                    elif ch in string_delimiters:
+                        self.ColourTo(pos, self.STC_AVS_STRING)
+                        state = self.STC_AVS_DEFAULT
+                        if isLoadPlugin:
+                            self.parseDllname(isLoadPlugin, pos)
+                            isLoadPlugin = False
+                    elif isEOD:
+                        self.ColourTo(pos - 1, self.STC_AVS_STRING)
+                        state = self.STC_AVS_DEFAULT
+                        isLoadPlugin = False
+            elif state == self.STC_AVS_TRIPLE:
+                # AviSynth interprets """"""" as '"' etc.
+                triple_quote_quirk = False
+                if ch == '"' and pos - triple_start == 1:
+                    last_quote_pos = pos
+                    while unichr(self.GetCharAt(last_quote_pos)) == '"':
+                        last_quote_pos += 1
+                    quote_number = last_quote_pos - pos
+                    if quote_number > 3:
+                        pos += quote_number - 1 - 1
+                        triple_quote_quirk = True
+                if not triple_quote_quirk:
+                    if isEOD or ((pos - triple_start > 2) and ch in string_delimiters and unichr(self.GetCharAt(pos-1)) in string_delimiters and unichr(self.GetCharAt(pos-2)) in string_delimiters):
+                        self.ColourTo(pos, self.STC_AVS_TRIPLE)
+                        state = self.STC_AVS_DEFAULT
+                        if isLoadPlugin:
+                            if not isEOD:
+                                self.parseDllname(isLoadPlugin, pos)
+                            isLoadPlugin = False
+                    elif isEOL:
+                        self.ColourTo(pos, self.STC_AVS_TRIPLE)
+            elif state == self.STC_AVS_NUMBER:
+                if not ch.isdigit():
+                    pos -= 1
+                    self.ColourTo(pos, self.STC_AVS_NUMBER)
+                    state = self.STC_AVS_DEFAULT
+            elif state == self.STC_AVS_NUMBERBAD:
+                if ch.isalnum() or ch == '_':
+                    hexfragment.append(ch)
+                else:
+                    pos -= 1
+                    #~ if len(hexfragment) == 6 and sum([c.isdigit() or c.lower() in ('a', 'b', 'c', 'd', 'e', 'f') for c in hexfragment]) == 6:
+                        #~ self.ColourTo(pos, self.STC_AVS_NUMBER)
+                    #~ else:
+                        #~ self.ColourTo(pos, self.STC_AVS_NUMBERBAD)
+                    try:
+                        int(''.join(hexfragment), 16)
+                        self.ColourTo(pos, self.STC_AVS_NUMBER)
+                    except:
+                        self.ColourTo(pos, self.STC_AVS_NUMBERBAD)
+                    hexfragment = []
+                    state = self.STC_AVS_DEFAULT
+            elif state == self.STC_AVS_USERSLIDER:
+                if isEOL or (ch == ']' and unichr(self.GetCharAt(pos-1)) == '>'):
+                    if isEOL:
+                        self.ColourTo(pos, self.STC_AVS_NUMBERBAD)
+                    else:
+                        self.ColourTo(pos, self.STC_AVS_USERSLIDER)
+                    state = self.STC_AVS_DEFAULT
+            elif state == self.STC_AVS_ENDCOMMENT:
+                line = self.LineFromPosition(pos)
+                if self.GetStyleAt(self.PositionFromLine(line)) != self.STC_AVS_ENDCOMMENT:
+                    line += 1
+                level = (self.GetFoldLevel(line) & stc.STC_FOLDLEVELNUMBERMASK)
+                for line in range(line, self.LineFromPosition(end) + 1):
+                    self.SetFoldLevel(line, level)
+                self.ColourTo(end, self.STC_AVS_ENDCOMMENT)
+                break
+            ch = unichr(self.GetCharAt(pos))
+            if pos != start and (ch == unichr(0) or ch == '\n' or ch == '\r'):
+                self.UpdateFolding(self.LineFromPosition(pos), flag, prev_flag)
+                prev_flag = flag
+                flag = None
+            pos += 1
+
+    def ColourTo(self, pos, style):
+        self.SetStyling(pos +1 - self.endstyled, style)
+        self.endstyled = pos+1
+
+    def parseDllname(self, start, end):
+        path = self.GetTextRange(start, end).lower().strip('"')
+        ext = os.path.splitext(path)[1]
+        if ext in ('.dll', '.so'):
+            dllname = os.path.basename(path[:-len(ext)])
+            if dllname.count('_') and dllname not in self.app.dllnameunderscored:
+                self.app.dllnameunderscored.add(dllname)
+                self.app.defineScriptFilterInfo()
+
+    def UpdateFolding(self, line, flag, prev_flag):
+        if line == 0:
+            level = stc.STC_FOLDLEVELBASE
+        else:
+            level = self.GetFoldLevel(line - 1) & stc.STC_FOLDLEVELNUMBERMASK
+            if prev_flag:
+                level += 1
+        if flag == True:
+            level |= stc.STC_FOLDLEVELHEADERFLAG
+        elif flag == False:
+            level = max(stc.STC_FOLDLEVELBASE, level - 1)
+        elif not self.GetLine(line).strip():
+            level |=  stc.STC_FOLDLEVELWHITEFLAG
+        self.SetFoldLevel(line, level)
+
+    def GetOpenParenthesesPos(self, pos):
+        boolInside = False
+        nclose = 1
+        stylesToSkip = (self.STC_AVS_STRING, self.STC_AVS_TRIPLE, self.STC_AVS_USERSLIDER)
+        while pos >= 0:
+            c = unichr(self.GetCharAt(pos))
+            if self.GetStyleAt(pos) not in stylesToSkip:
+                if c == ')':
+                    nclose += 1
+                if c == '(':
+                    nclose -= 1
+                if c == '\n':
+                    current = self.GetLine(self.LineFromPosition(pos)).strip()
+                    next = self.GetLine(self.LineFromPosition(pos+1)).strip()
+                    if not current.endswith('\\') and not next.startswith('\\'):
+                        # this is a not a multiline statement
+                        # either an error or we weren't inside a function call to begin with
+                        return None
+            if nclose == 0:
+                if self.GetStyleAt(pos) in self.commentStyle:
+                    return None
+                else:
+                    return pos
+            pos -= 1
+        return None
+
+
+def generate_script(lines):
+    '''Return an AviSynth script of about 'lines' lines'''
+    text = [
+        u'LoadPlugin("C:\\plugins\\ffms_2.dll")',
+        u'src = FFVideoSource("source.mkv", fpsnum=24000, fpsden=1001)',
+        u'title = """The "long" cut"""',
+    ]
+    i = 0
+    while len(text) < lines - 1:
+        a = i * 100
+        text.extend([
+            u'# part {0}'.format(i),
+            u'/* block comment',
+            u'   about part {0} */'.format(i),
+            u'function Grade{0}(clip c, float "gamma", int "hue") {{'.format(i),
+            u'    c = c.Levels(16, gamma, 235, 0, 255, coring=false)',
+            u'    return c.Tweak(hue=hue, sat=1.1)',
+            u'}',
+            u'v{0} = src.Trim({1}, {2}).Grade{0}(gamma=[<"gamma{0}", 0.5, 2.0, 1.0>]) ++ \\'
+                .format(i, a, a + 49),
+            u'\\    src.Trim({0}, {1}).Subtitle("part {2}", text_color=$FFFF00) [* a [* b *] *]'
+                .format(a + 50, a + 99, i),
+            u'',
+        ])
+        i += 1
+    text.append(u'return v0.Subtitle(title, x=Width(v0) / 2)')
+    return u'\n'.join(text[:lines]) + u'\n'
+
+
+def compare(ctrl, other):
+    '''Return the number of positions and lines with different styling'''
+    styles = sum(1 for a, b in zip(ctrl.styles, other.styles) if a != b)
+    levels = sum(1 for a, b in zip(ctrl.fold_levels, other.fold_levels) if a != b)
+    return styles, levels
+
+
+def edit_lines(ctrl, edits):
+    '''Return the lines changed by edit-* cases, spread over the script'''
+    count = ctrl.GetLineCount()
+    return [count * (i + 1) // (edits + 1) for i in range(edits)]
+
+
+def edit(ctrl, line):
+    '''Change the first number of the line, or add one'''
+    pos = ctrl.PositionFromLine(line)
+    text = ctrl.GetLine(line)
+    digit = next((i for i, c in enumerate(text) if c.isdigit()), None)
+    if digit is None:
+        ctrl.InsertText(pos, u'1')
+    else:
+        ctrl.DeleteRange(pos + digit, 1)
+        ctrl.InsertText(pos + digit, unicode((int(text[digit]) + 1) % 10))
+
+
+def run_case(case, cls, text, args):
+    '''Return (ms per styling, styled control)'''
+    ctrl = cls(text)
+    if case == 'open':
+        start = time.time()
+        ctrl.Colourise(0, -1)
+        return (time.time() - start) * 1000, ctrl
+    ctrl.Colourise(0, -1)
+    elapsed = 0
+    if case == 'comment-all':
+        lines = [ctrl.GetLineCount() // 2]
+    else:
+        lines = edit_lines(ctrl, args.edits)
+    for line in lines:
+        if case == 'comment-all':
+            ctrl.InsertText(ctrl.PositionFromLine(line), u'[*\n')
+        else:
+            edit(ctrl, line)
+        start = time.time()
+        if case == 'edit-visible':
+            ctrl.StyleTo(ctrl.GetLineEndPosition(line + SCREEN_LINES))
+        else:
+            ctrl.OnStyleNeeded(None, forceAll=True)
+        elapsed += time.time() - start
+    if case == 'edit-visible':
+        ctrl.OnStyleNeeded(None, forceAll=True) # for comparing the styles
+    return elapsed * 1000 / len(lines), ctrl
+
+
+def main(args):
+    text = generate_script(args.lines)
+    print 'Styling a {0} line script ({1} KB)'.format(text.count('\n'), len(text) // 1024)
+    for case in ('open', 'edit-all', 'edit-visible', 'comment-all'):
+        old_elapsed, old_ctrl = run_case(case, CharLexerCtrl, text, args)
+        elapsed, ctrl = run_case(case, LineLexerCtrl, text, args)
+        styles, levels = compare(ctrl, old_ctrl)
+        if styles or levels:
+            check = '{0} chars and {1} fold levels differ'.format(styles, levels)
+        else:
+            check = 'same styling'
+        print '{0:<14}{1:9.2f} ms  old {2:9.2f} ms  {3:7.1f}x  ({4})'.format(
+              case + ':', elapsed, old_elapsed, old_elapsed / elapsed if elapsed else 0, check)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the syntax highlighting '
+                                     'of large scripts')
+    parser.add_argument('--lines', type=int, default=5000)
+    parser.add_argument('--edits', type=int, default=10,
+                        help='edits averaged in the edit-* cases')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_args(sys.argv[1:]))
@@ -0,0 +1,86 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# bench_pipe - end-to-end speed of piping frames to an external application
+#
+# Pipes a YV12 clip with a y4m header to 'cat > /dev/null' (or another sink
+# command) as MacroPipe does, first writing each frame after rendering it and
+# then with PipeWriter and RawFrameChunks, which write from another thread
+# and from the frame memory when the planes aren't padded.  'blur' adds that
+# many Blur(1) calls to the script, to make rendering slower.  pyavs runs on
+# the simulated AviSynth backend of avisynth_sim.py.
+#
+# Usage: python benchmarks/bench_pipe.py [frames] [width] [height] [blur] [sink]
+#
+# Dependencies:
+#     Python (tested on v2.7)
+#     NumPy
+
+import os
+import sys
+import time
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import avisynth_sim
+avisynth_sim.install()
+import pyavs
+import pyavs_export
+
+
+def run(clip, frames, sink, threaded):
+    '''Pipe the frames to the sink, return (fps, PipeWriter stats or None)'''
+    cmd = subprocess.Popen(sink, shell=True, stdin=subprocess.PIPE)
+    start = time.time()
+    cmd.stdin.write(clip.Y4MHeader())
+    stats = None
+    if threaded:
+        writer = pyavs_export.PipeWriter(cmd.stdin)
+        for frame in range(frames):
+            writer.Write(clip.RawFrameChunks(frame, True))
+        writer.Close()
+        stats = writer.stats()
+    else:
+        for frame in range(frames):
+            cmd.stdin.write(clip.RawFrame(frame, True, reuse=True))
+    cmd.stdin.close()
+    cmd.wait()
+    return frames / (time.time() - start), stats
+
+
+def main(frames=200, width=1920, height=1080, blur=0, sink='cat > /dev/null'):
+    script = ('ColorBars(width={0}, height={1}, pixel_type="YV12")'
+              '.Trim(0, {2}).Loop(2){3}'.format(width, height, frames * 2,
+                                                '.Blur(1)' * blur))
+    clip = pyavs.AvsClip(script, display_clip=False, frame_cache_size=0)
+    if not clip.initialized or clip.IsErrorClip():
+        sys.exit('Error creating the clip: {0}'.format(clip.error_message))
+    print 'Pipe to "{0}", YV12 {1}x{2}, {3} x Blur ({4} frames)'.format(
+          sink, width, height, blur, frames)
+    for threaded in (False, True):
+        fps, stats = run(clip, frames, sink, threaded)
+        print '{0:<10}{1:8.1f} fps{2}'.format('threaded:' if threaded else 'serial:', fps,
+              '  (writer waited {starved} times, renderer {blocked} times)'.format(**stats)
+              if stats else '')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:5]] + sys.argv[5:6]
+    main(*args)
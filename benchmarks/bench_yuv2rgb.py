@@ -0,0 +1,110 @@
+# AvsP - an AviSynth editor
+# 
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+# 
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# bench_yuv2rgb - compare the display YUV -> RGB conversions without AviSynth
+# 
+# Runs pyavs on the simulated AviSynth backend of avisynth_sim.py and times, 
+# on YV12 frames at 1080p and 4K:
+# 
+#     NumPy      pyavs.YUV2RGBConverter, top-down RGB as used by the wx DrawFrame
+#     NumPy-flip the same with bgr and flip, the bottom-up BGR DIB layout used 
+#                for high bit depth clips on Windows
+#     chain      the ConvertToRGB24 + ShowRed + ShowBlue + MergeRGB filter chain 
+#                followed by the line-by-line flip done by the wx DrawFrame
+# 
+# The chain is rendered by the simulator, so its time is only comparable 
+# between runs of this benchmark, not with a real AviSynth.  The ratio column 
+# is the chain time divided by the NumPy one.
+# 
+# Usage: python benchmarks/bench_yuv2rgb.py [frames]
+# 
+# Dependencies:
+#     Python (tested on v2.7)
+#     NumPy
+
+import os
+import sys
+import time
+import ctypes
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy
+import avisynth_sim
+avisynth_sim.install()
+import pyavs
+
+SIZES = ((1920, 1080), (3840, 2160))
+MATRIX = 'Rec709'
+
+
+def bench_converter(width, height, frames, flip=False):
+    '''Return the average ms per frame of YUV2RGBConverter'''
+    random = numpy.random.RandomState(0)
+    planes = (random.randint(0, 256, (height, width)).astype(numpy.uint8), 
+              random.randint(0, 256, (height / 2, width / 2)).astype(numpy.uint8), 
+              random.randint(0, 256, (height / 2, width / 2)).astype(numpy.uint8))
+    converter = pyavs.YUV2RGBConverter(MATRIX, bgr=flip, flip=flip)
+    rgb = converter.Convert(planes)
+    if flip: # the first row of the output is the last one of the picture
+        expected = pyavs.YUV2RGBConverter(MATRIX).Convert(planes)
+        if not (rgb[0] == expected[-1][:, ::-1]).all():
+            sys.exit('Wrong flipped output')
+    start = time.time()
+    for i in range(frames):
+        converter.Convert(planes)
+    return (time.time() - start) * 1000 / frames
+
+
+def bench_filter_chain(width, height, frames):
+    '''Return the average ms per frame of the AviSynth display path'''
+    script = ('ColorBars(width={0}, height={1}, pixel_type="YV12")'
+              '.Trim(0, {2}).Loop(2)'.format(width, height, frames * 2))
+    clip = pyavs.AvsClip(script, matrix=[MATRIX[3:], 'tv'], frame_cache_size=0)
+    if not clip.initialized or clip.IsErrorClip():
+        sys.exit('Error creating the clip: {0}'.format(clip.error_message))
+    P_UBYTE = ctypes.POINTER(ctypes.c_ubyte)
+    buf = ctypes.create_string_buffer(width * height * 3)
+    start = time.time()
+    for frame in range(frames):
+        clip._GetFrame(frame)
+        # Same copy as the wx DrawFrame
+        read_addr = ctypes.addressof(clip.pBits.contents) + (height - 1) * clip.display_pitch
+        write_addr = ctypes.addressof(buf)
+        for i in range(height):
+            ctypes.memmove(ctypes.cast(write_addr, P_UBYTE), 
+                           ctypes.cast(read_addr, P_UBYTE), width * 3)
+            read_addr -= clip.display_pitch
+            write_addr += width * 3
+    return (time.time() - start) * 1000 / frames
+
+
+def main(frames=20):
+    print 'YUV -> RGB24 display conversion, {0} ({1} frames)'.format(MATRIX, frames)
+    for width, height in SIZES:
+        native = bench_converter(width, height, frames)
+        flipped = bench_converter(width, height, frames, flip=True)
+        chain = bench_filter_chain(width, height, frames)
+        print ('{0:>4}x{1:<4}  NumPy: {2:7.1f} ms  NumPy-flip: {3:7.1f} ms  '
+               'chain: {4:7.1f} ms  ratio: {5:4.1f}x'.format(
+               width, height, native, flipped, chain, chain / native))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -16,7 +16,6 @@ padding = 0
 import os
 import os.path
 import re
-import wx
 import pyavs
 
 # run in thread
@@ -83,18 +82,10 @@ avsp.Options['use_subdirs'] = use_subdirs
 avsp.Options['frame_suffix'] = frame_suffix
 
 # Eval the script. Return if error
-workdir_exp = self.ExpandVars(self.options['workdir'])
-if (self.options['useworkdir'] and self.options['alwaysworkdir']
-    and os.path.isdir(workdir_exp)):
-        workdir = workdir_exp
-else:
-    workdir = self.currentScript.workdir
-# vpy hack, remove when VapourSynth is supported
-if os.name == 'nt' and avsp.GetScriptFilename().endswith('.vpy'):
-    avsp.SaveScript()
-AVS = pyavs.AvsClip(avsp.GetText(clean=True), filename=avsp.GetScriptFilename(), 
-                    workdir=workdir, matrix=self.matrix, interlaced=self.interlaced, 
-                    swapuv=self.swapuv)
+# The same source is rendered by avsp.RenderFrames when using several processes
+text, script_filename, workdir = avsp.SafeCall(self.GetExportSource)
+AVS = pyavs.AvsClip(text, filename=script_filename, workdir=workdir, 
+                    matrix=self.matrix, interlaced=self.interlaced, swapuv=self.swapuv)
 if AVS.IsErrorClip():
     avsp.MsgBox(AVS.error_message, _('Error'))
     return
@@ -159,10 +150,8 @@ else:
                         if frame_suffix else len(str(total_frames))), ext)
         filename = os.path.join(dirname, basename)
 
-# Save the images
-paths = []
-if show_progress:
-    progress = avsp.ProgressBox(total_frames, '', _('Saving images...'))
+# Get the output path of each frame
+jobs = []
 for i, frame_range in enumerate(frames):
     if use_subdirs:
         dirname2 = os.path.join(dirname, self.bookmarkDict.get(frame_range[0], 
@@ -176,16 +165,43 @@ for i, frame_range in enumerate(frames):
         filename = os.path.join(dirname2, basename2)
         frame_index = 1
     else:
-        frame_index = len(paths) + 1
+        frame_index = len(jobs) + 1
     for j, frame in enumerate(frame_range):
+        jobs.append((filename % (frame if frame_suffix else frame_index + j), frame))
+
+# Save the images
+paths = []
+if show_progress:
+    progress = avsp.ProgressBox(total_frames, '', _('Saving images...'))
+if self.options['exportworkers'] == 1 or self.swapuv or self.bit_depth:
+    for path, frame in jobs:
         if show_progress and not avsp.SafeCall(progress.Update, len(paths), 
                                 str(len(paths)) + ' / ' + str(total_frames))[0]:
             break
-        ret = self.SaveImage(filename % (frame if frame_suffix else frame_index + j), 
-                             frame=frame, avs_clip=AVS, quality=quality, depth=depth)
+        ret = self.SaveImage(path, frame=frame, avs_clip=AVS, quality=quality, depth=depth)
+        if not ret:
+            break
+        paths.append(ret)
+else:
+    # Render the frames in several processes, SaveImage only saves them
+    png16 = ext == '.png' and depth == 16
+    export = avsp.RenderFrames([frame for path, frame in jobs], rgb=not png16)
+    rendered = iter(export)
+    for path, frame in jobs:
+        if show_progress and not avsp.SafeCall(progress.Update, len(paths), 
+                                str(len(paths)) + ' / ' + str(total_frames))[0]:
+            break
+        data = next(rendered, (None, None))[1]
+        if data is None:
+            avsp.MsgBox(u'\n\n'.join((_('Error requesting frame {number}').format(number=frame), 
+                        export.error_message or '')), _('Error'))
+            break
+        ret = self.SaveImage(path, frame=frame, avs_clip=AVS, quality=quality, depth=depth, 
+                             data=data)
         if not ret:
             break
         paths.append(ret)
+    export.Stop()
 if show_progress:
     avsp.SafeCall(progress.Destroy)
 else:
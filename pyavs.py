@@ -35,8 +35,21 @@
 
 import sys
 import os
+import csv
 import ctypes
 import re
+import mmap
+import time
+import Queue
+import struct
+import uuid
+import hashlib
+import tempfile
+import threading
+import heapq
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 x86_64 = sys.maxsize > 2**32
 if x86_64:
@@ -44,25 +57,1642 @@ if x86_64:
 else:
     import avisynth
 import global_vars
+import pyavs_export
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 try: _
 except NameError:
     def _(s): return s
 
+# AviSynth scripts are evaluated from the current directory, so the threads
+# that evaluate them take turns
+_eval_lock = threading.Lock()
+
+
+class FrameCache(object):
+    '''LRU cache of AviSynth video frames with a budget in bytes
+    
+    Holding an AVS_VideoFrame keeps its buffer alive on the AviSynth side, so 
+    the budget is accounted using the size of the frame planes.
+    '''
+    
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def get(self, key):
+        '''Return the cached value for key, or None'''
+        try:
+            value, size = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return
+        self._entries[key] = value, size # mark as most recently used
+        self.hits += 1
+        return value
+    
+    def put(self, key, value, size):
+        '''Add a value, evicting the least recently used ones if needed'''
+        self.pop(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = value, size
+        self.bytes += size
+        self._shrink(self.max_bytes)
+    
+    def pop(self, key):
+        try:
+            value, size = self._entries.pop(key)
+        except KeyError:
+            return
+        self.bytes -= size
+        return value
+    
+    def discard(self, match):
+        '''Remove all the entries whose key satisfies match(key)'''
+        for key in [key for key in self._entries if match(key)]:
+            self.pop(key)
+    
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+    
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._shrink(max_bytes)
+    
+    def _shrink(self, max_bytes):
+        while self.bytes > max_bytes and self._entries:
+            key, (value, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+    
+    def stats(self):
+        '''Return a dict with the cache usage counters'''
+        lookups = self.hits + self.misses
+        return dict(entries=len(self._entries), bytes=self.bytes, 
+                    max_bytes=self.max_bytes, hits=self.hits, 
+                    misses=self.misses, evictions=self.evictions, 
+                    hit_ratio=float(self.hits) / lookups if lookups else 0.0)
+
+
+class BufferPool(object):
+    '''Pool of ctypes buffers that are reused while their size is unchanged
+    
+    Each key holds a single buffer, so its contents are only valid until the 
+    next get() for the same key.
+    '''
+    
+    def __init__(self):
+        self.allocations = 0
+        self.reuses = 0
+        self._buffers = {}
+    
+    def get(self, key, size):
+        '''Return a writable buffer of 'size' bytes for key'''
+        buf = self._buffers.get(key)
+        if buf is not None and len(buf) == size:
+            self.reuses += 1
+            return buf
+        buf = self._buffers[key] = ctypes.create_string_buffer(size)
+        self.allocations += 1
+        return buf
+    
+    def clear(self):
+        self._buffers.clear()
+    
+    def stats(self):
+        '''Return a dict with the pool usage counters'''
+        return dict(buffers=len(self._buffers), 
+                    bytes=sum(len(buf) for buf in self._buffers.itervalues()), 
+                    allocations=self.allocations, reuses=self.reuses)
+
+
+class RenderTimings(object):
+    '''Ring buffer of the time spent in each stage of showing a frame
+    
+    The stages are added with Add() as they happen, possibly from several
+    threads, and the frame record is closed with Commit() when the frame is
+    shown.  Only the last 'size' frames are kept.  All times are seconds.
+    '''
+    
+    stages = ('source', 'display', 'convert', 'draw', 'paint', 'total')
+    
+    def __init__(self, size=300):
+        self.size = size
+        self.lock = threading.Lock()
+        self._records = collections.deque(maxlen=size) # (frame, {stage: seconds})
+        self._pending = collections.OrderedDict() # frame -> {stage: seconds}
+    
+    def Add(self, frame, stage, seconds):
+        '''Add time to a stage of the frame that will be committed next'''
+        with self.lock:
+            record = self._pending.get(frame)
+            if record is None:
+                record = self._pending[frame] = {}
+                if len(self._pending) > self.size: # never shown
+                    self._pending.popitem(last=False)
+            record[stage] = record.get(stage, 0) + seconds
+    
+    def Commit(self, frame):
+        '''Move the stages of a frame to the ring buffer and return them'''
+        with self.lock:
+            record = self._pending.pop(frame, {})
+            self._records.append((frame, record))
+            return record
+    
+    def Discard(self, frame):
+        '''Drop the pending stages of a frame that was drawn but not committed'''
+        with self.lock:
+            self._pending.pop(frame, None)
+    
+    def Last(self):
+        '''Return the (frame, {stage: seconds}) record of the last frame, or None'''
+        with self.lock:
+            return self._records[-1] if self._records else None
+    
+    def Percentiles(self, percentiles=(50, 90, 99), last=None):
+        '''Return a {stage: [seconds, ...]} dict with the given percentiles of
+        each stage over the last 'last' frames, by default all of them.
+        Frames that skipped a stage, like cached ones, count as 0'''
+        with self.lock:
+            records = list(self._records)[-last:] if last else list(self._records)
+        result = {}
+        for stage in self.stages:
+            values = sorted(record.get(stage, 0) for frame, record in records)
+            if not values:
+                result[stage] = [0] * len(percentiles)
+                continue
+            result[stage] = [values[min(len(values) - 1, int(len(values) * p / 100.0))]
+                             for p in percentiles]
+        return result
+    
+    def WriteCSV(self, file, percentiles=(50, 90, 99)):
+        '''Write the frame records in milliseconds, followed by the percentiles'''
+        with self.lock:
+            records = list(self._records)
+        writer = csv.writer(file)
+        writer.writerow(['frame'] + ['{0} (ms)'.format(stage) for stage in self.stages])
+        for frame, record in records:
+            writer.writerow([frame] + ['{0:.3f}'.format(record.get(stage, 0) * 1000)
+                                       for stage in self.stages])
+        writer.writerow([])
+        summary = self.Percentiles(percentiles)
+        for i, p in enumerate(percentiles):
+            writer.writerow(['p{0}'.format(p)] + ['{0:.3f}'.format(summary[stage][i] * 1000)
+                                                  for stage in self.stages])
+    
+    def clear(self):
+        with self.lock:
+            self._records.clear()
+            self._pending.clear()
+    
+    def resize(self, size):
+        with self.lock:
+            self.size = size
+            self._records = collections.deque(self._records, maxlen=size)
+    
+    def stats(self):
+        with self.lock:
+            return dict(frames=len(self._records), pending=len(self._pending), size=self.size)
+
+
+class RenderCache(object):
+    '''Persistent cache of drawn frames, stored as one file per frame
+    
+    Each file holds a small header followed by the data given to the drawing 
+    routine, so it can be memory-mapped and drawn directly.  The directory can 
+    be shared by several clips.  The least recently used files are removed 
+    when it goes over 'max_bytes'.  The use order is kept in the file 
+    modification times, so it survives restarts.
+    '''
+    
+    header = struct.Struct('<4sIII') # magic, width, height, pitch
+    magic = 'AVSC'
+    extension = '.frame'
+    
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self._entries = None # file name -> size, in use order.  Read on demand
+    
+    @staticmethod
+    def ScriptKey(text, workdir=''):
+        '''Return a hash of a script and the size and mtime of the files it references'''
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        sha1 = hashlib.sha1(text)
+        for path in sorted(set(re.findall(r'"([^"\r\n]+)"', text))):
+            try:
+                path = os.path.join(workdir, path.decode('utf-8'))
+                if os.path.isfile(path):
+                    sha1.update(u'{0}|{1}|{2}'.format(path, os.path.getsize(path), 
+                                                      os.path.getmtime(path)).encode('utf-8'))
+            except (EnvironmentError, UnicodeError):
+                pass
+        return sha1.hexdigest()
+    
+    def __contains__(self, key):
+        with self.lock:
+            return key + self.extension in self._Entries()
+    
+    def get(self, key):
+        '''Return a (data, width, height, pitch) tuple for key, or None
+        
+        data is a ctypes array over a copy-on-write memory map of the file.
+        '''
+        with self.lock:
+            entries = self._Entries()
+            name = key + self.extension
+            if name not in entries:
+                self.misses += 1
+                return
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+                magic, width, height, pitch = self.header.unpack_from(mapping)
+                if magic != self.magic or len(mapping) != self.header.size + pitch * height:
+                    raise ValueError('Invalid render cache file: ' + name)
+                os.utime(path, None)
+            except (EnvironmentError, ValueError, struct.error):
+                self._Remove(name)
+                self.misses += 1
+                return
+            entries[name] = entries.pop(name) # mark as most recently used
+            self.hits += 1
+        data = (ctypes.c_ubyte * (pitch * height)).from_buffer(mapping, self.header.size)
+        return data, width, height, pitch
+    
+    def put(self, key, data, width, height, pitch):
+        '''Store pitch * height bytes of data, return True on success'''
+        size = self.header.size + pitch * height
+        if size > self.max_bytes:
+            return False
+        with self.lock:
+            entries = self._Entries()
+            name = key + self.extension
+            path = os.path.join(self.directory, name)
+            try:
+                if not os.path.isdir(self.directory):
+                    os.makedirs(self.directory)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(self.header.pack(self.magic, width, height, pitch))
+                    f.write(buffer(data, 0, pitch * height))
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(path + '.tmp', path)
+            except EnvironmentError:
+                return False
+            self.bytes -= entries.pop(name, 0)
+            entries[name] = size
+            self.bytes += size
+            self._Shrink(self.max_bytes)
+        return True
+    
+    def clear(self):
+        with self.lock:
+            for name in self._Entries().keys():
+                self._Remove(name)
+    
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._Shrink(max_bytes)
+    
+    def stats(self):
+        '''Return a dict with the cache usage counters'''
+        with self.lock:
+            entries = len(self._Entries())
+        lookups = self.hits + self.misses
+        return dict(entries=entries, bytes=self.bytes, max_bytes=self.max_bytes, 
+                    hits=self.hits, misses=self.misses, evictions=self.evictions, 
+                    hit_ratio=float(self.hits) / lookups if lookups else 0.0)
+    
+    def _Entries(self):
+        if self._entries is None:
+            entries = []
+            try:
+                names = os.listdir(self.directory)
+            except EnvironmentError:
+                names = []
+            for name in names:
+                if name.endswith(self.extension):
+                    try:
+                        stat = os.stat(os.path.join(self.directory, name))
+                    except EnvironmentError:
+                        continue
+                    entries.append((stat.st_mtime, name, stat.st_size))
+            entries.sort()
+            self._entries = collections.OrderedDict(
+                (name, size) for mtime, name, size in entries)
+            self.bytes = sum(self._entries.itervalues())
+            self._Shrink(self.max_bytes)
+        return self._entries
+    
+    def _Remove(self, name):
+        self.bytes -= self._entries.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except EnvironmentError: # e.g. still mapped on Windows
+            pass
+    
+    def _Shrink(self, max_bytes):
+        while self.bytes > max_bytes and self._entries:
+            self._Remove(next(iter(self._entries)))
+            self.evictions += 1
+
+
+def ReducedClip(source, width=None, height=None, step=1, rgb=True, matrix='Rec601',
+                interlaced=False):
+    '''Return a reduced copy of the AvsClip 'source' as a new AvsClip
+    
+    One of every 'step' frames is taken and, if 'width' is given, resized to 
+    'width' x 'height', which must be mod 4.  Without 'height' the width is 
+    limited to the source one and rounded down to mod 4, which is valid for 
+    every colorspace, and the height keeps the aspect ratio.  If 'rgb' is 
+    True the clip is converted to RGB24 with the rows from top to bottom and 
+    in RGB order, otherwise to a planar YUV format, so RawFrame starts with 
+    the luma plane.  Raise avisynth.AvisynthError on error.
+    '''
+    env = source.env
+    clip = source.clip
+    if step > 1:
+        clip = env.invoke('SelectEvery', [clip, step, 0])
+    if width is not None:
+        if height is None:
+            width = max(4, min(width, source.Width) & ~3)
+            height = max(4, int(source.Height * width / float(source.Width)) & ~3)
+        clip = env.invoke('BilinearResize', [clip, width, height])
+    if rgb:
+        if not source.IsRGB:
+            clip = env.invoke('ConvertToRGB24', [clip, matrix, interlaced])
+        elif source.IsRGB32:
+            clip = env.invoke('ConvertToRGB24', clip)
+    elif not source.IsPlanar or source.IsRGB:
+        clip = env.invoke('ConvertToYV12', [clip, interlaced, matrix])
+    reduced = AvsClip(clip, env=env, display_clip=False, reorder_rgb=rgb, frame_cache_size=0)
+    if not reduced.initialized:
+        raise avisynth.AvisynthError(reduced.error_message or 'Error creating the reduced clip')
+    return reduced
+
+
+class ScriptWorker(object):
+    '''Base of the classes that process a script in a background thread
+    
+    The script is evaluated in its own AviSynth environment, so the worker 
+    never waits for the preview or holds its lock.  Subclasses override 
+    _Run, which is called in the thread with the arguments given to _Start.  
+    If a cache directory is given to _SetCachePath, the results are saved 
+    there by _Save and loaded instead by _Load while the script and its 
+    sources don't change.  The subclasses that save results define the file 
+    'header' and 'magic' and override _Read and _Write for that.  As in 
+    RenderCache, the least recently used files of the directory are removed 
+    when it goes over the 'indexcachesize' option, in MB.  callback() is 
+    called from the worker thread by _Notify.
+    '''
+    
+    header = None # struct.Struct starting with the magic string
+    magic = None
+    extension = None
+    
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.error_message = None
+        self.path = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _SetCachePath(self, cache_dir, text, workdir, suffix=''):
+        if cache_dir:
+            self.path = os.path.join(cache_dir, '{0}{1}{2}'.format(
+                RenderCache.ScriptKey(text, workdir), suffix, self.extension))
+    
+    def _Start(self, *args):
+        self._thread = threading.Thread(target=self._Main, name=self.__class__.__name__,
+                                        args=args)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def _Main(self, *args):
+        try:
+            self._Run(*args)
+        finally:
+            self._Finished()
+    
+    def _Run(self, *args):
+        '''The work of the thread, with the arguments given to _Start
+        
+        It should return soon after _stop is set, and keep error_message 
+        set on failure.  The worker is finished when it returns.
+        '''
+        pass
+    
+    def _Finished(self):
+        '''Called in the worker thread when _Run returns'''
+        pass
+    
+    def _OpenScript(self, text, filename, workdir):
+        '''Return the script as an AvsClip, or None setting error_message'''
+        source = AvsClip(text, filename, workdir, display_clip=False, frame_cache_size=0)
+        if not source.initialized or source.IsErrorClip():
+            self.error_message = source.error_message or 'Error loading the script'
+            return
+        return source
+    
+    def _ReducedClip(self, source, *args, **kwargs):
+        '''Return ReducedClip(source, ...), or None setting error_message'''
+        try:
+            return ReducedClip(source, *args, **kwargs)
+        except avisynth.AvisynthError, err:
+            self.error_message = str(err)
+    
+    def _Notify(self):
+        if self.callback is not None and not self._stop.is_set():
+            self.callback()
+    
+    def _Load(self):
+        '''Load the saved results, return True if they're valid'''
+        if self.path is None or self.header is None or not os.path.isfile(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                fields = self.header.unpack(f.read(self.header.size))
+                if fields[0] != self.magic:
+                    raise ValueError('Invalid cache file: ' + self.path)
+                self._Read(f, *fields[1:])
+            os.utime(self.path, None) # mark as recently used
+        except (EnvironmentError, ValueError, struct.error):
+            return False
+        return True
+    
+    def _Read(self, f, *fields):
+        '''Read the results after the header, raise ValueError if they don't fit
+        
+        'fields' are the header fields after the magic string.  There are no 
+        results to read by default.
+        '''
+        pass
+    
+    def _Save(self):
+        if self.path is None or self.header is None:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path + '.tmp', 'wb') as f:
+                self._Write(f)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self.path + '.tmp', self.path)
+            self._Shrink(directory)
+        except EnvironmentError:
+            pass
+    
+    def _Shrink(self, directory):
+        '''Remove the least recently used files until the directory fits in 
+        the 'indexcachesize' option'''
+        max_bytes = global_vars.options.get('indexcachesize', 256) * 1024 * 1024
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(self.extension):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except EnvironmentError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        size = sum(entry[2] for entry in entries)
+        for mtime, path, file_size in sorted(entries):
+            if size <= max_bytes:
+                break
+            if path == self.path:
+                continue
+            try:
+                os.remove(path)
+            except EnvironmentError:
+                continue
+            size -= file_size
+    
+    def _Write(self, f):
+        '''Write the header and the results, by default just a header with 
+        the magic string'''
+        f.write(self.header.pack(self.magic))
+    
+    def _Wake(self):
+        '''Wake the worker thread up when stopping it'''
+        pass
+    
+    def Stop(self, wait=False):
+        self._stop.set()
+        self._Wake()
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+class FrameScanner(ScriptWorker):
+    '''A ScriptWorker that processes the frame ranges queued with Scan()
+    
+    _Run iterates _Ranges(), and the results are saved after each range.
+    '''
+    
+    def __init__(self, callback=None):
+        ScriptWorker.__init__(self, callback)
+        self.Framecount = 0
+        self._ranges = Queue.Queue()
+        self._pending = 0
+        self._idle = threading.Condition(threading.Lock())
+    
+    def _Ranges(self):
+        '''Yield the queued (start, end) ranges, limited to the clip, until stopped'''
+        while not self._stop.is_set():
+            item = self._ranges.get()
+            if item is None:
+                break
+            start, end = item
+            yield max(0, start), (self.Framecount - 1 if end is None else 
+                                  min(end, self.Framecount - 1))
+            self._Save()
+            self._Finish()
+            self._Notify()
+    
+    def _Finish(self, all=False):
+        with self._idle:
+            self._pending = 0 if all else max(0, self._pending - 1)
+            self._idle.notify_all()
+    
+    def _Finished(self):
+        self._Finish(all=True)
+    
+    def _Wake(self):
+        self._ranges.put(None)
+    
+    def Scan(self, start=0, end=None):
+        '''Queue the frames from 'start' to 'end' (inclusive) to be processed'''
+        with self._idle:
+            self._pending += 1
+        self._ranges.put((start, end))
+    
+    def Wait(self, timeout=None):
+        '''Wait until the queued ranges are processed, return True if they are'''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._pending and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            return not self._pending
+
+
+class ProxyBuilder(ScriptWorker):
+    '''Render a reduced copy of a script to a file in a background thread
+    
+    One of every 'step' frames is resized to 'scale' times the original 
+    size, converted to RGB24 and written with RawFrame to a temporary file, 
+    so the proxy frames can be read while the rest are still being rendered.
+    '''
+    
+    def __init__(self, text, filename='', workdir='', scale=0.25, step=1, 
+                 matrix='Rec601', interlaced=False):
+        ScriptWorker.__init__(self)
+        self.step = max(1, step)
+        self.width = self.height = self.frame_size = 0
+        self.frames_done = 0
+        self.Framecount = 0
+        self.file = tempfile.TemporaryFile(prefix='avsp_proxy_')
+        self._lock = threading.Lock()
+        self._Start(text, filename, workdir, scale, matrix, interlaced)
+    
+    def _Run(self, text, filename, workdir, scale, matrix, interlaced):
+        source = self._OpenScript(text, filename, workdir)
+        if source is None:
+            return
+        proxy = self._ReducedClip(source, int(source.Width * scale), step=self.step,
+                                  matrix=matrix, interlaced=interlaced)
+        if proxy is None:
+            return
+        self.width, self.height = proxy.Width, proxy.Height
+        self.frame_size = proxy.Width * proxy.Height * 3
+        self.Framecount = source.Framecount
+        for frame in xrange(proxy.Framecount):
+            if self._stop.is_set():
+                break
+            buf = proxy.RawFrame(frame, reuse=True)
+            if buf is None:
+                self.error_message = proxy.clip.get_error()
+                break
+            with self._lock:
+                if self.file.closed:
+                    break
+                self.file.seek(frame * self.frame_size)
+                self.file.write(buf)
+            self.frames_done = frame + 1
+        with self._lock:
+            if not self.file.closed:
+                self.file.flush()
+    
+    def GetFrame(self, frame):
+        '''Return the top-down RGB24 data of the proxy frame nearest to 'frame' 
+        from below, or None if it isn't rendered yet'''
+        proxy_frame = min(frame, self.Framecount - 1) // self.step
+        if proxy_frame < 0 or proxy_frame >= self.frames_done:
+            return
+        with self._lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            self.file.seek(proxy_frame * self.frame_size)
+            return self.file.read(self.frame_size)
+    
+    def IsComplete(self):
+        return self.Framecount > 0 and self.frames_done * self.step >= self.Framecount
+    
+    def Stop(self, wait=True):
+        '''Stop rendering and delete the proxy file'''
+        ScriptWorker.Stop(self, wait)
+        with self._lock:
+            self.file.close()
+
+
+class AudioPeakIndex(ScriptWorker):
+    '''Build an index of the audio peaks of a script in a background thread
+    
+    The audio is read in blocks, so it's never held in memory.  The minimum 
+    and maximum of every 'bucket' samples are kept per channel as int8 
+    values, and when all the audio is read coarser levels are added, each 
+    one 'factor' times coarser than the previous.  The finest level is 
+    saved to 'cache_dir', if given.  callback() is called as the index 
+    grows.  Requires NumPy.
+    '''
+    
+    header = struct.Struct('<4sIIIQ') # magic, channels, bucket, rate, samples
+    magic = 'AVSW'
+    extension = '.peaks'
+    
+    def __init__(self, text, filename='', workdir='', cache_dir=None, bucket=256,
+                 factor=8, callback=None):
+        if numpy is None:
+            raise ImportError('NumPy is required for the audio peak index')
+        ScriptWorker.__init__(self, callback)
+        self.bucket = bucket
+        self.factor = factor
+        self.channels = self.Audiorate = self.Audiolength = 0
+        self.buckets_done = 0
+        self.levels = [] # (buckets, channels, 2) arrays, finest first
+        self.complete = False
+        self._SetCachePath(cache_dir, text, workdir, '-{0}'.format(bucket))
+        self._Start(text, filename, workdir)
+    
+    def _Run(self, text, filename, workdir):
+        if self._Load():
+            self._Notify()
+            return
+        source = self._OpenScript(text, filename, workdir)
+        if source is None:
+            return
+        if not source.HasAudio:
+            self.error_message = 'The clip has no audio'
+            return
+        self.channels, self.Audiorate = source.Audiochannels, source.Audiorate
+        self.Audiolength = source.Audiolength
+        peaks = numpy.zeros((-(-self.Audiolength // self.bucket), self.channels, 2), numpy.int8)
+        self.levels = [peaks]
+        last_notify = time.time()
+        for block in source.AudioBlocks(block_samples=self.bucket * 1024):
+            if self._stop.is_set():
+                return
+            samples = self._Int8Samples(block, self.channels, source.Audiobits,
+                                        source.IsAudioFloat)
+            full = len(samples) // self.bucket
+            start = self.buckets_done
+            if full:
+                values = samples[:full * self.bucket].reshape(full, self.bucket, self.channels)
+                peaks[start:start+full, :, 0] = values.min(axis=1)
+                peaks[start:start+full, :, 1] = values.max(axis=1)
+            if len(samples) > full * self.bucket: # last block
+                values = samples[full * self.bucket:]
+                peaks[start+full, :, 0] = values.min(axis=0)
+                peaks[start+full, :, 1] = values.max(axis=0)
+                full += 1
+            self.buckets_done = start + full
+            if time.time() - last_notify > 0.5:
+                self._Notify()
+                last_notify = time.time()
+        if source.audio_error_message:
+            self.error_message = source.audio_error_message
+            return
+        self._BuildLevels()
+        self._Save()
+        self._Notify()
+    
+    @staticmethod
+    def _Int8Samples(block, channels, bits, is_float):
+        '''Return a (samples, channels) int8 array with the scaled down samples'''
+        if is_float:
+            values = numpy.frombuffer(block, numpy.float32) * 127
+            return numpy.clip(values, -127, 127).astype(numpy.int8).reshape(-1, channels)
+        # The most significant byte of the little-endian samples
+        width = bits // 8
+        msb = numpy.frombuffer(block, numpy.int8).reshape(-1, channels, width)[:, :, -1]
+        if width == 1: # 8-bit audio is unsigned
+            msb = (msb.view(numpy.uint8).astype(numpy.int16) - 128).astype(numpy.int8)
+        return msb
+    
+    def _BuildLevels(self):
+        level = self.levels[0]
+        while len(level) > self.factor:
+            indices = numpy.arange(0, len(level), self.factor)
+            coarse = numpy.empty((len(indices), self.channels, 2), numpy.int8)
+            coarse[:, :, 0] = numpy.minimum.reduceat(level[:, :, 0], indices, axis=0)
+            coarse[:, :, 1] = numpy.maximum.reduceat(level[:, :, 1], indices, axis=0)
+            self.levels.append(coarse)
+            level = coarse
+        self.complete = True
+    
+    def _Read(self, f, channels, bucket, rate, samples):
+        peaks = numpy.fromfile(f, numpy.int8)
+        buckets = -(-samples // bucket)
+        if bucket != self.bucket or peaks.size != buckets * channels * 2:
+            raise ValueError('Invalid audio peaks file: ' + self.path)
+        self.channels, self.Audiorate, self.Audiolength = channels, rate, samples
+        self.levels = [peaks.reshape(buckets, channels, 2)]
+        self.buckets_done = buckets
+        self._BuildLevels()
+    
+    def _Write(self, f):
+        f.write(self.header.pack(self.magic, self.channels, self.bucket,
+                                 self.Audiorate, self.Audiolength))
+        self.levels[0].tofile(f)
+    
+    def GetPeaks(self, start, end, columns):
+        '''Return the peaks of the samples from 'start' to 'end' in 'columns' parts
+    
+        The result is a (columns, channels, 2) int8 array of (min, max) pairs,
+        taken from the coarsest level that has at least a value per column.
+        Parts that haven't been read yet are 0.  Return None if the index
+        isn't available.
+        '''
+        levels = self.levels
+        if not levels or columns < 1 or end <= start:
+            return
+        samples_per_column = float(end - start) / columns
+        scale = self.bucket
+        level = levels[0]
+        for coarse in levels[1:]:
+            if scale * self.factor > samples_per_column:
+                break
+            scale *= self.factor
+            level = coarse
+        edges = (start + numpy.arange(columns + 1) * samples_per_column) / scale
+        stop = int(min(len(level), numpy.ceil(edges[-1])))
+        if stop < 1:
+            return numpy.zeros((columns, self.channels, 2), numpy.int8)
+        indices = numpy.clip(edges[:-1].astype(int), 0, stop - 1)
+        peaks = numpy.empty((columns, self.channels, 2), numpy.int8)
+        peaks[:, :, 0] = numpy.minimum.reduceat(level[:stop, :, 0], indices, axis=0)
+        peaks[:, :, 1] = numpy.maximum.reduceat(level[:stop, :, 1], indices, axis=0)
+        if not self.complete:
+            peaks[indices * scale // self.bucket >= self.buckets_done] = 0
+        if edges[0] < 0:
+            peaks[edges[1:] <= 0] = 0
+        peaks[edges[:-1] >= len(level)] = 0
+        return peaks
+    
+    def IsComplete(self):
+        return self.complete
+
+
+class SceneChangeIndex(FrameScanner):
+    '''Measure the difference between consecutive frames in a background thread
+    
+    The script is reduced to a 'width' pixels wide luma plane.  For each 
+    frame two metrics against the previous one are stored: the mean absolute 
+    difference of the luma (0-255) and the distance between the luma 
+    histograms (0-1).  Scan() queues frame ranges, skipping the frames 
+    already measured, and SceneChanges() thresholds the metrics without 
+    reading any frame again.  The metrics are saved to 'cache_dir', if 
+    given.  callback() is called as the metrics are read.  Requires NumPy.
+    '''
+    
+    header = struct.Struct('<4sII') # magic, frames, width
+    magic = 'AVSC'
+    extension = '.scenes'
+    bins = 64
+    
+    def __init__(self, text, filename='', workdir='', cache_dir=None, width=128,
+                 matrix='Rec601', interlaced=False, callback=None):
+        if numpy is None:
+            raise ImportError('NumPy is required for the scene change index')
+        FrameScanner.__init__(self, callback)
+        self.width = width
+        self.sad = self.hist = None # float32 arrays, NaN if not measured yet
+        self.frames_done = 0
+        self._SetCachePath(cache_dir, text, workdir, '-{0}'.format(width))
+        self._Start(text, filename, workdir, matrix, interlaced)
+    
+    def _Run(self, text, filename, workdir, matrix, interlaced):
+        source = self._OpenScript(text, filename, workdir)
+        if source is None:
+            return
+        self.Framecount = source.Framecount
+        if not self._Load():
+            self.sad = numpy.empty(self.Framecount, numpy.float32)
+            self.sad.fill(numpy.nan)
+            self.hist = self.sad.copy()
+        clip = self._ReducedClip(source, self.width, rgb=False, matrix=matrix,
+                                 interlaced=interlaced)
+        if clip is None:
+            return
+        size = clip.Width * clip.Height
+        weights = numpy.float32(1.0 / size)
+        for start, end in self._Ranges():
+            previous = previous_histogram = previous_frame = None
+            last_notify = time.time()
+            for frame in xrange(start, end + 1):
+                if self._stop.is_set():
+                    break
+                if not numpy.isnan(self.sad[frame]):
+                    continue
+                if frame == 0:
+                    self.sad[0] = self.hist[0] = 0
+                    self.frames_done += 1
+                    continue
+                if previous_frame != frame - 1:
+                    previous = self._Luma(clip, frame - 1, size)
+                    if previous is not None:
+                        previous_histogram = numpy.bincount(previous >> 2, minlength=self.bins)
+                luma = self._Luma(clip, frame, size)
+                if luma is None or previous is None:
+                    self.error_message = clip.clip.get_error()
+                    break
+                histogram = numpy.bincount(luma >> 2, minlength=self.bins)
+                self.sad[frame] = numpy.abs(luma.astype(numpy.int16) - previous).sum() * weights
+                self.hist[frame] = numpy.abs(histogram - previous_histogram).sum() * weights / 2
+                self.frames_done += 1
+                previous, previous_histogram, previous_frame = luma, histogram, frame
+                if time.time() - last_notify > 0.5:
+                    self._Notify()
+                    last_notify = time.time()
+    
+    @staticmethod
+    def _Luma(clip, frame, size):
+        '''Return the luma plane of a frame as an uint8 array'''
+        buf = clip.RawFrame(frame, reuse=True)
+        if buf is not None:
+            return numpy.frombuffer(buf, numpy.uint8, size).copy()
+    
+    def _Read(self, f, frames, width):
+        values = numpy.fromfile(f, '<f4')
+        if frames != self.Framecount or width != self.width or values.size != frames * 2:
+            raise ValueError('Invalid scene change file: ' + self.path)
+        self.sad = values[:frames].astype(numpy.float32)
+        self.hist = values[frames:].astype(numpy.float32)
+        self.frames_done = int((~numpy.isnan(self.sad)).sum())
+    
+    def _Save(self):
+        if self.sad is not None:
+            FrameScanner._Save(self)
+    
+    def _Write(self, f):
+        f.write(self.header.pack(self.magic, self.Framecount, self.width))
+        self.sad.astype('<f4').tofile(f)
+        self.hist.astype('<f4').tofile(f)
+    
+    def IsComplete(self, start=0, end=None):
+        '''Return True if every frame from 'start' to 'end' is measured'''
+        if self.sad is None:
+            return False
+        return not numpy.isnan(self.sad[start:None if end is None else end + 1]).any()
+    
+    def SceneChanges(self, threshold=20, hist_threshold=None, start=0, end=None,
+                     min_length=1):
+        '''Return the list of frames that start a new scene
+    
+        A frame starts a scene if the mean luma difference with the previous
+        frame reaches 'threshold' and, if given, the histogram distance
+        reaches 'hist_threshold'.  Scene changes closer than 'min_length'
+        frames to the previous one are skipped.  Frames not measured yet are
+        never scene changes.
+        '''
+        if self.sad is None:
+            return []
+        stop = self.Framecount if end is None else min(end + 1, self.Framecount)
+        start = max(1, start)
+        if stop <= start:
+            return []
+        with numpy.errstate(invalid='ignore'):
+            cuts = self.sad[start:stop] >= threshold
+            if hist_threshold is not None:
+                cuts &= self.hist[start:stop] >= hist_threshold
+        scenes = []
+        last = -min_length
+        for frame in (numpy.flatnonzero(cuts) + start).tolist():
+            if frame - last >= min_length:
+                scenes.append(frame)
+                last = frame
+        return scenes
+
+
+class FrameHashIndex(FrameScanner):
+    '''Compute a perceptual hash of each frame of a script in several processes
+    
+    The hashes are 64-bit difference hashes: the luma of the frame is reduced
+    to 9x8 blocks and each bit tells if a block is brighter than the one to
+    its left, so similar frames have hashes that differ in few bits.  The
+    frames are rendered with pyavs_export.ParallelExport by 'workers'
+    processes.  Scan() queues frame ranges, skipping the frames already
+    hashed, and Similar() and Duplicates() query the hashes without reading
+    any frame again.  The hashes are saved to 'cache_dir', if given.
+    callback() is called as the frames are hashed.  Requires NumPy.
+    '''
+    
+    header = struct.Struct('<4sI') # magic, frames
+    magic = 'AVSH'
+    extension = '.hashes'
+    size = 36, 32 # 9x8 blocks of 4x4 pixels
+    popcount = None # number of bits set of each byte value
+    
+    def __init__(self, text, filename='', workdir='', framecount=0, cache_dir=None,
+                 workers=None, matrix='Rec601', interlaced=False, callback=None):
+        if numpy is None:
+            raise ImportError('NumPy is required for the frame hash index')
+        if FrameHashIndex.popcount is None:
+            FrameHashIndex.popcount = numpy.array([bin(i).count('1') for i in range(256)],
+                                                  numpy.uint8)
+        FrameScanner.__init__(self, callback)
+        self.source = text, filename, workdir
+        self.Framecount = framecount
+        self.workers = workers
+        self.matrix = matrix
+        self.interlaced = interlaced
+        self._SetCachePath(cache_dir, text, workdir)
+        if not self._Load():
+            self.hashes = numpy.zeros(framecount, numpy.uint64)
+            self.valid = numpy.zeros(framecount, numpy.bool_)
+        self._export = None
+        self._Start()
+    
+    def _Run(self):
+        text, filename, workdir = self.source
+        for start, end in self._Ranges():
+            frames = [frame for frame in xrange(start, end + 1) if not self.valid[frame]]
+            if not frames:
+                continue
+            self._export = pyavs_export.ParallelExport(text, filename, workdir, frames,
+                workers=self.workers, mode='luma', size=self.size, matrix=self.matrix,
+                interlaced=self.interlaced)
+            if self._stop.is_set(): # stopped before _Wake could see it
+                self._export.Stop()
+            last_notify = time.time()
+            for frame, data in self._export:
+                if self._stop.is_set():
+                    break
+                self.hashes[frame] = self.Hash(data)
+                self.valid[frame] = True
+                if time.time() - last_notify > 0.5:
+                    self._Notify()
+                    last_notify = time.time()
+            export, self._export = self._export, None
+            if self._stop.is_set():
+                self._Save() # keep the frames hashed so far
+                break
+            if export.error_message:
+                self.error_message = export.error_message
+    
+    @classmethod
+    def Hash(cls, luma):
+        '''Return the difference hash of a luma plane of 'size' dimensions'''
+        width, height = cls.size
+        blocks = numpy.frombuffer(luma, numpy.uint8, width * height).reshape(
+            8, height // 8, 9, width // 9).sum(axis=(1, 3), dtype=numpy.uint32)
+        bits = numpy.packbits(blocks[:, 1:] > blocks[:, :-1])
+        return bits.view('>u8')[0]
+    
+    def _Read(self, f, frames):
+        hashes = numpy.fromfile(f, '<u8', frames)
+        valid = numpy.fromfile(f, numpy.bool_, frames)
+        if frames != self.Framecount or valid.size != frames:
+            raise ValueError('Invalid frame hash file: ' + self.path)
+        self.hashes = hashes.astype(numpy.uint64)
+        self.valid = valid
+    
+    def _Write(self, f):
+        f.write(self.header.pack(self.magic, self.Framecount))
+        self.hashes.astype('<u8').tofile(f)
+        self.valid.tofile(f)
+    
+    def _Wake(self):
+        FrameScanner._Wake(self)
+        export = self._export
+        if export is not None:
+            export.Stop()
+    
+    def IsComplete(self, start=0, end=None):
+        '''Return True if every frame from 'start' to 'end' is hashed'''
+        return bool(self.valid[start:None if end is None else end + 1].all())
+    
+    @property
+    def frames_done(self):
+        return int(self.valid.sum())
+    
+    def _Distances(self, value, hashes):
+        xor = numpy.bitwise_xor(hashes, numpy.uint64(value))
+        return self.popcount[xor.view(numpy.uint8)].reshape(-1, 8).sum(axis=1)
+    
+    def Distance(self, frame1, frame2):
+        '''Return the number of different bits between the hashes of two
+        frames, or None if any of them isn't hashed'''
+        if self.valid[frame1] and self.valid[frame2]:
+            return int(self._Distances(self.hashes[frame1], self.hashes[frame2:frame2+1])[0])
+    
+    def Similar(self, frame, distance=4, start=0, end=None):
+        '''Return the hashed frames from 'start' to 'end' whose hash is within
+        'distance' bits of the one of 'frame', other than 'frame' itself'''
+        if not self.valid[frame]:
+            return []
+        stop = self.Framecount if end is None else min(end + 1, self.Framecount)
+        start = max(0, start)
+        if stop <= start:
+            return []
+        near = self._Distances(self.hashes[frame], self.hashes[start:stop]) <= distance
+        near &= self.valid[start:stop]
+        frames = numpy.flatnonzero(near) + start
+        return [f for f in frames.tolist() if f != frame]
+    
+    def Duplicates(self, start=0, end=None, distance=0, min_length=2):
+        '''Return the runs of consecutive duplicate frames from 'start' to 'end'
+    
+        Each run is a (first, last) tuple of at least 'min_length' frames in
+        which the hash of every frame is within 'distance' bits of the
+        previous one.
+        '''
+        stop = self.Framecount if end is None else min(end + 1, self.Framecount)
+        start = max(0, start)
+        if stop - start < 2:
+            return []
+        hashes = self.hashes[start:stop]
+        same = self._Distances(0, hashes[1:] ^ hashes[:-1]) <= distance
+        same &= self.valid[start+1:stop] & self.valid[start:stop-1]
+        # Find the edges of the runs of True values
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], same.view(numpy.int8), [0]))))
+        runs = []
+        for first, last in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            if last - first + 1 >= min_length:
+                runs.append((first + start, last + start))
+        return runs
+
+
+class ThumbnailRenderer(ScriptWorker):
+    '''Render small copies of the frames of a script in a background thread
+    
+    The script is resized to 'width' pixels wide and converted to RGB24.  
+    Request() queues frames by priority (lower first), and with 'interval' 
+    one of every that many frames is also rendered, after the requested 
+    ones.  Before each frame idle() is called, if given, and rendering is 
+    paused while it returns False.
+    
+    The top-down RGB24 thumbnails are kept in a FrameCache of 'max_bytes' and,
+    if given, in the RenderCache 'disk_cache'.  callback(frame) is called from
+    the worker thread after each thumbnail is rendered.
+    '''
+    
+    REQUESTED, BOOKMARK, INTERVAL = range(3) # priorities
+    
+    def __init__(self, text, filename='', workdir='', width=160, interval=0,
+                 max_bytes=16*1024**2, disk_cache=None, matrix='Rec601',
+                 interlaced=False, callback=None, idle=None):
+        ScriptWorker.__init__(self, callback)
+        self.idle = idle
+        self.interval = interval
+        self.width = self.height = 0
+        self.Framecount = 0
+        self.rendered = 0
+        self.cache = FrameCache(max_bytes)
+        self.disk_cache = disk_cache
+        self.key = '{0}-t{1}-'.format(RenderCache.ScriptKey(text, workdir), width)
+        self._lock = threading.Lock()
+        self._queue = [] # (priority, order, frame) heap
+        self._queued = {} # frame -> priority
+        self._order = 0
+        self._ready = threading.Condition(self._lock)
+        self._Start(text, filename, workdir, width, matrix, interlaced)
+    
+    def _Run(self, text, filename, workdir, width, matrix, interlaced):
+        source = self._OpenScript(text, filename, workdir)
+        if source is None:
+            return
+        thumbnails = self._ReducedClip(source, width, matrix=matrix, interlaced=interlaced)
+        if thumbnails is None:
+            return
+        self.width, self.height = thumbnails.Width, thumbnails.Height
+        self.Framecount = thumbnails.Framecount
+        if self.interval > 0:
+            self.Request(xrange(0, self.Framecount, self.interval), self.INTERVAL)
+        while not self._stop.is_set():
+            with self._lock:
+                while not self._queue and not self._stop.is_set():
+                    self._ready.wait()
+                if self._stop.is_set():
+                    break
+                priority, order, frame = heapq.heappop(self._queue)
+                if self._queued.get(frame) != priority:
+                    continue # requested again with a higher priority
+                del self._queued[frame]
+                if frame in self.cache:
+                    continue
+            while self.idle is not None and not self.idle() and not self._stop.is_set():
+                self._stop.wait(0.05)
+            if self._stop.is_set():
+                break
+            if self._FromDisk(frame) is not None:
+                continue
+            buf = thumbnails.RawFrame(frame)
+            if buf is None:
+                self.error_message = thumbnails.clip.get_error()
+                continue
+            with self._lock:
+                self.cache.put(frame, buf.raw, len(buf))
+            if self.disk_cache is not None:
+                self.disk_cache.put(self.key + str(frame), buf, self.width, self.height,
+                                    self.width * 3)
+            self.rendered += 1
+            if self.callback is not None and not self._stop.is_set():
+                self.callback(frame)
+    
+    def _FromDisk(self, frame):
+        if self.disk_cache is None:
+            return
+        entry = self.disk_cache.get(self.key + str(frame))
+        if entry is None:
+            return
+        data, width, height, pitch = entry
+        if (width, height) != (self.width, self.height):
+            return
+        data = buffer(data)[:]
+        with self._lock:
+            self.cache.put(frame, data, len(data))
+        return data
+    
+    def _Wake(self):
+        with self._lock:
+            self._ready.notify()
+    
+    def Request(self, frames, priority=REQUESTED):
+        '''Queue frames to be rendered, if they aren't already'''
+        with self._lock:
+            for frame in frames:
+                if frame in self.cache or self._queued.get(frame, priority + 1) <= priority:
+                    continue
+                self._queued[frame] = priority
+                heapq.heappush(self._queue, (priority, self._order, frame))
+                self._order += 1
+            self._ready.notify()
+    
+    def Get(self, frame):
+        '''Return the top-down RGB24 data of a thumbnail, or None if it's not
+        rendered yet.  Thumbnails saved to disk are loaded'''
+        with self._lock:
+            data = self.cache.get(frame)
+        if data is None and self.width:
+            data = self._FromDisk(frame)
+        return data
+    
+    def GetNearest(self, frame):
+        '''Return a (frame, data) tuple with the thumbnail of 'frame' or else
+        the nearest interval one, or None if neither is rendered yet.  Interval 
+        thumbnails evicted from the cache are queued again'''
+        data = self.Get(frame)
+        if data is not None:
+            return frame, data
+        if self.interval > 0 and self.Framecount:
+            nearest = int(round(frame / float(self.interval))) * self.interval
+            nearest = min(nearest, (self.Framecount - 1) // self.interval * self.interval)
+            data = self.Get(nearest)
+            if data is not None:
+                return nearest, data
+            self.Request([nearest], self.INTERVAL)
+    
+    def stats(self):
+        with self._lock:
+            stats = dict(rendered=self.rendered, queued=len(self._queued))
+            stats.update(('cache_' + key, value) for key, value in self.cache.stats().items())
+        return stats
+
+
+class FramePrefetcher(object):
+    '''Render the frames following the current one in a worker thread
+    
+    Rendered frames are stored in a bounded queue, up to 'depth' frames ahead 
+    of the one being presented.  Call Get(n) from the presenting thread and 
+    pass the result to the clip's _PresentFrame method.  Frames that are 
+    skipped by the presenting thread are counted as dropped.
+    '''
+    
+    def __init__(self, clip, start, depth=8, end=None):
+        self.clip = clip
+        self.depth = max(1, depth)
+        self.end = clip.Framecount - 1 if end is None else end
+        self.dropped = 0
+        self.presented = 0
+        self.waited = 0 # times the presenting thread had to wait for the worker
+        self._queue = Queue.Queue(self.depth)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._generation = 0
+        self._next_frame = start
+        self._thread = threading.Thread(target=self._Run, name='FramePrefetcher')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def _Run(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                generation = self._generation
+                frame = self._next_frame
+                self._next_frame += 1
+            if frame > self.end:
+                # Nothing left to do until Seek is called
+                self._stopped.wait(0.05)
+                with self._lock:
+                    if generation == self._generation:
+                        self._next_frame = frame
+                continue
+            frames = self.clip._RenderFrame(frame)
+            while not self._stopped.is_set() and generation == self._generation:
+                try:
+                    self._queue.put((generation, frame, frames), timeout=0.05)
+                    break
+                except Queue.Full:
+                    pass
+    
+    def Get(self, frame, timeout=None):
+        '''Return the rendered frames for 'frame' (None on error)
+        
+        Queued frames before 'frame' are discarded.  If the worker is 
+        behind, it is moved forward to 'frame'.  Raise Queue.Empty on 
+        timeout.
+        '''
+        with self._lock:
+            if frame >= self._next_frame and self._queue.empty():
+                if frame > self._next_frame:
+                    self._Seek(frame)
+        while True:
+            try:
+                generation, n, frames = self._queue.get_nowait()
+            except Queue.Empty:
+                self.waited += 1
+                generation, n, frames = self._queue.get(timeout=timeout)
+            if generation != self._generation:
+                continue
+            if n < frame:
+                self.dropped += 1
+                continue
+            if n > frame: # the worker was moved forward by us
+                with self._lock:
+                    self._Seek(frame)
+                continue
+            self.presented += 1
+            return frames
+    
+    def Seek(self, frame):
+        '''Restart the read-ahead from the given frame'''
+        with self._lock:
+            self._Seek(frame)
+    
+    def _Seek(self, frame):
+        self.dropped += max(0, frame - self._next_frame)
+        self._generation += 1
+        self._next_frame = frame
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Queue.Empty:
+                break
+    
+    def Stop(self, wait=True):
+        self._stopped.set()
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+    
+    def IsAlive(self):
+        return self._thread.is_alive()
+    
+    def stats(self):
+        return dict(depth=self.depth, queued=self._queue.qsize(), presented=self.presented, 
+                    dropped=self.dropped, waited=self.waited)
+
+
+class SeekWorker(object):
+    '''Render seek requests in a worker thread, latest request wins
+    
+    Request(clip, frame) replaces any request that the worker hasn't started
+    yet, so frames that were moved past never reach get_frame.  When a frame
+    is rendered and it's still the latest request, callback(clip, frame,
+    frames) is called from the worker thread, with frames as returned by
+    the clip's _RenderFrame method (None on error).
+    '''
+    
+    def __init__(self, callback):
+        self.callback = callback
+        self.requested = 0
+        self.coalesced = 0 # requests replaced before being rendered
+        self.rendered = 0
+        self.superseded = 0 # rendered, but a newer request arrived meanwhile
+        self._condition = threading.Condition()
+        self._pending = None
+        self._latest = None
+        self._busy = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._Run, name='SeekWorker')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def _Run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                request = self._pending
+                self._pending = None
+                self._busy = True
+            clip, frame = request
+            try:
+                frames = clip._RenderFrame(frame)
+            except Exception:
+                frames = None
+            with self._condition:
+                self._busy = False
+                self.rendered += 1
+                latest = self._latest is request
+                if not latest:
+                    self.superseded += 1
+            if latest and not self._stopped:
+                self.callback(clip, frame, frames)
+    
+    def Request(self, clip, frame):
+        '''Ask for 'frame' of 'clip' to be rendered, dropping the pending request'''
+        with self._condition:
+            if self._pending is not None:
+                self.coalesced += 1
+            self.requested += 1
+            self._pending = self._latest = (clip, frame)
+            self._condition.notify()
+    
+    def IsLatest(self, clip, frame):
+        '''Return True if (clip, frame) is the newest request'''
+        with self._condition:
+            return self._latest is not None and self._latest[0] is clip and self._latest[1] == frame
+    
+    def IsBusy(self):
+        '''Return True if a request is pending or being rendered'''
+        with self._condition:
+            return self._busy or self._pending is not None
+    
+    def Cancel(self):
+        '''Drop the pending request, and the result of the one being rendered'''
+        with self._condition:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = self._latest = None
+    
+    def Stop(self, wait=True):
+        with self._condition:
+            self._stopped = True
+            self._pending = self._latest = None
+            self._condition.notify()
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+    
+    def stats(self):
+        with self._condition:
+            return dict(requested=self.requested, coalesced=self.coalesced,
+                        rendered=self.rendered, superseded=self.superseded)
+
+
+class YUV2RGBConverter(object):
+    '''Vectorized YUV -> RGB24 conversion of 8-bit frame planes
+    
+    Uses fixed-point lookup tables and writes to a buffer that is reused 
+    while the frame size doesn't change.  Chroma is upsampled by pixel 
+    repetition, line pairs of the same field for interlaced 4:2:0.  'matrix' 
+    is one of 'Rec601', 'Rec709', 'PC.601' or 'PC.709'.  Requires NumPy.
+    '''
+    
+    coefficients = {'601': (0.299, 0.114), '709': (0.2126, 0.0722)}
+    
+    def __init__(self, matrix='Rec601', interlaced=False, bgr=False, flip=False):
+        if not self.IsSupportedMatrix(matrix):
+            raise ValueError('Unsupported matrix: {0}'.format(matrix))
+        self.matrix = matrix
+        self.interlaced = interlaced
+        self.bgr = bgr
+        self.flip = flip
+        self.buffer = None
+        self._scratch = self._luma = None
+        kr, kb = self.coefficients[matrix[-3:]]
+        kg = 1 - kr - kb
+        if matrix.startswith('PC.'):
+            y_scale, c_scale, y_offset = 1.0, 1.0, 0
+        else:
+            y_scale, c_scale, y_offset = 255 / 219.0, 255 / 224.0, 16
+        one = 1 << 16
+        values = numpy.arange(256, dtype=numpy.float64)
+        chroma = (values - 128) * c_scale * one
+        self.lut_y = numpy.round((values - y_offset) * y_scale * one + one / 2).astype(numpy.int32)
+        self.lut_rv = numpy.round(2 * (1 - kr) * chroma).astype(numpy.int32)
+        self.lut_gu = numpy.round(-2 * kb * (1 - kb) / kg * chroma).astype(numpy.int32)
+        self.lut_gv = numpy.round(-2 * kr * (1 - kr) / kg * chroma).astype(numpy.int32)
+        self.lut_bu = numpy.round(2 * (1 - kb) * chroma).astype(numpy.int32)
+    
+    @classmethod
+    def IsSupportedMatrix(cls, matrix):
+        return (isinstance(matrix, basestring) and matrix[:-3] in ('Rec', 'PC.') and 
+                matrix[-3:] in cls.coefficients)
+    
+    def Convert(self, planes):
+        '''Return a (height, width, 3) uint8 array from (Y, U, V) or (Y,) planes
+        
+        The returned array is overwritten by the next call.
+        '''
+        luma = planes[0]
+        height, width = luma.shape
+        if self.buffer is None or self.buffer.shape[:2] != (height, width):
+            self.buffer = numpy.empty((height, width, 3), numpy.uint8)
+            self._luma = numpy.empty((height, width), numpy.int32)
+            self._scratch = numpy.empty((height, width), numpy.int32)
+        out = self.buffer[::-1] if self.flip else self.buffer
+        numpy.take(self.lut_y, luma, out=self._luma, mode='clip')
+        channels = (2, 1, 0) if self.bgr else (0, 1, 2)
+        if len(planes) < 3: # Y8
+            self._Store(self._luma, out, channels)
+            return self.buffer
+        u, v = planes[1:3]
+        contributions = (self.lut_rv[v], self.lut_gu[u] + self.lut_gv[v], self.lut_bu[u])
+        luma_view, chroma_shape = self._UpsamplingViews(self._luma, u.shape)
+        scratch_view = self._scratch.reshape(luma_view.shape)
+        for channel, contribution in zip(channels, contributions):
+            numpy.add(luma_view, contribution.reshape(chroma_shape), out=scratch_view)
+            self._Store(self._scratch, out, (channel,))
+        return self.buffer
+    
+    def _UpsamplingViews(self, luma, chroma_size):
+        '''Return views of the luma plane and shape for the chroma ones that 
+        broadcast each chroma sample over the luma samples it covers'''
+        height, width = luma.shape
+        chroma_height, chroma_width = chroma_size
+        h_factor, w_factor = height // chroma_height, width // chroma_width
+        if self.interlaced and h_factor == 2 and height % 4 == 0:
+            # luma line 4a+2b+f -> chroma line 2a+f
+            return (luma.reshape(height // 4, 2, 2, chroma_width, w_factor), 
+                    (height // 4, 1, 2, chroma_width, 1))
+        return (luma.reshape(chroma_height, h_factor, chroma_width, w_factor), 
+                (chroma_height, 1, chroma_width, 1))
+    
+    @staticmethod
+    def _Store(values, out, channels):
+        numpy.right_shift(values, 16, out=values)
+        numpy.clip(values, 0, 255, out=values)
+        for channel in channels:
+            out[:, :, channel] = values
+
+
+class HighBitDepthDecoder(object):
+    '''Decoding of 16-bit samples stored as MSB/LSB pairs in 8-bit planar clips
+    
+    'bit_depth' is 's10' or 's16' for stacked clips, with the MSB in the top 
+    half of each plane and the LSB in the bottom half, or 'i10' or 'i16' for 
+    interleaved ones, with little-endian 16-bit samples.  For display the 
+    samples are reduced to 8 bits by truncation or, if 'dither' is True, 
+    ordered dithering.  Requires NumPy.
+    '''
+    
+    formats = ('s10', 's16', 'i10', 'i16')
+    
+    def __init__(self, bit_depth, dither=False):
+        if bit_depth not in self.formats:
+            raise ValueError('Unsupported bit depth: {0}'.format(bit_depth))
+        self.bit_depth = bit_depth
+        self.stacked = bit_depth[0] == 's'
+        self.bits = int(bit_depth[1:])
+        self.dither = dither
+        self._thresholds = {}
+    
+    def Size(self, width, height):
+        '''Return the real (width, height) of a clip of the given size'''
+        if self.stacked:
+            return width, height // 2
+        return width // 2, height
+    
+    def Decode(self, planes):
+        '''Return a tuple of uint16 arrays from the 8-bit planes of a frame'''
+        samples = []
+        for plane in planes:
+            if self.stacked:
+                height = plane.shape[0] // 2
+                msb, lsb = plane[:height], plane[height:2 * height]
+            else:
+                width = plane.shape[1] // 2
+                lsb, msb = plane[:, 0:2 * width:2], plane[:, 1:2 * width:2]
+            values = msb.astype(numpy.uint16)
+            numpy.left_shift(values, 8, out=values)
+            numpy.bitwise_or(values, lsb, out=values)
+            samples.append(values)
+        return tuple(samples)
+    
+    def Convert(self, planes):
+        '''Return a tuple of 8-bit display planes from the planes of a frame'''
+        shift = self.bits - 8
+        display_planes = []
+        for values in self.Decode(planes):
+            values = values.astype(numpy.int32)
+            if self.dither:
+                values += self._Thresholds(values.shape, shift)
+            numpy.right_shift(values, shift, out=values)
+            numpy.minimum(values, 255, out=values)
+            display_planes.append(values.astype(numpy.uint8))
+        return tuple(display_planes)
+    
+    def _Thresholds(self, shape, shift):
+        '''Return a 16x16 Bayer matrix scaled to 'shift' bits and tiled to shape'''
+        key = shape, shift
+        thresholds = self._thresholds.get(key)
+        if thresholds is None:
+            bayer = numpy.zeros((1, 1), numpy.int32)
+            while bayer.shape[0] < 16:
+                bayer = numpy.vstack((numpy.hstack((4 * bayer, 4 * bayer + 2)), 
+                                      numpy.hstack((4 * bayer + 3, 4 * bayer + 1))))
+            bayer >>= 8 - shift
+            reps = (-(-shape[0] // 16), -(-shape[1] // 16))
+            thresholds = numpy.tile(bayer, reps)[:shape[0], :shape[1]]
+            self._thresholds[key] = thresholds
+        return thresholds
+
 
 class AvsClipBase:
     
+    # Byte order of the RGB display frames
+    display_bgr = True
+    region_yuv2rgb = None
+    swapuv = False
+    high_bit_depth = None
+    # YUV2RGBConverter used instead of AviSynth for the display frames
+    yuv2rgb = None
+    # Layout of the data stored in the render cache by DrawFrame
+    drawing_format = None
+    
     def __init__(self, script, filename='', workdir='', env=None, fitHeight=None, 
                  fitWidth=None, oldFramecount=240, display_clip=True, reorder_rgb=False, 
-                 matrix=['auto', 'tv'], interlaced=False, swapuv=False, bit_depth=None):
+                 matrix=['auto', 'tv'], interlaced=False, swapuv=False, bit_depth=None, 
+                 frame_cache_size=None, render_cache=None, timings=None):
         # Internal variables
         self.initialized = False
         self.name = filename
         self.error_message = None
+        self.frame_error_message = None
+        self.frame_errors = {} # frame -> error message of the last failed render
+        self.audio_error_message = None
         self.current_frame = -1
         self.pBits = None
+        self.src_frame = self.display_frame = None
         self.display_clip = None
+        self.display_settings = None
         self.ptrY = self.ptrU = self.ptrV = None
+        # Serialize the requests to AviSynth when frames are rendered from other threads
+        self.lock = threading.RLock()
+        # Recently requested frames, the size is set in MB
+        if frame_cache_size is None:
+            frame_cache_size = global_vars.options.get('framecachesize', 256)
+        self.frame_cache = FrameCache(frame_cache_size * 1024 * 1024)
+        # Output buffers of RawFrame and DrawFrame
+        self.buffer_pool = BufferPool()
+        # Drawn frames of slow scripts saved to disk, a RenderCache instance
+        self.render_cache = None
+        self.cached_drawing = None
+        self.render_time = 0
+        # Time spent in each rendering stage, a RenderTimings instance
+        self.timings = timings
         # Avisynth script properties
         self.Width = -1
         self.Height = -1
@@ -127,23 +1757,28 @@ class AvsClipBase:
                 else:
                     script = ur'AviSource("{0}")'.format(filename)
             scriptdirname, scriptbasename = os.path.split(filename)
-            curdir = os.getcwdu()
-            workdir = os.path.isdir(workdir) and workdir or scriptdirname
-            if os.path.isdir(workdir):
-                self.env.set_working_dir(workdir)
-            self.env.set_global_var("$ScriptFile$", scriptbasename)
-            self.env.set_global_var("$ScriptName$", filename)
-            self.env.set_global_var("$ScriptDir$", scriptdirname)
-            try:
-                self.clip = self.env.invoke('Eval', [script, filename])
-                if not isinstance(self.clip, avisynth.AVS_Clip):
-                    raise avisynth.AvisynthError("Not a clip")
-            except avisynth.AvisynthError, err:
-                self.Framecount = oldFramecount
-                if not self.CreateErrorClip(err):
-                    return
-            finally:
-                os.chdir(curdir)
+            # set_working_dir changes the current directory of the whole process
+            with _eval_lock:
+                curdir = os.getcwdu()
+                workdir = os.path.isdir(workdir) and workdir or scriptdirname
+                if os.path.isdir(workdir):
+                    self.env.set_working_dir(workdir)
+                self.env.set_global_var("$ScriptFile$", scriptbasename)
+                self.env.set_global_var("$ScriptName$", filename)
+                self.env.set_global_var("$ScriptDir$", scriptdirname)
+                try:
+                    self.clip = self.env.invoke('Eval', [script, filename])
+                    if not isinstance(self.clip, avisynth.AVS_Clip):
+                        raise avisynth.AvisynthError("Not a clip")
+                except avisynth.AvisynthError, err:
+                    self.Framecount = oldFramecount
+                    if not self.CreateErrorClip(err):
+                        return
+                finally:
+                    os.chdir(curdir)
+            if render_cache is not None and not self.error_message:
+                self.render_cache = render_cache
+                self.render_cache_key = render_cache.ScriptKey(script, workdir)
             try:
                 if not isinstance(self.env.get_var("last"), avisynth.AVS_Clip):
                     self.env.set_var("last", self.clip)
@@ -233,6 +1868,8 @@ class AvsClipBase:
     
     def __del__(self):
         if self.initialized:
+            self.frame_cache.clear()
+            self.buffer_pool.clear()
             self.display_frame = None
             self.src_frame = None
             self.display_clip = None
@@ -280,9 +1917,22 @@ class AvsClipBase:
     
     def CreateDisplayClip(self, matrix=['auto', 'tv'], interlaced=None, swapuv=False, bit_depth=None):
         self.current_frame = -1
+        self.display_frame = self.cached_drawing = None
+        # Display frames are keyed on the settings used to create the display clip
+        display_settings = (tuple(matrix) if not isinstance(matrix, basestring) else matrix, 
+                            self.interlaced if interlaced is None else interlaced, 
+                            bool(swapuv), bit_depth,
+                            bool(global_vars.options.get('nativeyuv2rgb', False)), 
+                            bool(global_vars.options.get('highbitdepthdither', False)))
+        if display_settings != self.display_settings:
+            with self.lock:
+                self.frame_cache.discard(lambda key: key[0] == 'display')
+        self.display_settings = display_settings
         self.display_clip = self.clip
         self.RGB48 = False
         self.bit_depth = bit_depth
+        self.swapuv = bool(swapuv)
+        self.high_bit_depth = self.yuv2rgb = None
         if bit_depth:
             try:
                 if bit_depth == 'rgb48': # TODO
@@ -292,7 +1942,11 @@ class AvsClipBase:
                         self.DisplayHeight /= 2
                         return True
                 elif self.IsYV12 or self.IsYV24 or self.IsY8:
-                    if bit_depth == 's16':
+                    if numpy is not None and bit_depth in HighBitDepthDecoder.formats:
+                        # Decoded by pyavs when displaying the frame
+                        self.high_bit_depth = HighBitDepthDecoder(bit_depth, 
+                            global_vars.options.get('highbitdepthdither', False))
+                    elif bit_depth == 's16':
                         args = [self.display_clip, 0, 0, 0, self.Height / 2]
                         self.display_clip = self.env.invoke('Crop', args)
                     elif bit_depth == 's10':
@@ -341,8 +1995,16 @@ class AvsClipBase:
         vi = self.display_clip.get_video_info()
         self.DisplayWidth = vi.width
         self.DisplayHeight = vi.height
+        if self.high_bit_depth is not None:
+            self.DisplayWidth, self.DisplayHeight = self.high_bit_depth.Size(vi.width, vi.height)
+            self.display_vi = vi
+            matrix = self.matrix if YUV2RGBConverter.IsSupportedMatrix(self.matrix) else 'Rec601'
+            self.yuv2rgb = YUV2RGBConverter(matrix, self.interlaced and vi.is_yv12(), 
+                                            bgr=self.display_bgr, flip=self.display_bgr)
+            return True
         if not self._ConvertToRGB():
             return self.CreateErrorClip(display_clip_error=True)
+        self.display_vi = self.display_clip.get_video_info()
         return True
     
     def _ConvertToRGB(self):
@@ -357,42 +2019,339 @@ class AvsClipBase:
                 frame = 0
             if frame >= self.Framecount:
                 frame = self.Framecount - 1
-            # Original clip
-            self.src_frame = self.clip.get_frame(frame)
-            if self.clip.get_error():
+            if self.render_cache is not None and self._PresentCachedDrawing(frame):
+                return True
+            start = time.time()
+            frames = self._RenderFrame(frame)
+            self.frame_error_message = self.frame_errors.get(frame)
+            if frames is None:
                 return False
-            self.pitch = self.src_frame.get_pitch()
-            self.pitchUV = self.src_frame.get_pitch(avisynth.avs.AVS_PLANAR_U)
-            self.ptrY = self.src_frame.get_read_ptr()
-            if x86_64:
-                self.ptrY = self._cffi2ctypes_ptr(self.ptrY)
-            if not self.IsY8:
-                self.ptrU = self.src_frame.get_read_ptr(avisynth.avs.AVS_PLANAR_U)
-                self.ptrV = self.src_frame.get_read_ptr(avisynth.avs.AVS_PLANAR_V)
-                if x86_64:
-                    self.ptrU = self._cffi2ctypes_ptr(self.ptrU)
-                    self.ptrV = self._cffi2ctypes_ptr(self.ptrV)
+            self._PresentFrame(frame, frames)
+            self.render_time = time.time() - start
+            return True
+        return False
+    
+    def _RenderFrame(self, frame):
+        '''Return a (source frame, display frame) tuple, or None on error
+        
+        The frames are taken from the cache if possible.  It can be called 
+        from any thread, it doesn't change the current frame.  The error 
+        message is kept in frame_errors[frame] until the frame is rendered.
+        '''
+        with self.lock:
+            # Original clip
+            src_frame = self.frame_cache.get(('src', frame))
+            if src_frame is None:
+                start = time.time()
+                src_frame = self.clip.get_frame(frame)
+                error = self.clip.get_error()
+                if error:
+                    self.frame_errors[frame] = error
+                    return
+                if self.timings is not None:
+                    self.timings.Add(frame, 'source', time.time() - start)
+                self.frame_cache.put(('src', frame), src_frame, 
+                                     self._FrameSize(src_frame, self.vi))
             # Display clip
+            display_frame = None
             if self.display_clip:
-                self.display_frame = self.display_clip.get_frame(frame)
-                if self.display_clip.get_error():
-                    return False
-                self.display_pitch = self.display_frame.get_pitch()
-                self.pBits = self.display_frame.get_read_ptr()
-                if x86_64:
-                    self.pBits = self._cffi2ctypes_ptr(self.pBits)
-                if self.RGB48: ## -> RGB24
-                    pass
-            self.current_frame = frame
+                key = ('display', self.display_settings, frame)
+                display_frame = self.frame_cache.get(key)
+                if display_frame is None:
+                    start = time.time()
+                    display_frame = self.display_clip.get_frame(frame)
+                    error = self.display_clip.get_error()
+                    if error:
+                        self.frame_errors[frame] = error
+                        return
+                    if self.timings is not None:
+                        self.timings.Add(frame, 'display', time.time() - start)
+                    self.frame_cache.put(key, display_frame, 
+                                         self._FrameSize(display_frame, self.display_vi))
+            self.frame_errors.pop(frame, None)
+            return src_frame, display_frame
+    
+    def _PresentFrame(self, frame, frames):
+        '''Make the frames returned by _RenderFrame the current ones'''
+        src_frame, display_frame = frames
+        self._SetSourceFrame(src_frame)
+        if display_frame is not None:
+            self._SetDisplayFrame(display_frame)
+        self.cached_drawing = None
+        self.render_time = 0
+        self.current_frame = frame
+        self.frame_error_message = None
+    
+    def _DrawingKey(self, frame):
+        return hashlib.sha1(repr((self.render_cache_key, self.drawing_format, 
+            self.display_settings, self.DisplayWidth, self.DisplayHeight, frame))).hexdigest()
+    
+    def _PresentCachedDrawing(self, frame):
+        '''Make a frame from the render cache the current one, without rendering it'''
+        drawing = self.render_cache.get(self._DrawingKey(frame))
+        if drawing is None:
+            return False
+        self.cached_drawing = drawing
+        self.src_frame = self.display_frame = None
+        self.ptrY = self.ptrU = self.ptrV = self.pBits = None
+        self.render_time = 0
+        self.current_frame = frame
+        self.frame_error_message = None
+        return True
+    
+    def _EnsureFrames(self):
+        '''Render the current frame if it was taken from the render cache'''
+        if self.cached_drawing is None:
             return True
-        return False
+        frames = self._RenderFrame(self.current_frame)
+        self.frame_error_message = self.frame_errors.get(self.current_frame)
+        if frames is None:
+            return False
+        self._PresentFrame(self.current_frame, frames)
+        return True
+    
+    def _StoreDrawing(self, data, width, height, pitch):
+        '''Save the drawing data of the current frame if it was slow to render'''
+        if (self.render_cache is not None and self.render_time * 1000 >= 
+                global_vars.options.get('rendercachemintime', 200)):
+            self.render_cache.put(self._DrawingKey(self.current_frame), 
+                                  data, width, height, pitch)
+        self.render_time = 0
+    
+    def _SetSourceFrame(self, src_frame):
+        self.src_frame = src_frame
+        self.pitch = src_frame.get_pitch()
+        self.pitchUV = src_frame.get_pitch(avisynth.avs.AVS_PLANAR_U)
+        self.ptrY = src_frame.get_read_ptr()
+        if x86_64:
+            self.ptrY = self._cffi2ctypes_ptr(self.ptrY)
+        if not self.IsY8:
+            self.ptrU = src_frame.get_read_ptr(avisynth.avs.AVS_PLANAR_U)
+            self.ptrV = src_frame.get_read_ptr(avisynth.avs.AVS_PLANAR_V)
+            if x86_64:
+                self.ptrU = self._cffi2ctypes_ptr(self.ptrU)
+                self.ptrV = self._cffi2ctypes_ptr(self.ptrV)
+    
+    def _SetDisplayFrame(self, display_frame):
+        self.display_frame = display_frame
+        self.display_pitch = display_frame.get_pitch()
+        self.pBits = display_frame.get_read_ptr()
+        if x86_64:
+            self.pBits = self._cffi2ctypes_ptr(self.pBits)
+        if self.RGB48: ## -> RGB24
+            pass
+    
+    @staticmethod
+    def _FrameSize(frame, vi=None):
+        '''Return the number of bytes used by the planes of a video frame'''
+        size = frame.get_pitch() * frame.get_height()
+        if vi is not None and vi.is_planar() and not vi.is_y8():
+            size += 2 * (frame.get_pitch(avisynth.avs.AVS_PLANAR_U) * 
+                         frame.get_height(avisynth.avs.AVS_PLANAR_U))
+        return size
+    
+    def SetFrameCacheSize(self, size):
+        '''Set the frame cache budget in MB, 0 disables the cache'''
+        with self.lock:
+            self.frame_cache.resize(size * 1024 * 1024)
+    
+    def IsFrameReady(self, frame):
+        '''Return True if 'frame' can be shown without rendering it'''
+        if not self.initialized:
+            return True
+        frame = min(max(frame, 0), self.Framecount - 1)
+        if frame == self.current_frame:
+            return True
+        if self.render_cache is not None and self._DrawingKey(frame) in self.render_cache:
+            return True
+        if ('src', frame) not in self.frame_cache:
+            return False
+        return (not self.display_clip or
+                ('display', self.display_settings, frame) in self.frame_cache)
     
     def _cffi2ctypes_ptr(self, ptr):
         return ctypes.cast(
                     int(avisynth.ffi.cast('unsigned long long', ptr)), 
                     ctypes.POINTER(ctypes.c_ubyte))
     
+    def GetPlanes(self, frame=None, display=False):
+        '''Return NumPy arrays wrapping the planes of a frame, without copying
+        
+        A tuple of 2D arrays (rows, columns) is returned: (Y, U, V) for YUV, 
+        (Y,) for Y8 and (R, G, B) or (R, G, B, A) for RGB, always from top to 
+        bottom.  YUY2 planes are strided views over the packed data.  If 
+        'display' is True the planes of the display frame are returned 
+        instead.  The arrays are read-only and keep a reference to the 
+        AviSynth frame, so the memory stays valid while they exist.  Return 
+        None on error.
+        '''
+        if numpy is None:
+            raise ImportError('NumPy is required for accessing the frame planes')
+        if frame is None:
+            frame = max(0, self.current_frame)
+        if not self._GetFrame(frame) or not self._EnsureFrames():
+            return
+        if display:
+            if self.yuv2rgb is None:
+                return self._FramePlanes(self.display_frame, self.display_clip.get_video_info(), 
+                                         self.display_bgr)
+            rgb = self.yuv2rgb.Convert(self._DisplayPlanes()).copy()
+            if self.yuv2rgb.flip:
+                rgb = rgb[::-1]
+            planes = [rgb[:, :, i] for i in ((2, 1, 0) if self.yuv2rgb.bgr else (0, 1, 2))]
+            for plane in planes:
+                plane.flags.writeable = False
+            return tuple(planes)
+        return self._FramePlanes(self.src_frame, self.vi)
+    
+    def _DisplayPlanes(self):
+        '''Return the 8-bit YUV planes of the display frame for yuv2rgb'''
+        planes = self._FramePlanes(self.display_frame, self.display_vi)
+        if self.high_bit_depth is not None:
+            planes = self.high_bit_depth.Convert(planes)
+        return planes
+    
+    def _FramePlanes(self, video_frame, vi, bgr=True):
+        '''Return a tuple of 2D uint8 arrays over the planes of an AVS_VideoFrame'''
+        width, height = vi.width, vi.height
+        planes = []
+        if vi.is_planar():
+            plane_list = [avisynth.avs.AVS_PLANAR_Y]
+            if not vi.is_y8():
+                plane_list += [avisynth.avs.AVS_PLANAR_U, avisynth.avs.AVS_PLANAR_V]
+            for plane in plane_list:
+                if plane == avisynth.avs.AVS_PLANAR_Y:
+                    plane_width, plane_height = width, height
+                else:
+                    plane_width = width >> vi.get_plane_width_subsampling(plane)
+                    plane_height = height >> vi.get_plane_height_subsampling(plane)
+                pitch = video_frame.get_pitch(plane)
+                planes.append(self._PlaneArray(video_frame, plane, pitch * plane_height, 
+                              0, (plane_height, plane_width), (pitch, 1)))
+        elif vi.is_yuy2(): # Y0 U Y1 V
+            pitch = video_frame.get_pitch()
+            size = pitch * height
+            planes.append(self._PlaneArray(video_frame, None, size, 0, 
+                                           (height, width), (pitch, 2)))
+            for offset in (1, 3):
+                planes.append(self._PlaneArray(video_frame, None, size, offset, 
+                                               (height, width / 2), (pitch, 4)))
+        elif vi.is_rgb():
+            # bottom-up
+            pitch = video_frame.get_pitch()
+            size = pitch * height
+            bytes = 4 if vi.is_rgb32() else 3
+            offsets = [2, 1, 0] if bgr else [0, 1, 2]
+            if bytes == 4:
+                offsets.append(3)
+            for offset in offsets:
+                planes.append(self._PlaneArray(video_frame, None, size, 
+                              (height - 1) * pitch + offset, (height, width), (-pitch, bytes)))
+        return tuple(planes)
+    
+    def _PlaneArray(self, video_frame, plane, size, offset, shape, strides):
+        if plane is None:
+            ptr = video_frame.get_read_ptr()
+        else:
+            ptr = video_frame.get_read_ptr(plane)
+        if x86_64:
+            ptr = self._cffi2ctypes_ptr(ptr)
+        address = ctypes.cast(ptr, ctypes.c_void_p).value
+        buf = (ctypes.c_ubyte * size).from_address(address)
+        buf._avs_frame = video_frame # keep the frame alive
+        array = numpy.ndarray(shape, numpy.uint8, buf, offset, strides)
+        array.flags.writeable = False # frames can be shared by AviSynth
+        return array
+    
+    def GetRegion(self, frame, x, y, w, h, space='yuv'):
+        '''Return a (rows, columns, 3) uint8 array with the samples of a region
+        
+        'space' is 'yuv' or 'rgb'.  Subsampled chroma is repeated over the 
+        pixels it covers, per field if the clip is interlaced, Y8 gets neutral 
+        chroma.  RGB clips are converted to YUV with Rec601 TV levels and YUV 
+        clips to RGB as in the preview, with the display matrix and swapuv.  
+        The region is clipped to the frame boundaries.  If 'frame' is None the 
+        current frame is used.  Return None on error or if there's no 
+        current frame.
+        '''
+        if numpy is None:
+            raise ImportError('NumPy is required for accessing the frame planes')
+        if space not in ('yuv', 'rgb'):
+            raise ValueError('Invalid color space: {0}'.format(space))
+        if frame is None:
+            if self.current_frame < 0 or not self._EnsureFrames():
+                return
+            src_frame = self.src_frame
+        else:
+            frame = min(max(0, frame), self.Framecount - 1)
+            frames = self._RenderFrame(frame)
+            self.frame_error_message = self.frame_errors.get(frame)
+            if frames is None:
+                return
+            src_frame = frames[0]
+        rows = slice(max(0, y), max(0, min(self.Height, y + h)))
+        columns = slice(max(0, x), max(0, min(self.Width, x + w)))
+        planes = self._FramePlanes(src_frame, self.vi)
+        if self.IsRGB:
+            region = numpy.dstack([plane[rows, columns] for plane in planes[:3]])
+            if space == 'yuv':
+                region = self._RGB2YUV(region)
+            return region
+        luma = planes[0][rows, columns]
+        if self.IsY8:
+            chroma = [numpy.empty_like(luma)] * 2
+            chroma[0].fill(128)
+        else:
+            h_factor = self.Height // planes[1].shape[0]
+            w_factor = self.Width // planes[1].shape[1]
+            chroma_rows = numpy.arange(rows.start, rows.stop)
+            if self.interlaced and h_factor == 2 and self.Height % 4 == 0:
+                # luma line 4a+2b+f -> chroma line 2a+f, as in YUV2RGBConverter
+                chroma_rows = chroma_rows // 4 * 2 + chroma_rows % 2
+            else:
+                chroma_rows //= h_factor
+            chroma_columns = numpy.arange(columns.start, columns.stop) // w_factor
+            chroma = [plane[chroma_rows[:, None], chroma_columns] for plane in planes[1:3]]
+        if space == 'yuv' or not luma.size:
+            return numpy.dstack([luma] + chroma)
+        if self.swapuv:
+            chroma.reverse()
+        matrix = getattr(self, 'matrix', None)
+        if not YUV2RGBConverter.IsSupportedMatrix(matrix):
+            matrix = 'Rec601'
+        if self.region_yuv2rgb is None or self.region_yuv2rgb.matrix != matrix:
+            self.region_yuv2rgb = YUV2RGBConverter(matrix)
+        return self.region_yuv2rgb.Convert([luma] + chroma).copy()
+    
+    @staticmethod
+    def _RGB2YUV(rgb):
+        '''Rec601 TV levels RGB -> YUV of a (rows, columns, 3) array'''
+        matrix = numpy.array([[ 0.257,  0.504,  0.098], 
+                              [-0.148, -0.291,  0.439], 
+                              [ 0.439, -0.368, -0.071]])
+        yuv = numpy.dot(rgb, matrix.T) + (16, 128, 128)
+        return numpy.clip(numpy.round(yuv), 0, 255).astype(numpy.uint8)
+    
+    def GetRegionStats(self, frame, x, y, w, h, space='yuv'):
+        '''Return a dict with the statistics of a region, see GetRegion
+        
+        'mean', 'min', 'max' and 'stdev' are tuples with a value for each 
+        channel, 'count' is the number of pixels.  Return None on error or 
+        if the region is empty.
+        '''
+        region = self.GetRegion(frame, x, y, w, h, space)
+        if region is None or not region.size:
+            return
+        samples = region.reshape(-1, 3)
+        return dict(mean=tuple(float(value) for value in samples.mean(axis=0)), 
+                    min=tuple(int(value) for value in samples.min(axis=0)), 
+                    max=tuple(int(value) for value in samples.max(axis=0)), 
+                    stdev=tuple(float(value) for value in samples.std(axis=0)), 
+                    count=len(samples))
+    
     def GetPixelYUV(self, x, y):
+        if not self._EnsureFrames():
+            return (-1,-1,-1)
         if self.IsPlanar:
             indexY = x + y * self.pitch
             if self.IsY8:
@@ -409,6 +2368,8 @@ class AvsClipBase:
         return (self.ptrY[indexY], self.ptrU[indexU], self.ptrV[indexV])
     
     def GetPixelRGB(self, x, y, BGR=True):
+        if not self._EnsureFrames():
+            return (-1,-1,-1)
         if self.IsRGB:
             bytes = self.vi.bytes_from_pixels(1)
             if BGR:
@@ -424,6 +2385,8 @@ class AvsClipBase:
             return (-1,-1,-1)
     
     def GetPixelRGBA(self, x, y, BGR=True):
+        if not self._EnsureFrames():
+            return (-1,-1,-1,-1)
         if self.IsRGB32:
             bytes = self.vi.bytes_from_pixels(1)
             if BGR:
@@ -511,51 +2474,297 @@ class AvsClipBase:
             height, interlaced, self.FramerateNumerator, self.FramerateDenominator, 
             sar, colorspace, X)
     
-    def RawFrame(self, frame, y4m_header=False):
-        '''Get a buffer of raw video data'''
+    # Wave64 chunk GUIDs, as stored in the file
+    w64_guids = dict((name, uuid.UUID(guid).bytes_le) for name, guid in (
+                     ('riff', '66666972-912e-11cf-a5d6-28db04c10000'),
+                     ('wave', '65766177-acf3-11d3-8cd1-00c04f8edb8a'),
+                     ('fmt ', '20746d66-acf3-11d3-8cd1-00c04f8edb8a'),
+                     ('data', '61746164-acf3-11d3-8cd1-00c04f8edb8a')))
+    # WAVE_FORMAT_EXTENSIBLE speaker positions for 1 to 8 channels
+    channel_masks = (0x4, 0x3, 0x7, 0x33, 0x37, 0x3f, 0x13f, 0x63f)
+    
+    def AudioFormat(self):
+        '''Return the sample format of the audio ('u8', 's16le', 'f32le', etc.)'''
+        if self.IsAudioFloat:
+            return 'f32le'
+        if self.Audiobits > 8:
+            return 's{0}le'.format(self.Audiobits)
+        return 'u8' # 8-bit audio is unsigned
+    
+    def AudioHeader(self, format='wav', samples=None):
+        '''Return the header of a 'wav' or 'w64' (Sony Wave64) audio file
+        
+        The header declares 'samples' samples, all of them by default.  As the
+        WAV sizes are 32-bit, they're set to the maximum if they don't fit, like
+        other applications do when streaming.  'raw' returns an empty header.
+        '''
+        if format == 'raw':
+            return ''
+        if samples is None:
+            samples = self.Audiolength
+        channels, bits = self.Audiochannels, self.Audiobits
+        block_align = channels * bits // 8
+        if channels > 2 or bits > 16:
+            fmt = struct.pack('<HHIIHHHHI16s', 0xFFFE, channels, self.Audiorate,
+                self.Audiorate * block_align, block_align, bits, 22, bits,
+                self.channel_masks[channels - 1] if channels <= 8 else 0,
+                uuid.UUID('0000000{0}-0000-0010-8000-00aa00389b71'.format(
+                          3 if self.IsAudioFloat else 1)).bytes_le)
+        else:
+            fmt = struct.pack('<HHIIHH', 3 if self.IsAudioFloat else 1, channels,
+                self.Audiorate, self.Audiorate * block_align, block_align, bits)
+        data_size = samples * block_align
+        if format == 'w64':
+            fmt += '\0' * (-len(fmt) % 8)
+            size = 16 + 8 + 16 + (24 + len(fmt)) + 24 + data_size
+            return ''.join((self.w64_guids['riff'], struct.pack('<Q', size),
+                            self.w64_guids['wave'], self.w64_guids['fmt '],
+                            struct.pack('<Q', 24 + len(fmt)), fmt,
+                            self.w64_guids['data'], struct.pack('<Q', 24 + data_size)))
+        size = min(4 + 8 + len(fmt) + 8 + data_size, 0xFFFFFFFF)
+        return ''.join(('RIFF', struct.pack('<I', size), 'WAVE', 'fmt ',
+                        struct.pack('<I', len(fmt)), fmt,
+                        'data', struct.pack('<I', min(data_size, 0xFFFFFFFF))))
+    
+    def ReadAudio(self, buf, start, count):
+        '''Read 'count' interleaved samples from 'start' into a ctypes buffer
+        
+        Return False on error, with the message in audio_error_message.
+        '''
+        address = ctypes.addressof(buf)
+        if x86_64:
+            address = avisynth.ffi.cast('void *', address)
+        with self.lock:
+            self.clip.get_audio(address, start, count)
+            self.audio_error_message = self.clip.get_error()
+        return not self.audio_error_message
+    
+    def AudioBlocks(self, start=0, end=None, block_samples=None):
+        '''Yield the audio from sample 'start' to 'end' (excluded) in blocks
+        
+        Each block is a ctypes buffer holding up to 'block_samples' samples,
+        1 MB of them by default.  The buffer is reused, so it must be consumed
+        before requesting the next one.  Stop early on error, setting
+        audio_error_message.
+        '''
+        if not self.initialized or not self.HasAudio:
+            return
+        if end is None or end > self.Audiolength:
+            end = self.Audiolength
+        sample_size = self.Audiochannels * self.Audiobits // 8
+        if not block_samples:
+            block_samples = max(1, (1 << 20) // sample_size)
+        buf = None
+        while start < end:
+            count = min(block_samples, end - start)
+            if buf is None or len(buf) != count * sample_size:
+                buf = self.buffer_pool.get('audio', count * sample_size)
+            if not self.ReadAudio(buf, start, count):
+                return
+            yield buf
+            start += count
+    
+    def RawFrame(self, frame, y4m_header=False, reuse=False, bit_depth=None):
+        '''Get a buffer of raw video data
+        
+        If 'reuse' is True the same buffer is returned on each call while the 
+        frame size doesn't change, so it must be consumed before requesting 
+        the next frame.  If 'bit_depth' is one of HighBitDepthDecoder.formats 
+        the planes are decoded and returned as little-endian 16-bit samples, 
+        which requires NumPy.
+        '''
+        if bit_depth and numpy is None:
+            raise ImportError('NumPy is required for decoding high bit depth clips')
         if self.initialized:
             if frame < 0:
                 frame = 0
             if frame >= self.Framecount:
                 frame = self.Framecount - 1
-            frame = self.clip.get_frame(frame)
-            if self.clip.get_error():
-                return
-            total_bytes = self.Width * self.Height * self.vi.bits_per_pixel() >> 3
-            if y4m_header is not False:
-                X = ' X' + y4m_header if isinstance(y4m_header, basestring) else ''
-                y4m_header = 'FRAME{0}\n'.format(X)
-            else:
-                y4m_header = ''
-            y4m_header_len = len(y4m_header)
-            buf = ctypes.create_string_buffer(total_bytes + y4m_header_len)
-            buf[0:y4m_header_len] = y4m_header
-            write_addr = ctypes.addressof(buf) + y4m_header_len
-            P_UBYTE = ctypes.POINTER(ctypes.c_ubyte)
-            if self.IsPlanar and not self.IsY8:
-                for plane in (avisynth.avs.AVS_PLANAR_Y, avisynth.avs.AVS_PLANAR_U, avisynth.avs.AVS_PLANAR_V):
+            with self.lock:
+                frame = self.clip.get_frame(frame)
+                if self.clip.get_error():
+                    return
+                if bit_depth:
+                    planes = self._FramePlanes(frame, self.vi)
+                    samples = [numpy.ascontiguousarray(values, '<u2') for values in 
+                               HighBitDepthDecoder(bit_depth).Decode(planes)]
+                    total_bytes = sum(values.nbytes for values in samples)
+                else:
+                    total_bytes = self.Width * self.Height * self.vi.bits_per_pixel() >> 3
+                if y4m_header is not False:
+                    X = ' X' + y4m_header if isinstance(y4m_header, basestring) else ''
+                    y4m_header = 'FRAME{0}\n'.format(X)
+                else:
+                    y4m_header = ''
+                y4m_header_len = len(y4m_header)
+                if reuse:
+                    buf = self.buffer_pool.get('raw', total_bytes + y4m_header_len)
+                else:
+                    buf = ctypes.create_string_buffer(total_bytes + y4m_header_len)
+                buf[0:y4m_header_len] = y4m_header
+                write_addr = ctypes.addressof(buf) + y4m_header_len
+                P_UBYTE = ctypes.POINTER(ctypes.c_ubyte)
+                if bit_depth:
+                    for values in samples:
+                        ctypes.memmove(write_addr, values.ctypes.data, values.nbytes)
+                        write_addr += values.nbytes
+                elif self.IsPlanar and not self.IsY8:
+                    for plane in (avisynth.avs.AVS_PLANAR_Y, avisynth.avs.AVS_PLANAR_U, 
+                                  avisynth.avs.AVS_PLANAR_V):
+                        if x86_64:
+                            write_ptr = avisynth.ffi.cast('unsigned char *', write_addr)
+                        else:
+                            write_ptr = ctypes.cast(write_addr, P_UBYTE)
+                        # using get_row_size(plane) and get_height(plane) breaks v2.5.8
+                        width = frame.get_row_size() >> self.vi.get_plane_width_subsampling(plane)
+                        height = frame.get_height() >> self.vi.get_plane_height_subsampling(plane)
+                        self.env.bit_blt(write_ptr, width, frame.get_read_ptr(plane), 
+                                         frame.get_pitch(plane), width, height)
+                        write_addr += width * height
+                else:
+                    # Note that AviSynth uses BGR
                     if x86_64:
                         write_ptr = avisynth.ffi.cast('unsigned char *', write_addr)
                     else:
                         write_ptr = ctypes.cast(write_addr, P_UBYTE)
-                    # using get_row_size(plane) and get_height(plane) breaks v2.5.8
-                    width = frame.get_row_size() >> self.vi.get_plane_width_subsampling(plane)
-                    height = frame.get_height() >> self.vi.get_plane_height_subsampling(plane)
-                    self.env.bit_blt(write_ptr, width, frame.get_read_ptr(plane), 
-                                     frame.get_pitch(plane), width, height)
-                    write_addr += width * height
-            else:
-                # Note that AviSynth uses BGR
-                if x86_64:
-                    write_ptr = avisynth.ffi.cast('unsigned char *', write_addr)
+                    self.env.bit_blt(write_ptr, frame.get_row_size(), frame.get_read_ptr(), 
+                                frame.get_pitch(), frame.get_row_size(), frame.get_height())
+                return buf
+    
+    def RawFrameChunks(self, frame, y4m_header=False, bit_depth=None):
+        '''Get the same data as RawFrame as a list of buffers
+        
+        The list holds the y4m frame header, if requested, and one buffer per
+        plane.  Planes without padding at the end of the lines are returned
+        as views of the AviSynth frame, which they keep alive, so they're not
+        copied.  The rest are copied to new buffers.  Unlike RawFrame, the
+        buffers are never reused, so several frames can be queued.  Return
+        None on error.
+        '''
+        if self.initialized:
+            if bit_depth:
+                buf = self.RawFrame(frame, y4m_header, bit_depth=bit_depth)
+                return None if buf is None else [buf]
+            frame = min(max(frame, 0), self.Framecount - 1)
+            with self.lock:
+                video_frame = self.clip.get_frame(frame)
+                if self.clip.get_error():
+                    return
+                chunks = []
+                if y4m_header is not False:
+                    X = ' X' + y4m_header if isinstance(y4m_header, basestring) else ''
+                    chunks.append('FRAME{0}\n'.format(X))
+                if self.IsPlanar and not self.IsY8:
+                    planes = (avisynth.avs.AVS_PLANAR_Y, avisynth.avs.AVS_PLANAR_U,
+                              avisynth.avs.AVS_PLANAR_V)
                 else:
-                    write_ptr = ctypes.cast(write_addr, P_UBYTE)
-                self.env.bit_blt(write_ptr, frame.get_row_size(), frame.get_read_ptr(), 
-                            frame.get_pitch(), frame.get_row_size(), frame.get_height())
-            return buf
+                    planes = (None,)
+                for plane in planes:
+                    if plane is None:
+                        width = video_frame.get_row_size()
+                        height = video_frame.get_height()
+                        pitch = video_frame.get_pitch()
+                        ptr = video_frame.get_read_ptr()
+                    else:
+                        width = (video_frame.get_row_size() >> 
+                                 self.vi.get_plane_width_subsampling(plane))
+                        height = (video_frame.get_height() >> 
+                                  self.vi.get_plane_height_subsampling(plane))
+                        pitch = video_frame.get_pitch(plane)
+                        ptr = video_frame.get_read_ptr(plane)
+                    if pitch == width:
+                        if x86_64:
+                            ptr = self._cffi2ctypes_ptr(ptr)
+                        address = ctypes.cast(ptr, ctypes.c_void_p).value
+                        buf = (ctypes.c_ubyte * (width * height)).from_address(address)
+                        buf._avs_frame = video_frame # keep the frame alive
+                    else:
+                        buf = ctypes.create_string_buffer(width * height)
+                        if x86_64:
+                            write_ptr = avisynth.ffi.cast('unsigned char *', ctypes.addressof(buf))
+                        else:
+                            write_ptr = ctypes.cast(buf, ctypes.POINTER(ctypes.c_ubyte))
+                        self.env.bit_blt(write_ptr, width, ptr, pitch, width, height)
+                    chunks.append(buf)
+                return chunks
     
     def AutocropFrame(self, frame, tol=70):
         '''Return crop values for a specific frame'''
+        if numpy is None:
+            return self._AutocropFramePixels(frame, tol)
+        frame = min(max(0, frame), self.Framecount - 1)
+        frames = self._RenderFrame(frame)
+        if frames is None:
+            return
+        return self._AutocropPlanes(self._FramePlanes(frames[0], self.vi)[:3], tol)
+    
+    def AutocropFrames(self, frames, tol=70, threads=None, callback=None):
+        '''Return a list of crop values for several frames
+        
+        The frames are analysed concurrently in a pool of 'threads' worker 
+        threads, by default one per CPU.  AviSynth still renders one frame at 
+        a time.  If given, callback(done, total) is called after each frame, 
+        and it can cancel the process by returning False.  Return None on 
+        error or when cancelled.
+        '''
+        frames = list(frames)
+        if numpy is None or len(frames) < 2:
+            threads = 1
+        elif threads is None:
+            threads = multiprocessing.cpu_count()
+        if threads <= 1:
+            results = (self.AutocropFrame(frame, tol) for frame in frames)
+            pool = None
+        else:
+            pool = ThreadPool(min(threads, len(frames)))
+            results = pool.imap(lambda frame: self.AutocropFrame(frame, tol), frames)
+        crop_values = []
+        try:
+            for i, crop_values_frame in enumerate(results):
+                if not crop_values_frame:
+                    return
+                crop_values.append(crop_values_frame)
+                if callback is not None and callback(i + 1, len(frames)) is False:
+                    return
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return crop_values
+    
+    @staticmethod
+    def _AutocropPlanes(planes, tol):
+        '''Find the borders using the planes returned by _FramePlanes
+        
+        A pixel is part of the border if all its components are within 'tol' 
+        of the top-left pixel (left and top borders) or the bottom-right one 
+        (right and bottom borders).  Subsampled planes are compared at their 
+        own resolution and their results expanded to the luma size.
+        '''
+        height, width = planes[0].shape
+        def differing_lines(reference):
+            rows = columns = None
+            for plane, value in zip(planes, reference):
+                value = int(value)
+                mask = (plane > value + tol) | (plane < value - tol)
+                plane_rows, plane_columns = mask.any(axis=1), mask.any(axis=0)
+                if len(plane_rows) != height:
+                    plane_rows = numpy.repeat(plane_rows, -(-height // len(plane_rows)))[:height]
+                if len(plane_columns) != width:
+                    plane_columns = numpy.repeat(plane_columns, 
+                                                 -(-width // len(plane_columns)))[:width]
+                rows = plane_rows if rows is None else rows | plane_rows
+                columns = plane_columns if columns is None else columns | plane_columns
+            return rows, columns
+        def first(lines):
+            return int(lines.argmax()) if lines.any() else 0
+        rows, columns = differing_lines([plane[0, 0] for plane in planes])
+        top, left = first(rows), first(columns)
+        rows, columns = differing_lines([plane[-1, -1] for plane in planes])
+        bottom, right = first(rows[::-1]), first(columns[::-1])
+        return left, top, right, bottom
+    
+    def _AutocropFramePixels(self, frame, tol=70):
+        '''AutocropFrame reading the frame pixel by pixel, used without NumPy'''
         width, height = self.Width, self.Height
         if not self._GetFrame(frame):
             return
@@ -658,21 +2867,26 @@ if os.name == 'nt':
             ("bfReserved2",    WORD),
             ("bfOffBits",   DWORD)]
                         
-    def CreateBitmapInfoHeader(clip, bmih=None):
-        vi = clip.get_video_info()
+    def CreateBitmapInfoHeader(clip, bmih=None, size=None):
+        '''size: (width, height) of a RGB24 image to use instead of the clip'''
         if bmih is None:
             bmih = BITMAPINFOHEADER()
         bmih.biSize = ctypes.sizeof(BITMAPINFOHEADER)
-        bmih.biWidth = vi.width
-        bmih.biHeight = vi.height
         bmih.biPlanes = 1
-        if vi.is_rgb32():
-            bmih.biBitCount = 32
-        elif vi.is_rgb24():
+        if size is not None:
+            bmih.biWidth, bmih.biHeight = size
             bmih.biBitCount = 24
-        else: raise AvisynthError("Input colorspace is not RGB24 or RGB32")
+        else:
+            vi = clip.get_video_info()
+            bmih.biWidth = vi.width
+            bmih.biHeight = vi.height
+            if vi.is_rgb32():
+                bmih.biBitCount = 32
+            elif vi.is_rgb24():
+                bmih.biBitCount = 24
+            else: raise AvisynthError("Input colorspace is not RGB24 or RGB32")
         bmih.biCompression = BI_RGB
-        bmih.biSizeImage=vi.width * vi.height * bmih.biBitCount / 8
+        bmih.biSizeImage = bmih.biWidth * bmih.biHeight * bmih.biBitCount / 8
         bmih.biXPelsPerMeter = 0
         bmih.biYPelsPerMeter = 0
         bmih.biClrUsed = 0
@@ -700,12 +2914,19 @@ if os.name == 'nt':
     
     class AvsClip(AvsClipBase):
         
+        drawing_format = 'dib'
+        
         def CreateDisplayClip(self, *args, **kwargs):
             if not AvsClipBase.CreateDisplayClip(self, *args, **kwargs):
                 return
             # Prepare info header for displaying
             self.bmih = BITMAPINFOHEADER()
-            CreateBitmapInfoHeader(self.display_clip, self.bmih)
+            if self.yuv2rgb is not None:
+                # Frames converted by pyavs, with DWORD-aligned rows
+                CreateBitmapInfoHeader(None, self.bmih, (self.DisplayWidth, self.DisplayHeight))
+                self.dib_pitch = (self.DisplayWidth * 3 + 3) & ~3
+            else:
+                CreateBitmapInfoHeader(self.display_clip, self.bmih)
             self.pInfo = ctypes.pointer(self.bmih)
             #~ self.BUF=ctypes.c_ubyte*self.bmih.biSizeImage
             #~ self.pBits=self.BUF()
@@ -722,6 +2943,8 @@ if os.name == 'nt':
         
         def _GetFrame(self, frame):
             if AvsClipBase._GetFrame(self, frame):
+                if self.yuv2rgb is not None:
+                    return True
                 self.bmih.biWidth = self.display_pitch * 8 / self.bmih.biBitCount
                 #~ row_size=src.GetRowSize()
                 #~ height=self.bmih.biHeight
@@ -740,9 +2963,34 @@ if os.name == 'nt':
                     h = self.DisplayHeight
                 else:
                     w, h = size 
+                start = time.time()
+                if self.cached_drawing is not None:
+                    bits, self.bmih.biWidth = self.cached_drawing[:2]
+                elif self.yuv2rgb is not None:
+                    bits = self._ConvertDisplayFrame()
+                    self._StoreDrawing(bits, self.bmih.biWidth, self.DisplayHeight, 
+                                       self.dib_pitch)
+                else:
+                    bits = self.pBits
+                    self._StoreDrawing(ctypes.cast(bits, ctypes.POINTER(ctypes.c_ubyte * 
+                                       (self.display_pitch * self.DisplayHeight))).contents, 
+                                       self.bmih.biWidth, self.DisplayHeight, self.display_pitch)
+                converted = time.time()
                 DrawDibDraw(handleDib[0], hdc, offset[0], offset[1], w, h, 
-                            self.pInfo, self.pBits, 0, 0, w, h, 0)
+                            self.pInfo, bits, 0, 0, w, h, 0)
+                if self.timings is not None:
+                    self.timings.Add(self.current_frame, 'convert', converted - start)
+                    self.timings.Add(self.current_frame, 'draw', time.time() - converted)
                 return True
+        
+        def _ConvertDisplayFrame(self):
+            '''Convert the display frame to a bottom-up BGR DIB, return its pointer'''
+            rgb = self.yuv2rgb.Convert(self._DisplayPlanes())
+            h, w = rgb.shape[:2]
+            buf = self.buffer_pool.get('draw', self.dib_pitch * h)
+            dib = numpy.frombuffer(buf, numpy.uint8).reshape(h, self.dib_pitch)
+            dib[:, :w * 3] = rgb.reshape(h, w * 3)
+            return buf
 
 
 # Use generical wxPython drawing support on other platforms
@@ -758,8 +3006,17 @@ else:
     
     
     class AvsClip(AvsClipBase):
-                
+        
+        display_bgr = False
+        drawing_format = 'rgb24'
+        bitmap = None
+        
         def _ConvertToRGB(self):
+            self.yuv2rgb = None
+            if self._UseNativeYUV2RGB():
+                self.yuv2rgb = YUV2RGBConverter(self.matrix, 
+                                                self.interlaced and self.display_vi.is_yv12())
+                return True
             # There's issues with RGB32, we convert to RGB24 
             # AviSynth uses BGR ordering but we need RGB
             try:
@@ -775,6 +3032,14 @@ else:
             except avisynth.AvisynthError, err:
                 return False
         
+        def _UseNativeYUV2RGB(self):
+            '''Check if the display clip can be converted by YUV2RGBConverter'''
+            if numpy is None or not global_vars.options.get('nativeyuv2rgb', False):
+                return False
+            self.display_vi = self.display_clip.get_video_info()
+            return ((self.display_vi.is_planar() or self.display_vi.is_yuy2()) and 
+                    self.display_vi.is_yuv() and YUV2RGBConverter.IsSupportedMatrix(self.matrix))
+        
         def DrawFrame(self, frame, dc=None, offset=(0,0), size=None):
             if not self._GetFrame(frame):
                 return
@@ -784,7 +3049,22 @@ else:
                     h = self.DisplayHeight
                 else:
                     w, h = size
-                buf = ctypes.create_string_buffer(h * w * 3)
+                start = time.time()
+                if self.cached_drawing is not None:
+                    if self.cached_drawing[1:3] == (w, h):
+                        self._DrawBitmap(dc, self._Bitmap(w, h, self.cached_drawing[0]), start)
+                        return True
+                    if not self._EnsureFrames():
+                        return
+                if self.yuv2rgb is not None:
+                    rgb = self.yuv2rgb.Convert(self._DisplayPlanes())
+                    if (h, w) != rgb.shape[:2]:
+                        rgb = numpy.ascontiguousarray(rgb[:h, :w])
+                    if size is None:
+                        self._StoreDrawing(rgb, w, h, w * 3)
+                    self._DrawBitmap(dc, self._Bitmap(w, h, rgb), start)
+                    return True
+                buf = self.buffer_pool.get('draw', h * w * 3)
                 # Use ctypes.memmove to blit the Avisynth VFB line-by-line
                 read_addr = ctypes.addressof(self.pBits.contents) + (h - 1) * self.display_pitch
                 write_addr = ctypes.addressof(buf)
@@ -795,9 +3075,32 @@ else:
                     ctypes.memmove(write_ptr, read_ptr, w * 3)
                     read_addr -= self.display_pitch
                     write_addr += w * 3
-                bmp = wx.BitmapFromBuffer(w, h, buf)
-                dc.DrawBitmap(bmp, 0, 0)
+                if size is None:
+                    self._StoreDrawing(buf, w, h, w * 3)
+                self._DrawBitmap(dc, self._Bitmap(w, h, buf), start)
                 return True
+        
+        def _DrawBitmap(self, dc, bmp, start):
+            '''Draw the frame bitmap, timing the conversion since 'start' and the drawing'''
+            converted = time.time()
+            dc.DrawBitmap(bmp, 0, 0)
+            if self.timings is not None:
+                self.timings.Add(self.current_frame, 'convert', converted - start)
+                self.timings.Add(self.current_frame, 'draw', time.time() - converted)
+        
+        def _Bitmap(self, w, h, buf):
+            '''Return a bitmap with the RGB24 data in buf
+            
+            The previous bitmap is updated in place if it has the same size 
+            and the wxPython version supports it.
+            '''
+            bmp = self.bitmap
+            if (bmp is not None and bmp.GetSize() == (w, h) and 
+                    hasattr(bmp, 'CopyFromBuffer')):
+                bmp.CopyFromBuffer(buf)
+            else:
+                bmp = self.bitmap = wx.BitmapFromBuffer(w, h, buf)
+            return bmp
 
 
 if __name__ == '__main__':
@@ -0,0 +1,260 @@
+# AvsP - an AviSynth editor
+#
+# Copyright 2007 Peter Jang <http://www.avisynth.org/qwerpoi>
+#           2010-2014 the AvsPmod authors <https://github.com/avspmod/avspmod>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA, or visit
+#  http://www.gnu.org/copyleft/gpl.html .
+
+# pyavs_export - render and write the frames of a script for exporting them
+#
+# ParallelExport renders chunks of a frame list in several worker processes,
+# each one evaluating the script in its own AviSynth environment, and returns
+# the frames in order.  pyavs is only imported by the workers, after setting
+# the AviSynth library directory, so this module can be loaded by new
+# processes on Windows.  PipeWriter writes the frames from another thread.
+#
+# Dependencies:
+#     Python (tested on v2.7)
+# Scripts:
+#     pyavs.py (AvsP AviSynth support by loading AviSynth directly as a library)
+#     global_vars.py (application info and other shared variables)
+
+import Queue
+import threading
+import multiprocessing
+
+import global_vars
+
+
+def _Worker(library_dir, source, mode, options, tasks, results):
+    '''Render the (index, frames) chunks in 'tasks' until None is received
+
+    A (index, data list, error message) tuple is put in 'results' for each
+    chunk.  The data list holds the frames rendered before the error, if any.
+    If the script can't be evaluated the index is None.
+    '''
+    global_vars.avisynth_library_dir = library_dir
+    import pyavs
+    text, filename, workdir = source
+    clip = pyavs.AvsClip(text, filename, workdir, display_clip=False, frame_cache_size=0,
+                         reorder_rgb=options['reorder_rgb'], interlaced=options['interlaced'])
+    if not clip.initialized or clip.IsErrorClip():
+        results.put((None, None, clip.error_message or 'Error loading the script'))
+        return
+    if mode in ('rgb', 'luma'):
+        try:
+            clip = pyavs.ReducedClip(clip, *(options['size'] or (None, None)),
+                                     rgb=mode == 'rgb', matrix=options['matrix'],
+                                     interlaced=options['interlaced'])
+        except pyavs.avisynth.AvisynthError, err:
+            results.put((None, None, str(err)))
+            return
+    luma_size = clip.Width * clip.Height if mode == 'luma' else None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        index, frames = task
+        data = []
+        error = None
+        for frame in frames:
+            buf = clip.RawFrame(frame, options['y4m_header'], reuse=True,
+                                bit_depth=options['bit_depth'])
+            if buf is None:
+                error = clip.clip.get_error() or 'Error requesting frame {0}'.format(frame)
+                break
+            data.append(buf.raw if luma_size is None else buf[:luma_size])
+        results.put((index, data, error))
+
+
+class ParallelExport(object):
+    '''Render a list of frames in several processes and iterate them in order
+
+    The frame list is split in chunks of up to 'chunk_size' frames, which are
+    handed out to 'workers' processes (one per CPU by default).  No more than
+    about 'buffer_frames' frames are rendered ahead of the one being consumed,
+    so a slow consumer doesn't make the rendered frames pile up in memory.
+
+    mode 'raw' yields the same data as AvsClip.RawFrame, with the 'y4m_header'
+    and 'bit_depth' arguments.  mode 'rgb' yields top-down RGB24 frames,
+    converted with the given matrix if the clip is YUV.  mode 'luma' yields
+    the luma plane of the frames.  With these two modes the frames are
+    resized to 'size' (width, height), if given, which must be mod 4.  See
+    pyavs.ReducedClip.
+
+    Iterating yields (frame, data) tuples.  On error the iteration stops and
+    error_message and error_frame are set.
+    '''
+
+    def __init__(self, text, filename='', workdir='', frames=None, workers=None,
+                 chunk_size=8, buffer_frames=64, mode='raw', y4m_header=False,
+                 bit_depth=None, reorder_rgb=False, matrix='Rec601', interlaced=False,
+                 size=None):
+        self.frames = list(frames)
+        if not workers or workers < 1:
+            workers = multiprocessing.cpu_count()
+        self.chunk_size = max(1, min(chunk_size, buffer_frames // workers))
+        self.chunks = [self.frames[i:i+self.chunk_size] for i in
+                       range(0, len(self.frames), self.chunk_size)]
+        self.workers = max(1, min(workers, len(self.chunks)))
+        self.max_chunks = max(self.workers, buffer_frames // self.chunk_size)
+        self.error_message = None
+        self.error_frame = None
+        self.buffered = 0 # peak number of chunks waiting to be consumed
+        options = dict(y4m_header=y4m_header, bit_depth=bit_depth, reorder_rgb=reorder_rgb,
+                       matrix=matrix, interlaced=interlaced, size=size)
+        self._tasks = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        self._dispatched = 0
+        self._stopped = threading.Event()
+        self._processes = []
+        for i in range(self.workers):
+            process = multiprocessing.Process(target=_Worker, name='ExportWorker-{0}'.format(i),
+                args=(global_vars.avisynth_library_dir, (text, filename, workdir), mode,
+                      options, self._tasks, self._results))
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+
+    def __iter__(self):
+        completed = {}
+        output = 0
+        try:
+            while output < len(self.chunks) and not self._stopped.is_set():
+                while (self._dispatched < len(self.chunks) and
+                       self._dispatched < output + self.max_chunks):
+                    self._tasks.put((self._dispatched, self.chunks[self._dispatched]))
+                    self._dispatched += 1
+                while output not in completed:
+                    index, data, error = self._GetResult()
+                    if index is None:
+                        self.error_message = error
+                        return
+                    completed[index] = data, error
+                    self.buffered = max(self.buffered, len(completed))
+                data, error = completed.pop(output)
+                for frame, frame_data in zip(self.chunks[output], data):
+                    yield frame, frame_data
+                if error:
+                    self.error_message = error
+                    self.error_frame = self.chunks[output][len(data)]
+                    return
+                output += 1
+        finally:
+            self.Stop()
+
+    def _GetResult(self):
+        '''Return the next (index, data, error) result, or an index of None if
+        a worker died or the export was stopped, with error None in that case'''
+        while not self._stopped.is_set():
+            try:
+                return self._results.get(timeout=0.5)
+            except Queue.Empty:
+                for process in self._processes:
+                    if not process.is_alive() and not self._stopped.is_set():
+                        return None, None, 'Export worker exited unexpectedly (code {0})'.format(
+                                process.exitcode)
+        return None, None, None
+
+    def Stop(self):
+        '''Stop the worker processes, and the iteration if called from another thread'''
+        self._stopped.set()
+        self._tasks.cancel_join_thread()
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join()
+
+    def stats(self):
+        return dict(workers=self.workers, chunk_size=self.chunk_size,
+                    chunks=len(self.chunks), max_chunks=self.max_chunks,
+                    buffered=self.buffered)
+
+
+class PipeWriter(object):
+    '''Write frames to a file object from a worker thread
+
+    Write(chunks) queues a list of buffers and returns at once, unless there
+    are already 'depth' frames waiting, so rendering the next frame overlaps
+    with writing the previous ones.  Errors raised by the writing thread, like
+    a broken pipe, are raised again by the next call to Write or Close.
+    '''
+
+    def __init__(self, stream, depth=4):
+        self.stream = stream
+        self.frames = 0
+        self.bytes = 0
+        self.blocked = 0 # times Write had to wait for the writing thread
+        self.starved = 0 # times the writing thread had to wait for a frame
+        self._queue = Queue.Queue(max(1, depth))
+        self._error = None
+        self._thread = threading.Thread(target=self._Run, name='PipeWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _Run(self):
+        while True:
+            try:
+                chunks = self._queue.get_nowait()
+            except Queue.Empty:
+                self.starved += 1
+                chunks = self._queue.get()
+            if chunks is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                for chunk in chunks:
+                    self.stream.write(chunk)
+                    self.bytes += len(buffer(chunk))
+                self.frames += 1
+            except Exception, err:
+                self._error = err
+
+    def Write(self, chunks):
+        '''Queue a list of buffers to be written as a single frame'''
+        if self._error is not None:
+            raise self._error
+        try:
+            self._queue.put_nowait(chunks)
+        except Queue.Full:
+            self.blocked += 1
+            self._queue.put(chunks)
+
+    def Close(self):
+        '''Wait until everything is written, without closing the stream'''
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def Stop(self):
+        '''Discard the queued frames and stop the writing thread'''
+        if self._error is None:
+            self._error = IOError('Writing cancelled')
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Queue.Empty:
+                break
+        if self._thread.is_alive():
+            self._queue.put(None)
+
+    def stats(self):
+        return dict(frames=self.frames, bytes=self.bytes, blocked=self.blocked,
+                    starved=self.starved)
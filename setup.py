@@ -125,6 +125,7 @@ data_files = [
             'avisynth_cffi.py',
             'pyavs.py',
             'pyavs_avifile.py',
+            'pyavs_export.py',
             'build.py',
             'setup.py',
             'i18n.py',